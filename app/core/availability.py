@@ -0,0 +1,153 @@
+import bisect
+import threading
+import time
+from collections import deque
+from datetime import timezone
+from app.core.config import settings
+
+RESERVA = "reserva"
+MANTENIMIENTO = "mantenimiento"
+
+def _naive(value):
+    # La base de datos guarda DATETIME2 sin zona; las fechas con zona se pasan a UTC
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class _BayIntervals:
+    """Intervalos [inicio, fin) de una bahía ordenados por inicio"""
+
+    __slots__ = ("starts", "entries", "max_len")
+
+    def __init__(self):
+        self.starts = []
+        self.entries = []   # (inicio, fin, ref_id, tipo), paralelo a starts
+        self.max_len = None  # duración más larga vista; acota el barrido hacia atrás
+
+    def add(self, entry):
+        inicio, fin = entry[0], entry[1]
+        i = bisect.bisect_right(self.starts, inicio)
+        self.starts.insert(i, inicio)
+        self.entries.insert(i, entry)
+        length = fin - inicio
+        if self.max_len is None or length > self.max_len:
+            self.max_len = length
+
+    def remove(self, ref_id, inicio):
+        i = bisect.bisect_left(self.starts, inicio)
+        while i < len(self.starts) and self.starts[i] == inicio:
+            if self.entries[i][2] == ref_id:
+                del self.starts[i]
+                del self.entries[i]
+                return True
+            i += 1
+        return False
+
+    def overlapping(self, inicio, fin):
+        """
+        Intervalos que se solapan con [inicio, fin).
+
+        Un intervalo [s, e) se solapa si s < fin y e > inicio; como ninguno
+        dura más que max_len, basta con mirar los que empiezan en
+        (inicio - max_len, fin): dos búsquedas binarias y un barrido corto.
+        """
+        if not self.entries:
+            return []
+        lo = bisect.bisect_right(self.starts, inicio - self.max_len)
+        hi = bisect.bisect_left(self.starts, fin)
+        return [entry for entry in self.entries[lo:hi] if entry[1] > inicio]
+
+class AvailabilityIndex:
+    """
+    Índice en memoria, por bahía, de las reservas y mantenimientos que este
+    worker acaba de confirmar.
+
+    crear_reserva y crear_mantenimiento lo consultan antes de ir a la base
+    de datos: si el hueco pedido se solapa con un intervalo del índice se
+    rechaza sin ningún viaje (dos búsquedas binarias). Solo guarda escrituras
+    propias ya confirmadas, y las cancelaciones y cierres de este worker las
+    quitan al momento; lo único que no ve es que otro worker cancele una de
+    ellas, por eso cada intervalo solo vale durante ttl segundos y luego se
+    olvida. Si el índice no encuentra nada decide, como siempre, la guarda
+    NOT EXISTS dentro de la transacción. Con ttl <= 0 el índice no guarda nada.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._bays = {}
+        self._refs = {}  # ref_id -> (bahia_id, inicio, caducidad)
+        self._expiry = deque()  # (caducidad, ref_id) en orden de alta
+        self.rejections = 0
+
+    def add(self, bahia_id, ref_id, inicio, fin, tipo):
+        if self.ttl <= 0:
+            return
+        inicio, fin = _naive(inicio), _naive(fin)
+        now = time.monotonic()
+        with self._lock:
+            self._expire_locked(now)
+            self._remove_locked(ref_id)
+            bay = self._bays.get(bahia_id)
+            if bay is None:
+                bay = self._bays[bahia_id] = _BayIntervals()
+            bay.add((inicio, fin, ref_id, tipo))
+            self._refs[ref_id] = (bahia_id, inicio, now + self.ttl)
+            self._expiry.append((now + self.ttl, ref_id))
+
+    def remove(self, ref_id):
+        with self._lock:
+            return self._remove_locked(ref_id)
+
+    def conflicts(self, bahia_id, inicio, fin, tipos=None):
+        """Intervalos vigentes de la bahía que se solapan con [inicio, fin)"""
+        inicio, fin = _naive(inicio), _naive(fin)
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            bay = self._bays.get(bahia_id)
+            if bay is None:
+                return []
+            found = bay.overlapping(inicio, fin)
+            if tipos is not None:
+                found = [entry for entry in found if entry[3] in tipos]
+            if found:
+                self.rejections += 1
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._bays.clear()
+            self._refs.clear()
+            self._expiry.clear()
+
+    def stats(self):
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            return {
+                "bahias": len(self._bays),
+                "intervalos": len(self._refs),
+                "ttl_s": self.ttl,
+                "rechazos": self.rejections,
+            }
+
+    def _expire_locked(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            caducidad, ref_id = self._expiry.popleft()
+            ref = self._refs.get(ref_id)
+            if ref is not None and ref[2] == caducidad:
+                self._remove_locked(ref_id)
+
+    def _remove_locked(self, ref_id):
+        ref = self._refs.pop(ref_id, None)
+        if ref is None:
+            return False
+        bahia_id, inicio, _ = ref
+        bay = self._bays.get(bahia_id)
+        if bay is None:
+            return False
+        removed = bay.remove(ref_id, inicio)
+        if not bay.entries:
+            del self._bays[bahia_id]
+        return removed
+
+availability_index = AvailabilityIndex(ttl=settings.AVAILABILITY_INDEX_TTL)
@@ -0,0 +1,75 @@
+"""
+Backends de almacenamiento detrás de app.database.
+
+Database no abre conexiones por su cuenta: se las pide al backend elegido
+con DB_BACKEND. Todos devuelven conexiones con la parte de la API de
+pymssql que usan los routers (cursor(as_dict=...), execute con %s,
+fetchone/fetchall/fetchmany, nextset, rowcount, commit, rollback, close),
+así que el pool, get_db y las rutas no cambian de un backend a otro.
+
+- mssql:  SQL Server con pymssql (producción).
+- sqlite: sustituto local para pruebas de carga y benchmarks sin servidor
+          (app.core.sqlite_backend), con latencia inyectada configurable.
+"""
+import pymssql
+from app.core.config import settings
+
+class Backend:
+    name = None
+
+    def connect(self):
+        """Nueva conexión DB-API; la llama el pool (fábrica sin argumentos)"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.name}
+
+    def close(self):
+        """Libera lo que el backend creó (se llama al apagar la aplicación)"""
+        pass
+
+class MSSQLBackend(Backend):
+    name = "mssql"
+
+    def __init__(self, server, user, password, database, port):
+        self.server = server
+        self.user = user
+        self.password = password
+        self.database = database
+        self.port = port
+
+    def connect(self):
+        return pymssql.connect(
+            server=self.server,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            port=self.port,
+            login_timeout=10,
+            charset='UTF-8'
+        )
+
+    def stats(self):
+        return {"backend": self.name, "servidor": self.server, "base_datos": self.database}
+
+def create_backend(name=None):
+    """Backend configurado en DB_BACKEND ("mssql" o "sqlite")"""
+    name = (name or settings.DB_BACKEND).lower()
+    if name == "mssql":
+        return MSSQLBackend(
+            settings.DB_SERVER, settings.DB_USER, settings.DB_PASSWORD,
+            settings.DB_NAME, settings.DB_PORT
+        )
+    if name == "sqlite":
+        # Import diferido: el sustituto solo se carga si se pide
+        from app.core.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(
+            path=settings.SQLITE_PATH or None,
+            latency=settings.DB_FAKE_LATENCY_MS / 1000,
+            jitter=settings.DB_FAKE_JITTER_MS / 1000,
+            seed=settings.DB_FAKE_SEED,
+            bahias=settings.SQLITE_SEED_BAHIAS,
+            admin_email=settings.SQLITE_ADMIN_EMAIL,
+            admin_password=settings.SQLITE_ADMIN_PASSWORD or None,
+        )
+    raise ValueError(f"DB_BACKEND desconocido: {name!r} (se esperaba 'mssql' o 'sqlite')")
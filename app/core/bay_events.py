@@ -0,0 +1,189 @@
+import asyncio
+import json
+from app.core.catalogs import CatalogUnavailable, estados_bahia
+from app.core.config import settings
+from app.database import db, run_in_db_executor, timed_execute
+
+class Subscription:
+    """Cola acotada de un cliente; se cierra si el cliente no da abasto"""
+
+    def __init__(self, hub, maxsize):
+        self.hub = hub
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    async def next(self, timeout=None):
+        """Siguiente evento, None si vence el timeout; LookupError si se descartó"""
+        if self.dropped and self.queue.empty():
+            raise LookupError("Suscripción descartada por no consumir a tiempo")
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is None:
+            raise LookupError("Suscripción descartada por no consumir a tiempo")
+        return event
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class BroadcastHub:
+    """
+    Reparto en proceso de eventos a muchos suscriptores.
+
+    publish() nunca espera: si la cola de un suscriptor está llena se le
+    descarta (el cliente se reconecta y recibe un snapshot nuevo) en lugar
+    de acumular memoria o frenar a quien publica.
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        sub = Subscription(self, self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+
+    def publish(self, event):
+        self.published += 1
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(sub)
+
+    def _drop(self, sub):
+        self.dropped += 1
+        sub.dropped = True
+        self._subscribers.discard(sub)
+        # Hueco para la marca de fin, para que el consumidor se entere aunque esté dormido
+        try:
+            sub.queue.get_nowait()
+            sub.queue.put_nowait(None)
+        except (asyncio.QueueEmpty, asyncio.QueueFull):
+            pass
+
+    def stats(self):
+        return {
+            "suscriptores": len(self._subscribers),
+            "publicados": self.published,
+            "descartados": self.dropped,
+        }
+
+def _load_bays(conn):
+    cursor = conn.cursor()
+    try:
+        timed_execute(cursor, "SELECT id, numero, estado_bahia_id FROM bahias WHERE activo = 1", name="estado_bahias")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+async def _codigo(estado_id):
+    # Se publica después del commit: sin catálogo cargado el evento sale sin código
+    if estado_id is None:
+        return None
+    try:
+        return await estados_bahia.codigo(estado_id)
+    except CatalogUnavailable:
+        return None
+
+class BayStateFeed:
+    """
+    Estado conocido de cada bahía y flujo de cambios para /api/bahias/stream.
+
+    Los endpoints que cambian estado_bahia_id llaman a apply() después del
+    commit. Además reconcile() relee la tabla cada pocos segundos (una sola
+    consulta, sin importar cuántos clientes haya) para recoger los cambios
+    hechos por otros workers o directamente en la base de datos.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._bays = {}   # bahia_id -> (numero, estado_bahia_id)
+        self.ready = False
+        self._loading = None
+
+    async def _event(self, bahia_id, numero, anterior_id, nuevo_id):
+        return {
+            "tipo": "cambio",
+            "bahia_id": bahia_id,
+            "numero": numero,
+            "estado_bahia_id": nuevo_id,
+            "estado_nuevo": await _codigo(nuevo_id),
+            "estado_anterior": await _codigo(anterior_id),
+        }
+
+    async def apply(self, bahia_id, numero, estado_bahia_id):
+        """Registra el estado actual de una bahía y publica el cambio si lo hay"""
+        anterior = self._bays.get(bahia_id)
+        if anterior is not None and anterior[1] == estado_bahia_id:
+            return
+        self._bays[bahia_id] = (numero, estado_bahia_id)
+        anterior_id = anterior[1] if anterior else None
+        self.hub.publish(await self._event(bahia_id, numero, anterior_id, estado_bahia_id))
+
+    async def remove(self, bahia_id):
+        anterior = self._bays.pop(bahia_id, None)
+        if anterior is not None:
+            self.hub.publish(await self._event(bahia_id, anterior[0], anterior[1], None))
+
+    async def reconcile(self):
+        async with db.connection() as conn:
+            rows = await run_in_db_executor(_load_bays, conn)
+        if not self.ready:
+            self._bays = {bahia_id: (numero, estado) for bahia_id, numero, estado in rows}
+            self.ready = True
+            return len(rows)
+        vistos = set()
+        for bahia_id, numero, estado in rows:
+            vistos.add(bahia_id)
+            await self.apply(bahia_id, numero, estado)
+        for bahia_id in set(self._bays) - vistos:
+            await self.remove(bahia_id)
+        return len(rows)
+
+    async def ensure_ready(self):
+        if not self.ready:
+            if self._loading is None or self._loading.done():
+                self._loading = asyncio.ensure_future(self.reconcile())
+            await asyncio.shield(self._loading)
+
+    async def snapshot(self):
+        bahias = []
+        for bahia_id, (numero, estado) in sorted(self._bays.items(), key=lambda item: item[1][0]):
+            bahias.append({
+                "bahia_id": bahia_id,
+                "numero": numero,
+                "estado_bahia_id": estado,
+                "estado": await _codigo(estado),
+            })
+        return {"tipo": "snapshot", "bahias": bahias}
+
+    def stats(self):
+        return {"bahias": len(self._bays), "listo": self.ready, **self.hub.stats()}
+
+    async def run(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"⚠️ No se pudo reconciliar el estado de las bahías: {e}")
+
+def sse_message(event):
+    """Formato text/event-stream: el nombre del evento es su tipo"""
+    return f"event: {event['tipo']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+async def publish_transition(bahia_id, cambio):
+    """Publica el resultado de bay_state.transition() (None = no hubo cambio)"""
+    if cambio is not None:
+        await bay_feed.apply(bahia_id, cambio["numero"], cambio["estado_nuevo_id"])
+
+bay_hub = BroadcastHub(queue_size=settings.BAY_STREAM_QUEUE_SIZE)
+bay_feed = BayStateFeed(bay_hub)
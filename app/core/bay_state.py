@@ -0,0 +1,84 @@
+from fastapi import HTTPException
+from app.core.catalogs import estados_bahia
+
+LIBRE = "libre"
+RESERVADA = "reservada"
+EN_USO = "en_uso"
+MANTENIMIENTO = "mantenimiento"
+
+# evento -> (estados de origen permitidos, estado destino)
+TRANSICIONES = {
+    "reservar": ((LIBRE, RESERVADA), RESERVADA),
+    "iniciar_uso": ((RESERVADA,), EN_USO),
+    "liberar": ((RESERVADA, EN_USO), LIBRE),
+    "iniciar_mantenimiento": ((LIBRE, RESERVADA, MANTENIMIENTO), MANTENIMIENTO),
+    "finalizar_mantenimiento": ((MANTENIMIENTO,), LIBRE),
+}
+
+def _transition_sql(origenes):
+    # bahias tiene un trigger AFTER UPDATE, así que el OUTPUT tiene que ir a una
+    # tabla variable; el lote sigue siendo un único viaje al servidor
+    return f"""
+        SET NOCOUNT ON;
+        DECLARE @cambio TABLE (numero INT, estado_anterior_id INT, estado_nuevo_id INT);
+        UPDATE bahias
+        SET estado_bahia_id = %s,
+            fecha_ultima_modificacion = GETDATE()
+        OUTPUT inserted.numero, deleted.estado_bahia_id, inserted.estado_bahia_id INTO @cambio
+        WHERE id = %s AND activo = 1
+        AND estado_bahia_id IN ({", ".join(["%s"] * len(origenes))});
+        SELECT numero, estado_anterior_id, estado_nuevo_id FROM @cambio;
+    """
+
+_SQL = {evento: _transition_sql(origenes) for evento, (origenes, _) in TRANSICIONES.items()}
+
+async def transition_ids(evento):
+    """Ids de los estados de origen y destino de un evento"""
+    origenes, destino = TRANSICIONES[evento]
+    return [await estados_bahia.id(codigo) for codigo in origenes], await estados_bahia.id(destino)
+
+async def transition(cursor, bahia_id, evento, estricta=True):
+    """
+    Aplica una transición de estado a una bahía en una sola sentencia.
+
+    El UPDATE solo afecta a la fila si su estado actual es uno de los
+    orígenes permitidos, así que dos operaciones concurrentes sobre la misma
+    bahía no pueden pisarse: la que llega tarde no encuentra la fila. En modo
+    estricto eso se traduce en 404 (bahía inexistente o inactiva) o 409 (la
+    bahía está en otro estado); en modo no estricto se devuelve None y el
+    llamador sigue, para cambios de estado que son consecuencia de otra
+    operación (cancelar una reserva no debe fallar porque la bahía esté en
+    mantenimiento).
+
+    No hace commit: la transición forma parte de la transacción del llamador.
+    Devuelve un dict con numero, estado_anterior y estado_nuevo (códigos) y
+    estado_nuevo_id.
+    """
+    origenes, destino = await transition_ids(evento)
+    await cursor.execute(_SQL[evento], (destino, bahia_id, *origenes), name=f"transicion:{evento}")
+    cambio = await cursor.fetchone()
+    if cambio is not None:
+        if not isinstance(cambio, dict):
+            cambio = dict(zip(("numero", "estado_anterior_id", "estado_nuevo_id"), cambio))
+        return {
+            "numero": cambio["numero"],
+            "estado_anterior": await estados_bahia.codigo(cambio["estado_anterior_id"]),
+            "estado_nuevo": await estados_bahia.codigo(cambio["estado_nuevo_id"]),
+            "estado_nuevo_id": cambio["estado_nuevo_id"],
+        }
+    if not estricta:
+        return None
+
+    # Camino frío: averiguar por qué no se aplicó
+    await cursor.execute("SELECT estado_bahia_id FROM bahias WHERE id = %s AND activo = 1", (bahia_id,))
+    actual = await cursor.fetchone()
+    if actual is None:
+        raise HTTPException(status_code=404, detail="Bahía no encontrada")
+    if not isinstance(actual, dict):
+        actual = {"estado_bahia_id": actual[0]}
+    codigo = await estados_bahia.codigo(actual["estado_bahia_id"])
+    raise HTTPException(
+        status_code=409,
+        detail=f"No se puede aplicar '{evento}' a la bahía en estado '{codigo}' "
+               f"(se esperaba {' o '.join(TRANSICIONES[evento][0])})"
+    )
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import time
+from fastapi import HTTPException, Request, Response
+from app.core.config import settings
+from app.core.responses import dumps, etag_matches
+from app.database import db, run_in_db_executor, timed_execute
+
+class Catalog:
+    """Filas de una tabla semilla ya serializadas, con su ETag fuerte"""
+
+    __slots__ = ("rows", "body", "etag", "loaded_at", "ids", "codes", "names")
+
+    def __init__(self, rows):
+        self.rows = rows
+        # Mapa bidireccional codigo <-> id (solo catálogos con columna codigo)
+        self.ids = {row["codigo"]: row["id"] for row in rows if "codigo" in row}
+        self.codes = {id_: codigo for codigo, id_ in self.ids.items()}
+        self.names = {row["id"]: row["nombre"] for row in rows if "nombre" in row}
+        # Mismo formato que la respuesta por defecto de la aplicación
+        self.body = dumps(rows)
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.loaded_at = time.monotonic()
+
+class CatalogUnavailable(HTTPException):
+    """El catálogo aún no está cargado y no se puede cargar sin esperar al pool"""
+
+    def __init__(self, name):
+        super().__init__(status_code=503, detail=f"Catálogo {name} no disponible todavía, reintente")
+
+class CatalogCache:
+    """
+    Caché en proceso de catálogos (tipos_bahia, estados_bahia...).
+
+    Se carga al arrancar y se recarga cuando vence el TTL o cuando alguien
+    llama a invalidate(). Las respuestas se sirven desde el cuerpo ya
+    serializado, así que las lecturas no tocan ni la base de datos ni el
+    encoder JSON.
+
+    Un catálogo caducado se sigue sirviendo mientras una tarea lo recarga en
+    segundo plano: quien consulta suele tener ya una conexión del pool y
+    pedir otra desde dentro de la petición podría dejarlo esperando al pool.
+    Por lo mismo, si el catálogo nunca se ha cargado (falló la carga al
+    arrancar) get() programa la carga y responde 503 en vez de esperarla;
+    solo espera quien lo pide con wait=True porque no tiene conexión.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._queries = {}
+        self._catalogs = {}
+        self._refreshing = {}
+        self.hits = 0
+        self.loads = 0
+
+    def register(self, name, query):
+        self._queries[name] = query
+
+    def _fetch(self, conn, name):
+        cursor = conn.cursor()
+        try:
+            timed_execute(cursor, self._queries[name], name=f"catalogo:{name}")
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def load_all(self, conn):
+        """Carga síncrona de todos los catálogos (se ejecuta en db_executor)"""
+        for name in self._queries:
+            self._catalogs[name] = Catalog(self._fetch(conn, name))
+            self.loads += 1
+        return len(self._catalogs)
+
+    def _fresh(self, catalog):
+        if catalog.loaded_at is None:
+            return False
+        return self.ttl <= 0 or time.monotonic() - catalog.loaded_at < self.ttl
+
+    async def _load(self, name):
+        async with db.connection() as conn:
+            rows = await run_in_db_executor(self._fetch, conn, name)
+        catalog = self._catalogs[name] = Catalog(rows)
+        self.loads += 1
+        return catalog
+
+    def _refresh(self, name):
+        # Una sola recarga en vuelo por catálogo
+        task = self._refreshing.get(name)
+        if task is None or task.done():
+            task = self._refreshing[name] = asyncio.create_task(self._load(name))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def get(self, name, wait=False):
+        catalog = self._catalogs.get(name)
+        if catalog is None:
+            task = self._refresh(name)
+            if not wait:
+                raise CatalogUnavailable(name)
+            return await asyncio.shield(task)
+        if not self._fresh(catalog):
+            self._refresh(name)
+        self.hits += 1
+        return catalog
+
+    async def reload(self):
+        """Recarga inmediata de todos los catálogos (fuera de una petición con conexión)"""
+        for name in self._queries:
+            await self._load(name)
+        return len(self._catalogs)
+
+    def invalidate(self, name=None):
+        """Marca los catálogos como caducados; la próxima consulta dispara la recarga"""
+        for key in ([name] if name else list(self._catalogs)):
+            if key in self._catalogs:
+                self._catalogs[key].loaded_at = None
+
+    def stats(self):
+        return {
+            "catalogos": sorted(self._catalogs),
+            "hits": self.hits,
+            "cargas": self.loads,
+            "ttl_s": self.ttl,
+        }
+
+catalog_cache = CatalogCache(ttl=settings.CATALOG_CACHE_TTL)
+
+class CodeRegistry:
+    """
+    Traducción codigo <-> id de un catálogo de la caché.
+
+    Sustituye a las subconsultas (SELECT id FROM estados_bahia WHERE codigo = ...)
+    y a los ids escritos a mano: los routers piden el id por código y lo pasan
+    como parámetro. Si un código o id no aparece se programa una recarga del
+    catálogo, por si cambió después de cargarse, como mucho una cada
+    CATALOG_MISS_RELOAD_INTERVAL segundos: los ids inválidos que mandan los
+    clientes no pueden forzar una recarga por petición.
+    """
+
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+        self._last_miss = None
+
+    async def _lookup(self, attr, key):
+        catalog = await self.cache.get(self.name)
+        value = getattr(catalog, attr).get(key)
+        if value is None:
+            now = time.monotonic()
+            if self._last_miss is None or now - self._last_miss >= settings.CATALOG_MISS_RELOAD_INTERVAL:
+                self._last_miss = now
+                self.cache.invalidate(self.name)
+        return value
+
+    async def id(self, codigo):
+        value = await self._lookup("ids", codigo)
+        if value is None:
+            raise LookupError(f"Código '{codigo}' no existe en {self.name}")
+        return value
+
+    async def codigo(self, id_):
+        return await self._lookup("codes", id_)
+
+    async def nombre(self, id_):
+        return await self._lookup("names", id_)
+
+    async def exists(self, id_):
+        return await self.codigo(id_) is not None
+
+catalog_cache.register("tipos_bahia", "SELECT id, codigo, nombre, descripcion FROM tipos_bahia WHERE activo = 1")
+catalog_cache.register("estados_bahia", "SELECT id, codigo, nombre, descripcion, color FROM estados_bahia WHERE activo = 1")
+
+tipos_bahia = CodeRegistry(catalog_cache, "tipos_bahia")
+estados_bahia = CodeRegistry(catalog_cache, "estados_bahia")
+
+async def catalog_response(request: Request, name):
+    """200 con el JSON cacheado, o 304 si el cliente ya tiene esa versión"""
+    # Estas rutas no tienen conexión del pool: pueden esperar la carga
+    catalog = await catalog_cache.get(name, wait=True)
+    headers = {"ETag": catalog.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), catalog.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
@@ -10,11 +10,86 @@ class Settings:
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "beilkyl7u5")
     DB_NAME: str = os.getenv("DB_NAME", "test_QA")
     DB_PORT: int = int(os.getenv("DB_PORT", "1433"))
+
+    # Pool de conexiones
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # segundos esperando una conexión libre
+    DB_POOL_MAX_IDLE: float = float(os.getenv("DB_POOL_MAX_IDLE", "300"))  # segundos antes de cerrar una conexión ociosa
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+    DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_MAX_SIZE", "10")))  # hilos para llamadas bloqueantes del driver
+
+    # Backend de almacenamiento: "mssql" (SQL Server) o "sqlite" (sustituto local para carga y benchmarks)
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "mssql")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "")  # vacío = fichero temporal nuevo por proceso
+    SQLITE_SEED_BAHIAS: int = int(os.getenv("SQLITE_SEED_BAHIAS", "50"))
+    SQLITE_ADMIN_EMAIL: str = os.getenv("SQLITE_ADMIN_EMAIL", "admin@example.com")
+    SQLITE_ADMIN_PASSWORD: str = os.getenv("SQLITE_ADMIN_PASSWORD", "")  # vacío = aleatoria, se imprime al sembrar
+    DB_FAKE_LATENCY_MS: float = float(os.getenv("DB_FAKE_LATENCY_MS", "0"))  # por viaje (execute, commit, rollback)
+    DB_FAKE_JITTER_MS: float = float(os.getenv("DB_FAKE_JITTER_MS", "0"))
+    DB_FAKE_SEED: int = int(os.getenv("DB_FAKE_SEED", "42"))
     
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", "clave_secreta_por_defecto_cambiar_en_produccion")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 horas
+
+    # Hash de contraseñas (bcrypt en pool de procesos; 0 = threadpool del loop)
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+    PASSWORD_HASH_MAX_CONCURRENCY: int = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", "0"))  # 0 = igual a los workers
+
+    # Índice de disponibilidad en memoria (escrituras propias recientes, rechazo rápido de solapes)
+    AVAILABILITY_INDEX_TTL: float = float(os.getenv("AVAILABILITY_INDEX_TTL", "60"))  # segundos que se confía en una escritura propia; 0 = sin índice
+
+    # Caché de roles (tipo_usuario por id)
+    ROLE_CACHE_SIZE: int = int(os.getenv("ROLE_CACHE_SIZE", "1024"))
+    ROLE_CACHE_TTL: float = float(os.getenv("ROLE_CACHE_TTL", "300"))  # segundos
+    ROLE_TRUST_TOKEN_CLAIM: bool = os.getenv("ROLE_TRUST_TOKEN_CLAIM", "True").lower() == "true"
+
+    # Caché de catálogos (tipos y estados de bahía); 0 = sin caducidad
+    CATALOG_CACHE_TTL: float = float(os.getenv("CATALOG_CACHE_TTL", "3600"))
+    CATALOG_MISS_RELOAD_INTERVAL: float = float(os.getenv("CATALOG_MISS_RELOAD_INTERVAL", "30"))  # mínimo entre recargas por código/id desconocido
+
+    # Caché de reportes diarios: los días cerrados no caducan; hoy y los días con reservas pendientes sí
+    REPORT_CACHE_OPEN_DAY_TTL: float = float(os.getenv("REPORT_CACHE_OPEN_DAY_TTL", "60"))  # segundos
+    REPORT_CACHE_MAX_DAYS: int = int(os.getenv("REPORT_CACHE_MAX_DAYS", "3660"))
+    REPORT_MAX_RANGE_DAYS: int = int(os.getenv("REPORT_MAX_RANGE_DAYS", "366"))  # días como máximo en /uso/rango
+
+    # Indicadores del tablero (segundos entre recálculos en segundo plano)
+    DASHBOARD_REFRESH_INTERVAL: float = float(os.getenv("DASHBOARD_REFRESH_INTERVAL", "5"))
+
+    # Listados calientes guardados ya serializados (segundos; 0 = sin caché)
+    LIST_CACHE_TTL: float = float(os.getenv("LIST_CACHE_TTL", "10"))
+
+    # Métricas Prometheus en /metrics
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+
+    # Desglose Server-Timing bajo demanda (cabecera X-Server-Timing: <token>)
+    SERVER_TIMING_TOKEN: str = os.getenv("SERVER_TIMING_TOKEN", "")
+
+    # Viajes a la base de datos por petición (cabeceras X-DB-Round-Trips / X-DB-Time)
+    DB_ROUNDTRIP_HEADERS: bool = os.getenv("DB_ROUNDTRIP_HEADERS", "True").lower() == "true"
+    DB_ROUNDTRIP_BUDGET: int = int(os.getenv("DB_ROUNDTRIP_BUDGET", "8"))  # 0 = sin límite
+    DB_ROUNDTRIP_BUDGETS: str = os.getenv("DB_ROUNDTRIP_BUDGETS", "")  # "POST /api/reservas/=2, GET /api/bahias/=1"
+    DB_ROUNDTRIP_STRICT: bool = os.getenv("DB_ROUNDTRIP_STRICT", "False").lower() == "true"  # fallar en vez de avisar
+    DB_ROUNDTRIP_LOG: bool = os.getenv("DB_ROUNDTRIP_LOG", "False").lower() == "true"
+    DB_N_PLUS_ONE_THRESHOLD: int = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "5"))
+
+    # Registro de consultas lentas (GET /api/reportes/consultas-lentas)
+    SLOW_QUERY_THRESHOLD_MS: float = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500"))  # < 0 = desactivado
+    SLOW_QUERY_BUFFER_SIZE: int = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "500"))
+    SLOW_QUERY_FILE: str = os.getenv("SLOW_QUERY_FILE", "")  # vacío = solo en memoria
+    SLOW_QUERY_FILE_MAX_BYTES: int = int(os.getenv("SLOW_QUERY_FILE_MAX_BYTES", "10000000"))
+    SLOW_QUERY_FILE_BACKUPS: int = int(os.getenv("SLOW_QUERY_FILE_BACKUPS", "5"))
+
+    # Stream de estado de bahías (/api/bahias/stream)
+    BAY_STREAM_QUEUE_SIZE: int = int(os.getenv("BAY_STREAM_QUEUE_SIZE", "100"))
+    BAY_STREAM_RECONCILE_INTERVAL: float = float(os.getenv("BAY_STREAM_RECONCILE_INTERVAL", "5"))
+    BAY_STREAM_HEARTBEAT: float = float(os.getenv("BAY_STREAM_HEARTBEAT", "15"))
+
+    # Exportaciones en streaming (filas por fetchmany)
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+    EXPORT_MAX_CONCURRENT: int = int(os.getenv("EXPORT_MAX_CONCURRENT", str(max(1, int(os.getenv("DB_POOL_MAX_SIZE", "10")) // 4))))  # conexiones del pool que pueden ocupar; 0 = sin límite
     
     # CORS
     ALLOWED_ORIGINS: list = ["*"]
@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+
+class FormatoExport(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+MEDIA_TYPES = {
+    FormatoExport.NDJSON: "application/x-ndjson",
+    FormatoExport.CSV: "text/csv",
+}
+
+class ExportSlots:
+    """
+    Cupo de exportaciones simultáneas.
+
+    Cada exportación retiene su conexión del pool mientras dura la descarga;
+    sin cupo, unas pocas descargas lentas dejarían al resto de endpoints sin
+    conexiones. Al llenarse se responde 503 con Retry-After en vez de esperar.
+    Todo corre en el event loop, así que basta un contador.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if 0 < self.limit <= self.active:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Demasiadas exportaciones en curso, reintente en unos segundos",
+                headers={"Retry-After": "5"}
+            )
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+
+    def stats(self):
+        return {"en_curso": self.active, "limite": self.limit, "rechazadas": self.rejected}
+
+export_slots = ExportSlots(settings.EXPORT_MAX_CONCURRENT)
+
+async def export_slot():
+    """
+    Dependency de los endpoints /export. Va en dependencies=[...] del
+    decorador para resolverse antes que get_db: si no hay hueco se rechaza
+    sin llegar a pedir conexión. Como get_db, se libera al terminar la
+    respuesta, después de devolver la conexión.
+    """
+    export_slots.acquire()
+    try:
+        yield
+    finally:
+        export_slots.release()
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _ndjson(columns, rows):
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_csv_value(v) for v in row] for row in rows)
+    return buffer.getvalue()
+
+async def stream_rows(cursor, formato):
+    """
+    Genera el cuerpo de la exportación lote a lote con fetchmany.
+
+    Solo hay en memoria un lote de EXPORT_BATCH_SIZE filas a la vez y el
+    primer lote sale hacia el cliente mientras el resto del resultado sigue
+    en el servidor.
+    """
+    try:
+        columns = [col[0] for col in cursor.description]
+        if formato == FormatoExport.CSV:
+            yield _csv([columns])
+        while True:
+            rows = await cursor.fetchmany(settings.EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield _ndjson(columns, rows) if formato == FormatoExport.NDJSON else _csv(rows)
+    finally:
+        cursor.close()
+
+async def export_response(conn, query, params, formato, nombre):
+    """
+    Ejecuta la consulta y devuelve un StreamingResponse que la va leyendo.
+
+    La conexión viene de get_db: FastAPI (< 0.106) cierra las dependencias
+    con yield después de enviar la respuesta, así que sigue prestada mientras
+    dure el streaming y vuelve al pool al terminar o si el cliente se corta.
+    Por eso los endpoints que la usan llevan export_slot, que limita cuántas
+    conexiones pueden quedar retenidas así (EXPORT_MAX_CONCURRENT).
+    Los errores de la consulta saltan aquí, antes de enviar cabeceras.
+    """
+    cursor = conn.cursor()
+    try:
+        await cursor.execute(query, params)
+    except Exception:
+        cursor.close()
+        raise
+    extension = formato.value
+    return StreamingResponse(
+        stream_rows(cursor, formato),
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{extension}"'}
+    )
@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# -------------------------- FUNCIONES DEL WORKER --------------------------
+# Se ejecutan en los procesos hijos; este módulo solo importa passlib para
+# que arrancar un worker sea barato.
+
+def hash_password(password):
+    # bcrypt solo usa los primeros 72 bytes
+    if len(password) > 72:
+        password = password[:72]
+    return pwd_context.hash(password)
+
+def check_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _ping():
+    return True
+
+# -------------------------- POOL DE PROCESOS --------------------------
+
+class PasswordHasher:
+    """
+    Despacha bcrypt a un pool de procesos para no congelar el event loop.
+
+    max_concurrency acota cuántos hash/verify hay en vuelo a la vez; el resto
+    espera en un semáforo asíncrono y se contabiliza como cola. Con
+    workers = 0 se usa el threadpool por defecto del loop en lugar de procesos.
+    """
+
+    def __init__(self, workers=2, max_concurrency=None):
+        self.workers = workers
+        self.max_concurrency = max_concurrency or max(workers, 1)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = weakref.WeakKeyDictionary()  # un semáforo por event loop
+        self._lock = threading.Lock()
+
+        # Métricas
+        self._in_flight = 0
+        self._queued = 0
+        self._max_queued = 0
+        self._completed = 0
+        self._errors = 0
+        self._queue_time_total = 0.0
+        self._run_time_total = 0.0
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _get_slots(self):
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        return slots
+
+    async def _submit(self, func, *args):
+        slots = self._get_slots()
+        queued_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        try:
+            await slots.acquire()
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+        started = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+            self._queue_time_total += started - queued_at
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            slots.release()
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._run_time_total += time.perf_counter() - started
+
+    async def hash(self, password):
+        return await self._submit(hash_password, password)
+
+    async def verify(self, plain_password, hashed_password):
+        return await self._submit(check_password, plain_password, hashed_password)
+
+    def warmup(self):
+        """Arranca todos los procesos del pool para que el primer login no pague el spawn"""
+        executor = self._get_executor()
+        if executor is None:
+            return
+        futures = [executor.submit(_ping) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "max_queued": self._max_queued,
+                "completed": self._completed,
+                "errors": self._errors,
+                "queue_time_avg_ms": round(
+                    self._queue_time_total * 1000 / self._completed, 3
+                ) if self._completed else 0.0,
+                "run_time_avg_ms": round(
+                    self._run_time_total * 1000 / self._completed, 3
+                ) if self._completed else 0.0,
+            }
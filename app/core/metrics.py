@@ -0,0 +1,235 @@
+"""
+Métricas en formato de exposición de Prometheus (GET /metrics).
+
+Contadores, gauges e histogramas mínimos, sin dependencias. Cada métrica
+guarda sus series en un dict por tupla de valores de etiqueta y actualiza
+con un lock propio sin contención en el caso normal (el event loop y los
+hilos de db_executor), así que observar cuesta unos pocos microsegundos.
+
+Qué se mide:
+- http_*: por ruta (plantilla, p. ej. /api/reservas/{reserva_id}) y método,
+  envolviendo cada APIRoute en instrument_routes();
+- db_query_*: por nombre lógico de consulta (el name de
+  AsyncCursor.execute o, si falta, derive_query_name());
+- db_pool_* / db_connect_*: espera por una conexión del pool y apertura de
+  conexiones nuevas;
+- http_response_render_seconds: serialización JSON de las respuestas.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from fastapi.routing import APIRoute
+
+# Starlette añade "; charset=utf-8" a los tipos text/*
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            series = list(self._series.items())
+        for labels, value in series:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._series[labels] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        # Cuenta por bucket (no acumulada) + suma; se acumula al exportar
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in series:
+            acumulado = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                acumulado += count
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {acumulado}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {acumulado}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Función llamada antes de cada exportación (p. ej. para fijar gauges del pool)"""
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"⚠️ Error en un colector de métricas: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status")))
+HTTP_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP", ("method", "route")))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Peticiones HTTP en curso", ("method", "route")))
+HTTP_RENDER = registry.register(Histogram(
+    "http_response_render_seconds", "Serialización JSON de las respuestas",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)))
+
+DB_QUERY_DURATION = registry.register(Histogram(
+    "db_query_duration_seconds", "Duración de cada execute en el driver", ("query",)))
+DB_QUERY_ERRORS = registry.register(Counter(
+    "db_query_errors_total", "Consultas que lanzaron una excepción", ("query",)))
+DB_POOL_ACQUIRE = registry.register(Histogram(
+    "db_pool_acquire_seconds", "Espera hasta obtener una conexión del pool"))
+DB_POOL_TIMEOUTS = registry.register(Counter(
+    "db_pool_timeouts_total", "Peticiones sin conexión del pool dentro del tiempo de espera"))
+DB_CONNECT = registry.register(Histogram(
+    "db_connect_seconds", "Apertura de conexiones nuevas a la base de datos"))
+DB_CONNECT_ERRORS = registry.register(Counter(
+    "db_connect_errors_total", "Errores al abrir conexiones nuevas"))
+DB_POOL_CONNECTIONS = registry.register(Gauge(
+    "db_pool_connections", "Conexiones del pool por estado", ("state",)))
+
+# -------------------------- NOMBRES DE CONSULTA --------------------------
+
+_STATEMENT = re.compile(
+    r"\b(SELECT|INSERT\s+INTO|UPDATE|DELETE\s+FROM|MERGE|EXEC)\b\s*(?:TOP\s*\(?\s*[%\w]+\s*\)?\s*)?",
+    re.IGNORECASE
+)
+_FROM = re.compile(r"\bFROM\s+([\w.\[\]@]+)", re.IGNORECASE)
+_TARGET = re.compile(r"^\s*([\w.\[\]@]+)")
+_names = {}
+
+def derive_query_name(query):
+    """
+    Nombre lógico de una consulta sin nombre explícito: verbo y tabla
+    principal de la primera sentencia de datos, p. ej. "select:reservas".
+    Se calcula una vez por texto de consulta.
+    """
+    name = _names.get(query)
+    if name is not None:
+        return name
+    name = "otra"
+    for match in _STATEMENT.finditer(query):
+        verb = match.group(1).split()[0].lower()
+        rest = query[match.end():]
+        if verb == "select":
+            table = _FROM.search(rest)
+            if table is None or table.group(1).startswith("@"):
+                continue
+            name = f"select:{table.group(1)}"
+        else:
+            table = _TARGET.match(rest)
+            name = f"{verb}:{table.group(1)}" if table else verb
+        break
+    if len(_names) < 2048:
+        _names[query] = name
+    return name
+
+# -------------------------- HTTP --------------------------
+
+def _instrument(app, method, route):
+    async def instrumented(scope, receive, send):
+        labels = (method, route)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(labels)
+        start = time.perf_counter()
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            HTTP_DURATION.observe(labels, time.perf_counter() - start)
+            HTTP_IN_FLIGHT.dec(labels)
+            HTTP_REQUESTS.inc((method, route, str(status[0])))
+
+    return instrumented
+
+def instrument_routes(app):
+    """
+    Envuelve cada APIRoute para medirla con su plantilla de ruta como
+    etiqueta. Llamar después de incluir todos los routers. Incluye la
+    validación, las dependencias (autenticación, rol, conexión), el handler
+    y la serialización; las respuestas en streaming cuentan hasta el final.
+    """
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not getattr(route, "_metricas", False):
+            method = ",".join(sorted(route.methods or ()))
+            route.app = _instrument(route.app, method, route.path)
+            route._metricas = True
@@ -0,0 +1,96 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from fastapi import HTTPException
+
+# Cabecera con el cursor de la página siguiente (ausente en la última página)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+def encode_cursor(values):
+    """Cursor opaco con los valores de las columnas de orden de la última fila"""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+class Keyset:
+    """
+    Orden de un listado para paginación por cursor (seek).
+
+    columns es una lista de (expresión SQL, clave en la fila, descendente);
+    la última columna debe ser única (normalmente el id) para desempatar.
+    Con cursor la consulta continúa justo después de la última fila vista en
+    lugar de saltarse `skip` filas con OFFSET, así que el coste de cada página
+    no crece con la profundidad.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+
+    def order_by(self):
+        return ", ".join(f"{expr} {'DESC' if desc else 'ASC'}" for expr, _, desc in self.columns)
+
+    def seek(self, values):
+        """
+        Condición "fila posterior al cursor" y sus parámetros:
+        (a > x) OR (a = x AND b > y) OR ..., con < en columnas descendentes.
+        """
+        clauses, params = [], []
+        for i, (expr, _, desc) in enumerate(self.columns):
+            parts = []
+            for prev_expr, _, _ in self.columns[:i]:
+                parts.append(f"{prev_expr} = %s")
+            parts.append(f"{expr} {'<' if desc else '>'} %s")
+            clauses.append("(" + " AND ".join(parts) + ")")
+            params.extend(values[:i + 1])
+        return "(" + " OR ".join(clauses) + ")", params
+
+    def cursor_for(self, row):
+        return encode_cursor([row[key] for _, key, _ in self.columns])
+
+    def paginate(self, query, params, after, skip, limit):
+        """
+        Añade el seek (o el OFFSET de compatibilidad si no hay cursor) y el
+        ORDER BY a una consulta que termina en su WHERE. Pide una fila de más
+        para saber si existe una página siguiente.
+        """
+        params = list(params)
+        if after:
+            clause, seek_params = self.seek(decode_cursor(after, len(self.columns)))
+            query += f" AND {clause}"
+            params.extend(seek_params)
+            skip = 0
+        query += f" ORDER BY {self.order_by()} OFFSET %s ROWS FETCH NEXT %s ROWS ONLY"
+        params.extend([skip, limit + 1])
+        return query, tuple(params)
+
+    def page(self, rows, limit, response):
+        """Recorta la fila extra y publica el cursor siguiente en la respuesta"""
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = self.cursor_for(rows[-1])
+        return rows
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from app.core.config import settings
+
+# Columnas de uso_diario_bahias que forman el parcial de un día
+PARTIAL_COLUMNS = (
+    "bahia_id", "tipo_bahia_id", "total_reservas",
+    "reservas_completadas", "reservas_canceladas", "minutos_totales",
+)
+
+class DayPartial:
+    """Filas del resumen diario de un día, por bahía"""
+
+    __slots__ = ("fecha", "rows", "expires_at")
+
+    def __init__(self, fecha, rows, expires_at):
+        self.fecha = fecha
+        self.rows = rows          # {bahia_id: dict con PARTIAL_COLUMNS}
+        self.expires_at = expires_at  # None = día cerrado, no caduca
+
+    @property
+    def closed(self):
+        return self.expires_at is None
+
+def _is_closed(fecha, rows, today):
+    # Un día pasado sin reservas pendientes ya no puede cambiar: no se crean
+    # reservas en el pasado y todas las suyas están completadas o canceladas
+    if fecha >= today:
+        return False
+    return all(
+        row["total_reservas"] == row["reservas_completadas"] + row["reservas_canceladas"]
+        for row in rows.values()
+    )
+
+def _spans(days):
+    """Agrupa días ordenados en rangos contiguos [desde, hasta]"""
+    spans = []
+    for day in days:
+        if spans and day == spans[-1][1] + timedelta(days=1):
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+    return spans
+
+class ReportCache:
+    """
+    Caché de parciales diarios del reporte de uso, por fecha.
+
+    Los días cerrados se guardan sin caducidad (acotados a max_days con LRU);
+    hoy, los días futuros y los pasados con reservas aún activas caducan a
+    los open_day_ttl segundos. Los reportes por rango se montan con los
+    parciales cacheados y solo consultan los días que faltan.
+    """
+
+    def __init__(self, open_day_ttl, max_days):
+        self.open_day_ttl = open_day_ttl
+        self.max_days = max_days
+        self._days = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, fecha, now):
+        with self._lock:
+            partial = self._days.get(fecha)
+            if partial is None:
+                return None
+            if partial.expires_at is not None and partial.expires_at <= now:
+                del self._days[fecha]
+                return None
+            self._days.move_to_end(fecha)
+            return partial
+
+    def _put(self, partial):
+        with self._lock:
+            self._days[partial.fecha] = partial
+            self._days.move_to_end(partial.fecha)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+
+    async def get_days(self, cursor, desde, hasta):
+        """
+        Parciales de [desde, hasta] como {fecha: DayPartial}.
+
+        Usa el cursor del llamador para los días que faltan: una consulta por
+        tramo contiguo de días no cacheados, todas en un único lote.
+        """
+        now = time.monotonic()
+        today = date.today()
+        result = {}
+        missing = []
+        fecha = desde
+        while fecha <= hasta:
+            partial = self._get(fecha, now)
+            if partial is None:
+                missing.append(fecha)
+            else:
+                result[fecha] = partial
+            fecha += timedelta(days=1)
+        self.hits += len(result)
+        self.misses += len(missing)
+
+        if missing:
+            spans = _spans(missing)
+            where = " OR ".join(["(fecha >= %s AND fecha <= %s)"] * len(spans))
+            params = [d for span in spans for d in span]
+            await cursor.execute(
+                f"SELECT fecha, {', '.join(PARTIAL_COLUMNS)} FROM uso_diario_bahias WHERE {where}",
+                tuple(params)
+            )
+            por_dia = {fecha: {} for fecha in missing}
+            for row in await cursor.fetchall():
+                if not isinstance(row, dict):
+                    row = dict(zip(("fecha",) + PARTIAL_COLUMNS, row))
+                fecha = row.pop("fecha")
+                if isinstance(fecha, datetime):
+                    fecha = fecha.date()
+                por_dia.setdefault(fecha, {})[row["bahia_id"]] = row
+            for fecha, rows in por_dia.items():
+                closed = _is_closed(fecha, rows, today)
+                partial = DayPartial(fecha, rows, None if closed else now + self.open_day_ttl)
+                if closed or self.open_day_ttl > 0:
+                    self._put(partial)
+                result[fecha] = partial
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+
+    def stats(self):
+        with self._lock:
+            cerrados = sum(1 for p in self._days.values() if p.closed)
+            total = len(self._days)
+        return {
+            "dias": total,
+            "dias_cerrados": cerrados,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+report_cache = ReportCache(
+    open_day_ttl=settings.REPORT_CACHE_OPEN_DAY_TTL,
+    max_days=settings.REPORT_CACHE_MAX_DAYS
+)
@@ -0,0 +1,135 @@
+"""
+Serialización JSON de las respuestas.
+
+FastJSONResponse es la clase de respuesta por defecto de la aplicación:
+usa orjson (datetime, date, UUID nativos; Decimal como número) y cae a la
+librería estándar si orjson no está instalado. EncodedCache guarda los
+bytes ya serializados de listados calientes para que las peticiones
+repetidas no vuelvan a codificar nada.
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import date, datetime
+from datetime import time as dtime
+from decimal import Decimal
+from uuid import UUID
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from app.core.config import settings
+from app.core.metrics import HTTP_RENDER
+from app.core import timing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, dtime)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+if orjson is not None:
+    def dumps(content):
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(content):
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse con dumps(): sin pasar por json.dumps ni jsonable_encoder"""
+
+    def render(self, content):
+        start = time.perf_counter()
+        body = dumps(content)
+        duracion = time.perf_counter() - start
+        HTTP_RENDER.observe((), duracion)
+        timing.record("render", duracion)
+        return body
+
+class EncodedBody:
+    """Cuerpo JSON ya serializado con su ETag"""
+
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body, expires_at):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.expires_at = expires_at
+
+class EncodedCache:
+    """
+    Bytes de respuestas calientes por clave, con caducidad.
+
+    Quien modifica los datos llama a invalidate(clave) después del commit;
+    el TTL cubre lo que cambia sin que nadie escriba (p. ej. campos que
+    dependen de GETDATE()). Con ttl <= 0 no se guarda nada.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, key, content):
+        entry = EncodedBody(dumps(content), time.monotonic() + self.ttl)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            entradas = len(self._entries)
+        return {"entradas": entradas, "ttl_s": self.ttl, "hits": self.hits, "misses": self.misses}
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match usa comparación débil: se ignora el prefijo W/
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+def encoded_response(entry, request: Request = None):
+    """Respuesta con los bytes cacheados (304 si el cliente ya los tiene)"""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if request is not None and etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+# Claves de list_cache que invalidan las rutas que escriben
+RESERVAS_ACTIVAS = "reportes:reservas_activas"
+
+list_cache = EncodedCache(ttl=settings.LIST_CACHE_TTL)
@@ -0,0 +1,91 @@
+"""
+Resumen diario de uso por bahía (tabla uso_diario_bahias).
+
+Cada reserva suma en el día de su fecha_hora_inicio: al crearse cuenta en
+total_reservas y minutos_totales, al completarse o cancelarse en su
+contador. Los reportes de uso leen de aquí, así que su coste depende de
+días × bahías y no del número de reservas.
+
+Reconstrucción (p. ej. tras cargar datos históricos o para el backfill inicial):
+
+    python -m app.core.rollup [--desde YYYY-MM-DD] [--hasta YYYY-MM-DD]
+
+Los workers guardan en memoria los días cerrados (app.core.report_cache);
+después de reconstruir hay que vaciarla con POST /api/reportes/cache/limpiar
+o reiniciar la API.
+"""
+import argparse
+from datetime import date
+
+CREADA = "creada"
+COMPLETADA = "completada"
+CANCELADA = "cancelada"
+
+REBUILD_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @desde DATE = %s;
+    DECLARE @hasta DATE = %s;
+
+    -- TABLOCKX: las altas/bajas concurrentes esperan a que termine la reconstrucción
+    DELETE FROM uso_diario_bahias WITH (TABLOCKX, HOLDLOCK)
+    WHERE fecha >= @desde AND fecha <= @hasta;
+
+    INSERT INTO uso_diario_bahias (
+        fecha, bahia_id, tipo_bahia_id, total_reservas,
+        reservas_completadas, reservas_canceladas, minutos_totales
+    )
+    SELECT CAST(r.fecha_hora_inicio AS DATE),
+           r.bahia_id,
+           b.tipo_bahia_id,
+           COUNT(*),
+           SUM(CASE WHEN r.estado = 'completada' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN r.estado = 'cancelada' THEN 1 ELSE 0 END),
+           SUM(DATEDIFF(MINUTE, r.fecha_hora_inicio, r.fecha_hora_fin))
+    FROM reservas r
+    INNER JOIN bahias b ON r.bahia_id = b.id
+    WHERE r.fecha_hora_inicio >= @desde
+    AND r.fecha_hora_inicio < DATEADD(DAY, 1, @hasta)
+    GROUP BY CAST(r.fecha_hora_inicio AS DATE), r.bahia_id, b.tipo_bahia_id;
+
+    SELECT @@ROWCOUNT AS filas;
+"""
+
+async def registrar_uso_diario(cursor, reserva_id, evento):
+    """Suma el evento de la reserva en su día; va en la transacción del llamador"""
+    await cursor.execute("EXEC sp_registrar_uso_diario %s, %s", (reserva_id, evento), name="registrar_uso_diario")
+
+def rebuild(conn, desde=None, hasta=None):
+    """Recalcula el resumen entre dos fechas (por defecto, todo el histórico)"""
+    from app.database import timed_execute
+
+    desde = desde or date(1900, 1, 1)
+    hasta = hasta or date(9999, 12, 30)
+    cursor = conn.cursor()
+    try:
+        timed_execute(cursor, REBUILD_SQL, (desde, hasta), name="reconstruir_uso_diario")
+        filas = cursor.fetchone()[0]
+        conn.commit()
+        return filas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye uso_diario_bahias a partir de reservas")
+    parser.add_argument("--desde", type=date.fromisoformat, default=None)
+    parser.add_argument("--hasta", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    from app.database import db
+
+    conn = db.get_connection()
+    try:
+        filas = rebuild(conn, args.desde, args.hasta)
+        print(f"✅ Resumen diario reconstruido: {filas} filas")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
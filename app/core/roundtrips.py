@@ -0,0 +1,133 @@
+"""
+Viajes a la base de datos por petición y detector de N+1.
+
+Cada APIRoute se envuelve en track_routes() con un contador propio en una
+ContextVar; AsyncCursor.execute y AsyncConnection.commit/rollback le suman
+un viaje y su duración, da igual si la conexión viene de get_db o de
+db.connection(). Al empezar la respuesta se añaden las cabeceras
+X-DB-Round-Trips y X-DB-Time (ms).
+
+Presupuesto: DB_ROUNDTRIP_BUDGET viajes por petición, con excepciones por
+ruta en DB_ROUNDTRIP_BUDGETS ("POST /api/reservas/=2, GET /api/bahias/=1").
+Pasarse deja un aviso en el log; con DB_ROUNDTRIP_STRICT=true la consulta
+que lo supera lanza RoundTripBudgetExceeded (la petición acaba en 500), así
+que un benchmark o una prueba en CI falla en vez de solo avisar.
+
+N+1: si una misma consulta (por nombre lógico) se repite
+DB_N_PLUS_ONE_THRESHOLD veces o más en una petición, se avisa en el log.
+"""
+import contextvars
+from fastapi.routing import APIRoute
+from app.core.config import settings
+
+_current = contextvars.ContextVar("db_roundtrips", default=None)
+
+class RoundTripBudgetExceeded(Exception):
+    """La petición superó su presupuesto de viajes a la base de datos"""
+    pass
+
+def _parse_budgets(value):
+    budgets = {}
+    for item in value.split(","):
+        ruta, sep, limite = item.strip().rpartition("=")
+        if sep and ruta.strip():
+            budgets[ruta.strip()] = int(limite)
+    return budgets
+
+_budgets = _parse_budgets(settings.DB_ROUNDTRIP_BUDGETS)
+
+def budget_for(method, route):
+    """Viajes permitidos para una ruta (0 = sin límite)"""
+    return _budgets.get(f"{method} {route}", settings.DB_ROUNDTRIP_BUDGET)
+
+class RequestRoundTrips:
+    """Viajes (sentencias, commits y rollbacks) y tiempo de BD de una petición"""
+
+    __slots__ = ("route", "budget", "viajes", "tiempo", "por_consulta")
+
+    def __init__(self, route, budget):
+        self.route = route
+        self.budget = budget
+        self.viajes = 0
+        self.tiempo = 0.0
+        self.por_consulta = {}
+
+    def add(self, name, duracion):
+        self.viajes += 1
+        self.tiempo += duracion
+        self.por_consulta[name] = self.por_consulta.get(name, 0) + 1
+
+    def over_budget(self):
+        return 0 < self.budget < self.viajes
+
+    def repeated(self):
+        """Consultas repetidas al menos DB_N_PLUS_ONE_THRESHOLD veces"""
+        umbral = settings.DB_N_PLUS_ONE_THRESHOLD
+        if umbral <= 0:
+            return {}
+        return {name: veces for name, veces in self.por_consulta.items() if veces >= umbral}
+
+def check_budget():
+    """En modo estricto, falla antes de la consulta que superaría el presupuesto"""
+    trips = _current.get()
+    if trips is not None and settings.DB_ROUNDTRIP_STRICT and 0 < trips.budget <= trips.viajes:
+        raise RoundTripBudgetExceeded(
+            f"{trips.route}: más de {trips.budget} viajes a la base de datos ({trips.por_consulta})"
+        )
+
+def record(name, duracion):
+    """Suma un viaje a la petición en curso (no hace nada fuera de una petición)"""
+    trips = _current.get()
+    if trips is not None:
+        trips.add(name, duracion)
+
+def current_route():
+    """Ruta de la petición en curso ("GET /api/bahias/"), o None"""
+    trips = _current.get()
+    return trips.route if trips is not None else None
+
+def _report(trips):
+    if trips.over_budget():
+        print(f"⚠️ {trips.route}: {trips.viajes} viajes a la base de datos "
+              f"(presupuesto {trips.budget}): {trips.por_consulta}")
+    repetidas = trips.repeated()
+    if repetidas:
+        print(f"⚠️ Posible N+1 en {trips.route}: {repetidas}")
+    if settings.DB_ROUNDTRIP_LOG:
+        print(f"🗄️ {trips.route}: {trips.viajes} viajes a la base de datos, {trips.tiempo * 1000:.1f} ms")
+
+def _track(app, method, route):
+    label = f"{method} {route}"
+    budget = budget_for(method, route)
+
+    async def tracked(scope, receive, send):
+        trips = RequestRoundTrips(label, budget)
+        token = _current.set(trips)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and settings.DB_ROUNDTRIP_HEADERS:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-round-trips", str(trips.viajes).encode("latin-1")))
+                headers.append((b"x-db-time", f"{trips.tiempo * 1000:.2f}".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            _report(trips)
+
+    return tracked
+
+def track_routes(app):
+    """
+    Envuelve cada APIRoute con su contador de viajes. Llamar después de
+    incluir todos los routers. Las cabeceras reflejan los viajes hechos
+    hasta el inicio de la respuesta; el log, los de toda la petición.
+    """
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not getattr(route, "_viajes_bd", False):
+            method = ",".join(sorted(route.methods or ()))
+            route.app = _track(route.app, method, route.path)
+            route._viajes_bd = True
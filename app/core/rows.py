@@ -0,0 +1,116 @@
+"""
+Camino rápido de filas de la base de datos a respuestas JSON.
+
+Antes cada fila pasaba por dict(zip(...)), luego por el constructor del
+modelo pydantic (validación) y FastAPI la volvía a validar y serializar por
+el response_model. Las filas que salen de nuestras propias consultas ya
+tienen los tipos correctos, así que aquí:
+
+- RowMapper calcula una sola vez por forma de consulta (columnas + modelo)
+  qué columna va a cada campo, y construye los dicts con un itemgetter;
+- las respuestas se devuelven ya construidas (FastJSONResponse), y FastAPI
+  no las vuelve a validar (el response_model del endpoint sigue sirviendo para
+  la documentación OpenAPI).
+
+Solo para datos leídos de la base de datos; lo que venga del cliente se
+sigue validando con los modelos.
+"""
+import types
+import typing
+from functools import lru_cache
+from operator import itemgetter
+from app.core.responses import FastJSONResponse
+from app.core.timing import timed
+
+def _unwrap_optional(annotation):
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+def _converter(annotation):
+    # pymssql devuelve DECIMAL como Decimal; el modelo lo declara float
+    if _unwrap_optional(annotation) is float:
+        return _to_float
+    return None
+
+class RowMapper:
+    """Convierte filas (tuplas o dicts) de una forma de consulta a dicts del modelo"""
+
+    def __init__(self, columns, model):
+        self.model = model
+        self.columns = columns
+        self.fields = []
+        self.defaults = {}
+        self.converters = []
+        keys = []
+        for name, field in model.model_fields.items():
+            if name in columns:
+                self.fields.append(name)
+                keys.append(columns.index(name))
+                converter = _converter(field.annotation)
+                if converter is not None:
+                    self.converters.append((name, converter))
+            elif not field.is_required():
+                self.defaults[name] = field.get_default(call_default_factory=True)
+            else:
+                raise KeyError(f"La consulta no devuelve el campo obligatorio '{name}' de {model.__name__}")
+        self._by_index = self._getter(keys)
+        self._by_name = self._getter(self.fields)
+
+    @staticmethod
+    def _getter(keys):
+        if len(keys) == 1:
+            getter = itemgetter(keys[0])
+            return lambda row: (getter(row),)
+        return itemgetter(*keys)
+
+    def one(self, row):
+        if row is None:
+            return None
+        values = (self._by_name if isinstance(row, dict) else self._by_index)(row)
+        item = dict(zip(self.fields, values))
+        if self.defaults:
+            item.update(self.defaults)
+        for name, converter in self.converters:
+            item[name] = converter(item[name])
+        return item
+
+    def all(self, rows):
+        return [self.one(row) for row in rows]
+
+@lru_cache(maxsize=256)
+def _mapper(columns, model):
+    return RowMapper(columns, model)
+
+def row_mapper(cursor, model):
+    """Mapper para el resultado actual del cursor; se reutiliza entre peticiones"""
+    return _mapper(tuple(col[0] for col in cursor.description), model)
+
+async def fetch_all(cursor, model):
+    rows = await cursor.fetchall()
+    with timed("mapeo", model.__name__):
+        return row_mapper(cursor, model).all(rows)
+
+async def fetch_one(cursor, model):
+    row = await cursor.fetchone()
+    with timed("mapeo", model.__name__):
+        return row_mapper(cursor, model).one(row)
+
+def trusted_response(content, response=None):
+    """
+    Respuesta para devolver desde un endpoint con response_model.
+
+    Si el endpoint recibió un Response para añadir cabeceras (p. ej. el
+    cursor de paginación), se copian a la respuesta nueva.
+    """
+    trusted = FastJSONResponse(content)
+    if response is not None:
+        for key, value in response.headers.items():
+            if key != "content-length":
+                trusted.headers[key] = value
+    return trusted
@@ -1,21 +1,33 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from collections import OrderedDict
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config import settings
+from app.core.hashing import PasswordHasher, check_password, hash_password
+from app.core.timing import timed
+from app.database import AsyncConnection, PoolTimeoutError, db
+import threading
+import time
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_concurrency=settings.PASSWORD_HASH_MAX_CONCURRENCY
+)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return check_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    # 🔥 SOLO ESTA LÍNEA ES NUEVA - truncar a 72 caracteres
-    if len(password) > 72:
-        password = password[:72]
-    return pwd_context.hash(password)
+    return hash_password(password)
+
+# Versiones para endpoints async: bcrypt corre en el pool de procesos
+async def verify_password_async(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -24,13 +36,14 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": time.time()})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        with timed("auth"):
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         return payload
     except JWTError:
         raise HTTPException(
@@ -48,22 +61,122 @@ async def get_current_user(payload: dict = Depends(verify_token)):
         )
     return user_id
 
-# Función para obtener el tipo de usuario actual
-async def get_current_user_type(payload: dict = Depends(verify_token), conn = None):
+# -------------------------- ROLES --------------------------
+
+class RoleCache:
+    """
+    Caché LRU con TTL de tipo_usuario por id de usuario.
+
+    Además recuerda cuándo se modificó cada usuario: el claim "tipo" de un
+    token emitido antes de esa modificación deja de ser confiable y se
+    vuelve a consultar la base de datos. Es una caché por proceso: con
+    varios workers la invalidación solo llega al worker que hizo el cambio;
+    si eso no es aceptable, ROLE_TRUST_TOKEN_CLAIM=false hace que el rol
+    salga siempre de la base de datos (cacheado con TTL).
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._roles = OrderedDict()   # user_id -> (tipo_usuario, vence)
+        self._modified = {}           # user_id -> instante de la última modificación (epoch)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._roles.get(user_id)
+            if entry is None:
+                return None
+            role, expires = entry
+            if expires < time.monotonic():
+                del self._roles[user_id]
+                return None
+            self._roles.move_to_end(user_id)
+            return role
+
+    def set(self, user_id, role):
+        with self._lock:
+            self._roles[user_id] = (role, time.monotonic() + self.ttl)
+            self._roles.move_to_end(user_id)
+            while len(self._roles) > self.maxsize:
+                self._roles.popitem(last=False)
+
+    def claim_is_fresh(self, user_id, issued_at):
+        """True si el token se emitió después de la última modificación del usuario"""
+        if issued_at is None:
+            return False
+        with self._lock:
+            modified = self._modified.get(user_id)
+        return modified is None or issued_at > modified
+
+    def invalidate(self, user_id):
+        now = time.time()
+        horizon = now - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        with self._lock:
+            self._roles.pop(user_id, None)
+            self._modified[user_id] = now
+            # Pasado el tiempo de vida del token ya no hay claims viejos que vigilar
+            for uid in [uid for uid, ts in self._modified.items() if ts < horizon]:
+                del self._modified[uid]
+
+    def clear(self):
+        with self._lock:
+            self._roles.clear()
+            self._modified.clear()
+
+role_cache = RoleCache(maxsize=settings.ROLE_CACHE_SIZE, ttl=settings.ROLE_CACHE_TTL)
+
+def invalidate_user_role(user_id):
+    """Llamar después de cambiar tipo_usuario o activo de un usuario"""
+    role_cache.invalidate(user_id)
+
+async def get_current_user_type(payload: dict = Depends(verify_token)):
+    """
+    Resuelve el tipo del usuario autenticado sin ir a la base de datos en
+    el caso normal: primero la caché, luego el claim "tipo" del token si
+    sigue vigente y, solo si no, SELECT a usuarios. No depende de get_db:
+    la conexión del pool se pide solo en ese último caso.
+    """
+    user_id = payload.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    role = role_cache.get(user_id)
+    if role is not None:
+        return role
+
+    claim = payload.get("tipo")
+    if claim and settings.ROLE_TRUST_TOKEN_CLAIM and role_cache.claim_is_fresh(user_id, payload.get("iat")):
+        role_cache.set(user_id, claim)
+        return claim
+
     try:
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (user_id,))
-            user_data = cursor.fetchone()
+        async with db.connection() as raw:
+            cursor = AsyncConnection(raw).cursor(as_dict=True)
+            await cursor.execute("SELECT tipo_usuario, activo FROM usuarios WHERE id = %s", (user_id,), name="rol_usuario")
+            user_data = await cursor.fetchone()
             cursor.close()
-            
-            if user_data:
-                return user_data["tipo_usuario"]
-        
-        return None
-    except Exception:
-        return None
\ No newline at end of file
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"Base de datos saturada: {str(e)}")
+
+    if not user_data or not user_data["activo"]:
+        raise HTTPException(status_code=401, detail="Usuario no válido")
+
+    role_cache.set(user_id, user_data["tipo_usuario"])
+    return user_data["tipo_usuario"]
+
+def require_roles(*roles, detail: str = "No tiene permisos para realizar esta acción"):
+    """
+    Dependency que exige que el usuario autenticado tenga uno de los roles indicados.
+
+    Uso: @router.post("/", dependencies=[Depends(require_roles(TipoUsuario.ADMINISTRADOR))])
+    o como parámetro si el endpoint necesita el rol: user_tipo: str = Depends(require_roles(...))
+    """
+    allowed = {getattr(role, "value", role) for role in roles}
+
+    async def dependency(user_tipo: str = Depends(get_current_user_type)):
+        if user_tipo not in allowed:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+        return user_tipo
+
+    return dependency
@@ -0,0 +1,151 @@
+"""
+Registro de consultas lentas.
+
+timed_execute() (app.database) mide cada sentencia; las que tardan al menos
+SLOW_QUERY_THRESHOLD_MS quedan en un buffer circular en memoria
+(SLOW_QUERY_BUFFER_SIZE entradas) que se consulta en
+GET /api/reportes/consultas-lentas, y opcionalmente en un fichero rotativo
+(SLOW_QUERY_FILE, una línea JSON por consulta).
+
+Cada entrada lleva la huella normalizada de la sentencia (literales y
+parámetros sustituidos por ?, espacios colapsados), la forma de los
+parámetros (solo tipos, nunca valores), duración, filas afectadas si el
+driver las conoce, el nombre lógico de la consulta y la ruta que la lanzó.
+"""
+import json
+import logging
+import logging.handlers
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from app.core.config import settings
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRINGS = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w@#])[-+]?\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|%d")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+_fingerprints = {}
+
+def fingerprint(query):
+    """
+    Sentencia sin literales: dos ejecuciones con distintos valores (o listas
+    IN de distinto tamaño) dan la misma huella. Se calcula una vez por texto.
+    """
+    huella = _fingerprints.get(query)
+    if huella is not None:
+        return huella
+    huella = _COMMENTS.sub(" ", query)
+    huella = _STRINGS.sub("?", huella)
+    huella = _PLACEHOLDERS.sub("?", huella)
+    huella = _NUMBERS.sub("?", huella)
+    huella = _IN_LISTS.sub("(?+)", huella)
+    huella = _SPACES.sub(" ", huella).strip()
+    if len(_fingerprints) < 2048:
+        _fingerprints[query] = huella
+    return huella
+
+def param_shape(params):
+    """Tipos de los parámetros, sin sus valores"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    if isinstance(params, (tuple, list)):
+        return [type(value).__name__ for value in params]
+    return type(params).__name__
+
+class SlowQueryLog:
+    """Buffer circular acotado de consultas lentas, thread-safe"""
+
+    def __init__(self, threshold_ms, maxlen, path=None, max_bytes=10_000_000, backups=5):
+        self.threshold = threshold_ms / 1000
+        self._entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.total = 0
+        self.path = path
+        self._file = None
+        if path:
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file = logging.getLogger("consultas_lentas")
+            self._file.propagate = False
+            self._file.setLevel(logging.INFO)
+            self._file.addHandler(handler)
+
+    def is_slow(self, duracion):
+        return self.threshold >= 0 and duracion >= self.threshold
+
+    def record(self, query, params, duracion, filas=None, name=None, route=None):
+        entry = {
+            "fecha": datetime.now().isoformat(timespec="milliseconds"),
+            "huella": fingerprint(query),
+            "parametros": param_shape(params),
+            "duracion_ms": round(duracion * 1000, 1),
+            "filas": filas if filas is not None and filas >= 0 else None,
+            "consulta": name,
+            "ruta": route,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+        if self._file is not None:
+            try:
+                self._file.info(json.dumps(entry, ensure_ascii=False, default=str))
+            except Exception as e:
+                print(f"⚠️ Error escribiendo el registro de consultas lentas: {e}")
+        return entry
+
+    def entries(self, limit=None, huella=None):
+        """Entradas más recientes primero"""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if huella:
+            entries = [entry for entry in entries if huella in entry["huella"]]
+        return entries[:limit] if limit else entries
+
+    def top(self, limit=10, huella=None):
+        """Huellas agrupadas por tiempo total en el buffer"""
+        grupos = {}
+        for entry in self.entries(huella=huella):
+            grupo = grupos.setdefault(entry["huella"], {
+                "huella": entry["huella"], "veces": 0, "total_ms": 0.0, "max_ms": 0.0, "rutas": set()
+            })
+            grupo["veces"] += 1
+            grupo["total_ms"] += entry["duracion_ms"]
+            grupo["max_ms"] = max(grupo["max_ms"], entry["duracion_ms"])
+            if entry["ruta"]:
+                grupo["rutas"].add(entry["ruta"])
+        resultado = sorted(grupos.values(), key=lambda grupo: grupo["total_ms"], reverse=True)[:limit]
+        for grupo in resultado:
+            grupo["total_ms"] = round(grupo["total_ms"], 1)
+            grupo["rutas"] = sorted(grupo["rutas"])
+        return resultado
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            entradas = len(self._entries)
+        return {
+            "umbral_ms": self.threshold * 1000,
+            "entradas": entradas,
+            "capacidad": self._entries.maxlen,
+            "total": self.total,
+            "fichero": self.path,
+        }
+
+slow_query_log = SlowQueryLog(
+    settings.SLOW_QUERY_THRESHOLD_MS,
+    settings.SLOW_QUERY_BUFFER_SIZE,
+    path=settings.SLOW_QUERY_FILE or None,
+    max_bytes=settings.SLOW_QUERY_FILE_MAX_BYTES,
+    backups=settings.SLOW_QUERY_FILE_BACKUPS,
+)
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+class Snapshot:
+    """
+    Resultado calculado periódicamente en segundo plano y servido desde memoria.
+
+    compute es una corrutina sin argumentos. run() la ejecuta cada
+    `interval` segundos; get() devuelve el último valor y su antigüedad sin
+    tocar la base de datos, así que la carga no depende de cuántos clientes
+    consulten. Si todavía no hay valor (arranque sin base de datos), get()
+    lo calcula una vez y las peticiones simultáneas esperan a ese mismo
+    cálculo. Con interval <= 0 no hay tarea de fondo y cada get() recalcula.
+    """
+
+    def __init__(self, name, compute, interval):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.value = None
+        self.computed_at = None
+        self.refreshes = 0
+        self.errors = 0
+        self._inflight = None
+
+    def age(self):
+        if self.computed_at is None:
+            return None
+        return time.monotonic() - self.computed_at
+
+    async def _compute(self):
+        value = await self.compute()
+        self.value = value
+        self.computed_at = time.monotonic()
+        self.refreshes += 1
+        return value
+
+    async def refresh(self):
+        # Un solo cálculo en vuelo; los demás esperan su resultado
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._compute())
+        return await asyncio.shield(self._inflight)
+
+    async def get(self):
+        """(valor, antigüedad en segundos)"""
+        if self.computed_at is None or self.interval <= 0:
+            await self.refresh()
+        return self.value, self.age()
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ No se pudo refrescar {self.name}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        age = self.age()
+        return {
+            "edad_s": round(age, 2) if age is not None else None,
+            "intervalo_s": self.interval,
+            "refrescos": self.refreshes,
+            "errores": self.errors,
+        }
@@ -0,0 +1,750 @@
+"""
+Sustituto local de SQL Server sobre SQLite (DB_BACKEND=sqlite).
+
+Sirve para levantar la API completa en un portátil, sin servidor, y medirla
+con carga de forma reproducible. No es un emulador de T-SQL: cubre lo que
+usan las consultas de este repositorio y falla con NotSupportedError en lo
+demás.
+
+- Sentencias sueltas: se traducen una vez por texto de consulta. %s pasa a
+  ?, GETDATE(), ISNULL, CAST, DATEDIFF, DATEADD y CONCAT a sus equivalentes,
+  TOP y OFFSET/FETCH a LIMIT/OFFSET, y se quitan las pistas de bloqueo
+  (WITH (UPDLOCK, ...)) y SET NOCOUNT ON. Un lote con varias sentencias
+  devuelve un resultado por cada SELECT, que se recorren con nextset().
+- Lotes con variables, IF/TRY o procedimientos (alta de reserva,
+  transiciones de estado de bahías, sp_registrar_uso_diario y la
+  sincronización por watermark): se reconocen por un fragmento del SQL y se
+  ejecutan con código Python equivalente dentro de la misma transacción.
+- ROWVERSION se imita con un contador global que actualizan triggers, y los
+  triggers de historial y bajas son los del esquema original.
+
+La latencia inyectada (DB_FAKE_LATENCY_MS, más un jitter uniforme de hasta
+DB_FAKE_JITTER_MS con semilla DB_FAKE_SEED) se duerme en cada execute,
+commit y rollback, igual que un viaje de ida y vuelta al servidor. Sin
+SQLITE_PATH se usa un fichero temporal nuevo por proceso, que se borra al
+apagar la aplicación, sembrado con los catálogos, un administrador
+(SQLITE_ADMIN_EMAIL / SQLITE_ADMIN_PASSWORD; sin contraseña configurada se
+genera una aleatoria y se imprime una vez al sembrar) y SQLITE_SEED_BAHIAS
+bahías.
+"""
+import os
+import random
+import re
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from app.core.backends import Backend
+from app.core.sync import LIMITES_SQL
+
+# -------------------------- TIPOS --------------------------
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value.decode())
+
+sqlite3.register_converter("DATETIME2", _to_datetime)
+sqlite3.register_converter("DATETIME", _to_datetime)
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter("BIT", lambda value: value not in (b"0", b""))
+sqlite3.register_converter("DECIMAL", lambda value: float(value))
+
+# Columnas calculadas (MAX, CASE, ...) no tienen tipo declarado y llegan como texto
+_DATETIME_TEXT = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?$")
+
+def _convert_row(row):
+    if any(type(value) is str and len(value) >= 19 and _DATETIME_TEXT.match(value) for value in row):
+        return tuple(
+            datetime.fromisoformat(value)
+            if type(value) is str and len(value) >= 19 and _DATETIME_TEXT.match(value) else value
+            for value in row
+        )
+    return row
+
+# -------------------------- ESQUEMA --------------------------
+
+_AHORA = "(datetime('now', 'localtime'))"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS usuarios (
+    id VARCHAR(36) PRIMARY KEY,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    nombre VARCHAR(255) NOT NULL,
+    hash_contrasena VARCHAR(255) NOT NULL,
+    tipo_usuario VARCHAR(50) NOT NULL CHECK (tipo_usuario IN ('administrador', 'operador', 'planificador', 'supervisor', 'administrador_ti')),
+    activo BIT DEFAULT 1,
+    fecha_registro DATETIME2 DEFAULT {_AHORA},
+    fecha_ultima_modificacion DATETIME2 DEFAULT {_AHORA},
+    creado_por VARCHAR(36) NULL
+);
+
+CREATE TABLE IF NOT EXISTS tipos_bahia (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codigo VARCHAR(50) UNIQUE NOT NULL,
+    nombre VARCHAR(100) NOT NULL,
+    descripcion TEXT,
+    activo BIT DEFAULT 1,
+    fecha_creacion DATETIME2 DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS estados_bahia (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codigo VARCHAR(50) UNIQUE NOT NULL,
+    nombre VARCHAR(100) NOT NULL,
+    descripcion TEXT,
+    color VARCHAR(7),
+    activo BIT DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS bahias (
+    id VARCHAR(36) PRIMARY KEY,
+    numero INT UNIQUE NOT NULL,
+    tipo_bahia_id INT NOT NULL REFERENCES tipos_bahia(id),
+    estado_bahia_id INT NOT NULL REFERENCES estados_bahia(id),
+    capacidad_maxima DECIMAL(10,2),
+    ubicacion VARCHAR(255),
+    observaciones TEXT,
+    activo BIT DEFAULT 1,
+    fecha_creacion DATETIME2 DEFAULT {_AHORA},
+    fecha_ultima_modificacion DATETIME2 DEFAULT {_AHORA},
+    creado_por VARCHAR(36) REFERENCES usuarios(id),
+    version BIGINT
+);
+
+CREATE TABLE IF NOT EXISTS reservas (
+    id VARCHAR(36) PRIMARY KEY,
+    bahia_id VARCHAR(36) NOT NULL REFERENCES bahias(id),
+    usuario_id VARCHAR(36) NOT NULL REFERENCES usuarios(id),
+    fecha_hora_inicio DATETIME2 NOT NULL,
+    fecha_hora_fin DATETIME2 NOT NULL,
+    estado VARCHAR(20) DEFAULT 'activa' CHECK (estado IN ('activa', 'completada', 'cancelada')),
+    vehiculo_placa VARCHAR(20),
+    conductor_nombre VARCHAR(255),
+    conductor_telefono VARCHAR(20),
+    conductor_documento VARCHAR(50),
+    mercancia_tipo VARCHAR(255),
+    mercancia_peso DECIMAL(10,2),
+    mercancia_descripcion TEXT,
+    observaciones TEXT,
+    fecha_creacion DATETIME2 DEFAULT {_AHORA},
+    fecha_cancelacion DATETIME2 NULL,
+    fecha_completacion DATETIME2 NULL,
+    cancelado_por VARCHAR(36) REFERENCES usuarios(id),
+    motivo_cancelacion TEXT,
+    version BIGINT,
+    CHECK (fecha_hora_fin > fecha_hora_inicio)
+);
+
+CREATE TABLE IF NOT EXISTS historial_estados_bahia (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bahia_id VARCHAR(36) NOT NULL,
+    estado_anterior_id INT,
+    estado_nuevo_id INT NOT NULL,
+    usuario_id VARCHAR(36) NOT NULL,
+    motivo TEXT,
+    fecha_cambio DATETIME2 DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS mantenimientos (
+    id VARCHAR(36) PRIMARY KEY,
+    bahia_id VARCHAR(36) NOT NULL REFERENCES bahias(id),
+    tipo_mantenimiento VARCHAR(20) NOT NULL CHECK (tipo_mantenimiento IN ('preventivo', 'correctivo', 'emergencia')),
+    descripcion TEXT NOT NULL,
+    fecha_inicio DATETIME2 NOT NULL,
+    fecha_fin_programada DATETIME2 NOT NULL,
+    fecha_fin_real DATETIME2 NULL,
+    estado VARCHAR(20) DEFAULT 'programado' CHECK (estado IN ('programado', 'en_progreso', 'completado', 'cancelado')),
+    tecnico_responsable VARCHAR(255),
+    costo DECIMAL(10,2),
+    observaciones TEXT,
+    usuario_registro VARCHAR(36) NOT NULL REFERENCES usuarios(id),
+    fecha_registro DATETIME2 DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS incidencias (
+    id VARCHAR(36) PRIMARY KEY,
+    bahia_id VARCHAR(36) REFERENCES bahias(id),
+    reserva_id VARCHAR(36) REFERENCES reservas(id),
+    tipo_incidencia VARCHAR(20) NOT NULL CHECK (tipo_incidencia IN ('retraso', 'dano', 'accidente', 'otro')),
+    descripcion TEXT NOT NULL,
+    severidad VARCHAR(20) NOT NULL CHECK (severidad IN ('baja', 'media', 'alta', 'critica')),
+    estado VARCHAR(20) DEFAULT 'abierta' CHECK (estado IN ('abierta', 'en_proceso', 'resuelta', 'cerrada')),
+    fecha_incidencia DATETIME2 NOT NULL,
+    fecha_resolucion DATETIME2 NULL,
+    reportado_por VARCHAR(36) NOT NULL REFERENCES usuarios(id),
+    asignado_a VARCHAR(36) REFERENCES usuarios(id),
+    resolucion TEXT,
+    fecha_registro DATETIME2 DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS uso_diario_bahias (
+    fecha DATE NOT NULL,
+    bahia_id VARCHAR(36) NOT NULL,
+    tipo_bahia_id INT NOT NULL,
+    total_reservas INT NOT NULL DEFAULT 0,
+    reservas_completadas INT NOT NULL DEFAULT 0,
+    reservas_canceladas INT NOT NULL DEFAULT 0,
+    minutos_totales INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, bahia_id)
+);
+
+CREATE TABLE IF NOT EXISTS registros_eliminados (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tabla VARCHAR(50) NOT NULL,
+    registro_id VARCHAR(36) NOT NULL,
+    usuario_id VARCHAR(36) NULL,
+    fecha_eliminacion DATETIME2 DEFAULT {_AHORA},
+    version BIGINT
+);
+
+-- ROWVERSION: contador global de la base de datos
+CREATE TABLE IF NOT EXISTS _rowversion (valor BIGINT NOT NULL);
+
+CREATE INDEX IF NOT EXISTS idx_bahias_estado ON bahias(estado_bahia_id);
+CREATE INDEX IF NOT EXISTS idx_bahias_version ON bahias(version);
+CREATE INDEX IF NOT EXISTS idx_reservas_bahia_estado_inicio ON reservas(bahia_id, estado, fecha_hora_inicio);
+CREATE INDEX IF NOT EXISTS idx_reservas_usuario ON reservas(usuario_id);
+CREATE INDEX IF NOT EXISTS idx_reservas_fecha_inicio ON reservas(fecha_hora_inicio);
+CREATE INDEX IF NOT EXISTS idx_reservas_version ON reservas(version);
+CREATE INDEX IF NOT EXISTS idx_mantenimientos_bahia_estado_inicio ON mantenimientos(bahia_id, estado, fecha_inicio);
+CREATE INDEX IF NOT EXISTS idx_incidencias_estado ON incidencias(estado);
+CREATE INDEX IF NOT EXISTS idx_registros_eliminados_tabla_version ON registros_eliminados(tabla, version);
+
+CREATE TRIGGER IF NOT EXISTS tr_bahias_cambio_estado
+AFTER UPDATE OF estado_bahia_id ON bahias
+WHEN NEW.estado_bahia_id != OLD.estado_bahia_id
+BEGIN
+    INSERT INTO historial_estados_bahia (bahia_id, estado_anterior_id, estado_nuevo_id, usuario_id, motivo)
+    VALUES (NEW.id, OLD.estado_bahia_id, NEW.estado_bahia_id, NEW.creado_por, 'Cambio automático de estado');
+END;
+
+CREATE TRIGGER IF NOT EXISTS tr_bahias_eliminadas AFTER DELETE ON bahias
+BEGIN
+    INSERT INTO registros_eliminados (tabla, registro_id) VALUES ('bahias', OLD.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tr_reservas_eliminadas AFTER DELETE ON reservas
+BEGIN
+    INSERT INTO registros_eliminados (tabla, registro_id, usuario_id) VALUES ('reservas', OLD.id, OLD.usuario_id);
+END;
+
+CREATE VIEW IF NOT EXISTS vista_estadisticas_bahias AS
+SELECT b.id, b.numero, tb.nombre AS tipo_bahia, eb.nombre AS estado_actual,
+       COUNT(DISTINCT r.id) AS total_reservas,
+       COUNT(DISTINCT CASE WHEN r.estado = 'completada' THEN r.id END) AS reservas_completadas,
+       AVG(CAST(ROUND((julianday(r.fecha_hora_fin) - julianday(r.fecha_hora_inicio)) * 1440) AS INTEGER)) AS duracion_promedio_minutos,
+       MAX(r.fecha_hora_fin) AS ultima_utilizacion
+FROM bahias b
+LEFT JOIN tipos_bahia tb ON b.tipo_bahia_id = tb.id
+LEFT JOIN estados_bahia eb ON b.estado_bahia_id = eb.id
+LEFT JOIN reservas r ON b.id = r.bahia_id
+WHERE b.activo = 1
+GROUP BY b.id, b.numero, tb.nombre, eb.nombre;
+""" + "".join(f"""
+CREATE TRIGGER IF NOT EXISTS tr_{tabla}_version_insert AFTER INSERT ON {tabla}
+BEGIN
+    UPDATE _rowversion SET valor = valor + 1;
+    UPDATE {tabla} SET version = (SELECT valor FROM _rowversion) WHERE rowid = NEW.rowid;
+END;
+""" + (f"""
+CREATE TRIGGER IF NOT EXISTS tr_{tabla}_version_update AFTER UPDATE ON {tabla}
+WHEN NEW.version IS OLD.version
+BEGIN
+    UPDATE _rowversion SET valor = valor + 1;
+    UPDATE {tabla} SET version = (SELECT valor FROM _rowversion) WHERE rowid = NEW.rowid;
+END;
+""" if tabla != "registros_eliminados" else "") for tabla in ("bahias", "reservas", "registros_eliminados"))
+
+TIPOS_BAHIA = [
+    ("estandar", "Estándar", "Bahía de carga estándar para mercancía general"),
+    ("refrigerada", "Refrigerada", "Bahía con sistema de refrigeración"),
+    ("peligrosos", "Peligrosos", "Bahía para materiales peligrosos"),
+    ("sobremedida", "Sobremédida", "Bahía para carga de gran tamaño"),
+    ("prioritaria", "Prioritaria", "Bahía de acceso prioritario"),
+]
+
+ESTADOS_BAHIA = [
+    ("libre", "Libre", "Bahía disponible para reserva", "#4CAF50"),
+    ("reservada", "Reservada", "Bahía reservada pendiente de uso", "#FF9800"),
+    ("en_uso", "En Uso", "Bahía actualmente en operación", "#F44336"),
+    ("mantenimiento", "Mantenimiento", "Bahía en mantenimiento", "#2196F3"),
+]
+
+def _seed(raw, bahias, admin_email, admin_password):
+    # Import diferido: hashing arrastra passlib y solo hace falta al sembrar
+    from app.core.hashing import hash_password
+
+    raw.executemany("INSERT INTO tipos_bahia (codigo, nombre, descripcion) VALUES (?, ?, ?)", TIPOS_BAHIA)
+    raw.executemany("INSERT INTO estados_bahia (codigo, nombre, descripcion, color) VALUES (?, ?, ?, ?)", ESTADOS_BAHIA)
+    raw.execute("INSERT INTO _rowversion VALUES (0)")
+    admin_id = str(uuid.uuid5(uuid.NAMESPACE_URL, "bahias/usuario/admin"))
+    raw.execute(
+        "INSERT INTO usuarios (id, email, nombre, hash_contrasena, tipo_usuario) VALUES (?, ?, ?, ?, 'administrador')",
+        (admin_id, admin_email, "Administrador", hash_password(admin_password))
+    )
+    # Ids deterministas para que las pruebas de carga sean reproducibles
+    raw.executemany(
+        """INSERT INTO bahias (id, numero, tipo_bahia_id, estado_bahia_id, capacidad_maxima, ubicacion, creado_por)
+           VALUES (?, ?, ?, 1, 25.0, ?, ?)""",
+        [(str(uuid.uuid5(uuid.NAMESPACE_URL, f"bahias/bahia/{numero}")), numero,
+          1 + (numero - 1) % len(TIPOS_BAHIA), f"Muelle {(numero - 1) // 10 + 1}", admin_id)
+         for numero in range(1, bahias + 1)]
+    )
+
+# -------------------------- TRADUCCIÓN T-SQL --------------------------
+
+_COMMENTS = re.compile(r"--[^\n]*")
+_NOCOUNT = re.compile(r"\bSET\s+NOCOUNT\s+ON\s*;?", re.IGNORECASE)
+_LOCK = r"(?:NOLOCK|UPDLOCK|HOLDLOCK|ROWLOCK|TABLOCKX?|READPAST)"
+_HINTS = re.compile(rf"\bWITH\s*\(\s*{_LOCK}(?:\s*,\s*{_LOCK})*\s*\)", re.IGNORECASE)
+_GETDATE = re.compile(r"\bGETDATE\s*\(\s*\)", re.IGNORECASE)
+_ISNULL = re.compile(r"\bISNULL\s*\(", re.IGNORECASE)
+_UNICODE = re.compile(r"\bN'")
+_TOP = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s*(?:\(\s*([^)]+?)\s*\)|(\d+))\s+", re.IGNORECASE)
+_OFFSET = re.compile(r"\bOFFSET\s+(\S+)\s+ROWS\s+FETCH\s+(?:NEXT|FIRST)\s+(\S+)\s+ROWS\s+ONLY", re.IGNORECASE)
+_MARKER = re.compile(r"\?(\d+)")
+_AS = re.compile(r"\s+AS\s+", re.IGNORECASE)
+_UNSUPPORTED = re.compile(
+    r"^\s*(?:DECLARE|EXEC|EXECUTE|IF|BEGIN|MERGE|WHILE|THROW)\b|@@|\bOUTPUT\s+inserted\.", re.IGNORECASE
+)
+
+_DATEDIFF = {"MINUTE": 1440, "MI": 1440, "N": 1440, "HOUR": 24, "HH": 24, "SECOND": 86400, "SS": 86400, "S": 86400}
+_DATEADD = {"DAY": "days", "DD": "days", "D": "days", "HOUR": "hours", "HH": "hours",
+            "MINUTE": "minutes", "MI": "minutes", "MONTH": "months", "MM": "months", "YEAR": "years", "YYYY": "years"}
+
+def _scan(sql, start, stop_chars):
+    """Posiciones de stop_chars fuera de comillas y paréntesis a partir de start"""
+    depth, quote = 0, False
+    for i in range(start, len(sql)):
+        ch = sql[i]
+        if ch == "'":
+            quote = not quote
+        elif quote:
+            continue
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            if depth == 0:
+                yield i
+                return
+            depth -= 1
+        elif depth == 0 and ch in stop_chars:
+            yield i
+
+def _split(sql, sep):
+    parts, last = [], 0
+    for i in _scan(sql, 0, sep):
+        if sql[i] == ")":
+            break
+        parts.append(sql[last:i])
+        last = i + 1
+    parts.append(sql[last:])
+    return parts
+
+def _calls(sql, name, rewrite):
+    """Sustituye cada llamada name(...) por rewrite(argumentos ya traducidos)"""
+    pattern = re.compile(rf"\b{name}\s*\(", re.IGNORECASE)
+    out, pos = [], 0
+    while True:
+        match = pattern.search(sql, pos)
+        if match is None:
+            break
+        end = next(i for i in _scan(sql, match.end(), "") if sql[i] == ")")
+        out.append(sql[pos:match.start()])
+        out.append(rewrite(_calls(sql[match.end():end], name, rewrite)))
+        pos = end + 1
+    out.append(sql[pos:])
+    return "".join(out)
+
+def _cast(inner):
+    separadores = list(_AS.finditer(inner))
+    if not separadores:
+        raise sqlite3.NotSupportedError(f"CAST sin tipo: {inner}")
+    expr, tipo = inner[:separadores[-1].start()], inner[separadores[-1].end():].strip().upper()
+    if tipo == "DATE":
+        return f"date({expr})"
+    if tipo.startswith(("BIGINT", "INT", "SMALLINT", "TINYINT", "BIT")):
+        return f"CAST({expr} AS INTEGER)"
+    if tipo.startswith(("DECIMAL", "NUMERIC", "FLOAT", "REAL", "MONEY")):
+        return f"CAST({expr} AS REAL)"
+    if tipo.startswith(("VARCHAR", "NVARCHAR", "CHAR", "NCHAR")):
+        return f"CAST({expr} AS TEXT)"
+    if tipo.startswith(("DATETIME", "BINARY", "VARBINARY")):
+        return expr
+    raise sqlite3.NotSupportedError(f"CAST a {tipo} no soportado por el backend sqlite")
+
+def _datediff(inner):
+    unidad, desde, hasta = (part.strip() for part in _split(inner, ","))
+    unidad = unidad.upper()
+    if unidad in ("DAY", "DD", "D"):
+        return f"CAST(julianday(date({hasta})) - julianday(date({desde})) AS INTEGER)"
+    if unidad not in _DATEDIFF:
+        raise sqlite3.NotSupportedError(f"DATEDIFF({unidad}) no soportado por el backend sqlite")
+    return f"CAST(ROUND((julianday({hasta}) - julianday({desde})) * {_DATEDIFF[unidad]}) AS INTEGER)"
+
+def _dateadd(inner):
+    unidad, cantidad, fecha = (part.strip() for part in _split(inner, ","))
+    unidad = unidad.upper()
+    if unidad not in _DATEADD:
+        raise sqlite3.NotSupportedError(f"DATEADD({unidad}) no soportado por el backend sqlite")
+    return f"datetime({fecha}, ({cantidad}) || ' {_DATEADD[unidad]}')"
+
+def _concat(inner):
+    return "(" + " || ".join(f"IFNULL({part.strip()}, '')" for part in _split(inner, ",")) + ")"
+
+@lru_cache(maxsize=1024)
+def translate(query):
+    """
+    T-SQL -> lista de (sentencia SQLite, índices de los parámetros que usa).
+    Cada %s se numera al principio para poder reordenarlos (OFFSET/FETCH
+    lleva los parámetros al revés que LIMIT/OFFSET).
+    """
+    contador = iter(range(10_000))
+    sql = re.sub(r"%s", lambda _: f"?{next(contador)}", query)
+    sql = _COMMENTS.sub("", sql)
+    sql = _NOCOUNT.sub("", sql)
+    sql = _HINTS.sub("", sql)
+    sql = _GETDATE.sub("datetime('now', 'localtime')", sql)
+    sql = _ISNULL.sub("IFNULL(", sql)
+    sql = _UNICODE.sub("'", sql)
+    sql = _calls(sql, "CAST", _cast)
+    sql = _calls(sql, "DATEDIFF", _datediff)
+    sql = _calls(sql, "DATEADD", _dateadd)
+    sql = _calls(sql, "CONCAT", _concat)
+    sql = _OFFSET.sub(r"LIMIT \2 OFFSET \1", sql)
+
+    sentencias = []
+    for sentencia in _split(sql, ";"):
+        if not sentencia.strip():
+            continue
+        if _UNSUPPORTED.search(sentencia):
+            raise sqlite3.NotSupportedError(
+                f"Sentencia T-SQL no soportada por el backend sqlite: {sentencia.strip()[:80]}"
+            )
+        top = _TOP.match(sentencia)
+        if top:
+            sentencia = top.group(1) + sentencia[top.end():].rstrip() + f" LIMIT {top.group(2) or top.group(3)}"
+        indices = [int(i) for i in _MARKER.findall(sentencia)]
+        sentencias.append((_MARKER.sub("?", sentencia), tuple(indices)))
+    return tuple(sentencias)
+
+# -------------------------- EJECUCIÓN --------------------------
+
+def _run(raw, query, params):
+    """Ejecuta un lote traducido: ([(description, filas)], rowcount de la última escritura)"""
+    resultados, rowcount = [], None
+    for sentencia, indices in translate(query):
+        cursor = raw.execute(sentencia, [params[i] for i in indices])
+        if cursor.description:
+            resultados.append((cursor.description, [_convert_row(row) for row in cursor.fetchall()]))
+        else:
+            rowcount = cursor.rowcount
+    return resultados, rowcount
+
+def _one(raw, sql, params=()):
+    return raw.execute(sql, params).fetchone()
+
+def _begin(raw):
+    # UPDLOCK/HOLDLOCK de SQL Server: la transacción toma el bloqueo de escritura desde el principio
+    if not raw.in_transaction:
+        raw.execute("BEGIN IMMEDIATE")
+
+def _description(columns):
+    return tuple((column, None, None, None, None, None, None) for column in columns)
+
+def _registrar_uso(raw, reserva_id, evento):
+    """sp_registrar_uso_diario"""
+    fila = _one(raw, """
+        SELECT date(r.fecha_hora_inicio), r.bahia_id, b.tipo_bahia_id,
+               CAST(ROUND((julianday(r.fecha_hora_fin) - julianday(r.fecha_hora_inicio)) * 1440) AS INTEGER)
+        FROM reservas r INNER JOIN bahias b ON r.bahia_id = b.id
+        WHERE r.id = ?
+    """, (reserva_id,))
+    if fila is None:
+        return
+    fecha, bahia_id, tipo_bahia_id, minutos = fila
+    creada, completada, cancelada = (int(evento == nombre) for nombre in ("creada", "completada", "cancelada"))
+    raw.execute("""
+        INSERT INTO uso_diario_bahias (fecha, bahia_id, tipo_bahia_id, total_reservas,
+                                       reservas_completadas, reservas_canceladas, minutos_totales)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (fecha, bahia_id) DO UPDATE SET
+            total_reservas = total_reservas + excluded.total_reservas,
+            reservas_completadas = reservas_completadas + excluded.reservas_completadas,
+            reservas_canceladas = reservas_canceladas + excluded.reservas_canceladas,
+            minutos_totales = minutos_totales + excluded.minutos_totales
+    """, (fecha, bahia_id, tipo_bahia_id, creada, completada, cancelada, creada * minutos))
+
+def _exec_uso_diario(raw, query, params):
+    _begin(raw)
+    _registrar_uso(raw, *params)
+    return [], 1
+
+_COLUMNAS_RESERVA = (
+    "id", "bahia_id", "usuario_id", "fecha_hora_inicio", "fecha_hora_fin", "estado",
+    "vehiculo_placa", "conductor_nombre", "conductor_telefono", "conductor_documento",
+    "mercancia_tipo", "mercancia_peso", "mercancia_descripcion", "observaciones",
+    "fecha_creacion", "fecha_cancelacion", "fecha_completacion", "cancelado_por",
+    "motivo_cancelacion",
+)
+_COLUMNAS_CREAR_RESERVA = ("resultado", *_COLUMNAS_RESERVA, "numero_bahia", "estado_bahia_id",
+                           "usuario_nombre", "usuario_email")
+
+def _crear_reserva(raw, query, params):
+    """Lote CREAR_RESERVA_SQL de app.routes.reservas (valida, inserta, cambia estado y hace commit)"""
+    reserva_id, bahia_id, usuario_id, inicio, fin, estado_mantenimiento, estado_reservada = params[:7]
+    origenes, datos = params[7:-8], params[-8:]
+    _begin(raw)
+    try:
+        fila = _one(raw, "SELECT estado_bahia_id FROM bahias WHERE id = ? AND activo = 1", (bahia_id,))
+        if fila is None:
+            resultado = "no_encontrada"
+        elif fila[0] == estado_mantenimiento:
+            resultado = "mantenimiento"
+        elif _one(raw, """
+            SELECT 1 FROM reservas WHERE bahia_id = ? AND estado = 'activa'
+            AND fecha_hora_inicio < ? AND fecha_hora_fin > ?
+        """, (bahia_id, fin, inicio)):
+            resultado = "conflicto"
+        elif _one(raw, """
+            SELECT 1 FROM mantenimientos WHERE bahia_id = ? AND estado IN ('programado', 'en_progreso')
+            AND fecha_inicio < ? AND fecha_fin_programada > ?
+        """, (bahia_id, fin, inicio)):
+            resultado = "conflicto_mantenimiento"
+        else:
+            resultado = "ok"
+            raw.execute(f"""
+                INSERT INTO reservas ({", ".join(_COLUMNAS_RESERVA[:15])})
+                VALUES (?, ?, ?, ?, ?, 'activa', ?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+            """, (reserva_id, bahia_id, usuario_id, inicio, fin, *datos))
+            raw.execute(f"""
+                UPDATE bahias SET estado_bahia_id = ?, fecha_ultima_modificacion = datetime('now', 'localtime')
+                WHERE id = ? AND estado_bahia_id IN ({", ".join("?" * len(origenes))})
+            """, (estado_reservada, bahia_id, *origenes))
+            _registrar_uso(raw, reserva_id, "creada")
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+
+    if resultado != "ok":
+        return [(_description(_COLUMNAS_CREAR_RESERVA), [(resultado,) + (None,) * (len(_COLUMNAS_CREAR_RESERVA) - 1)])], None
+    cursor = raw.execute(f"""
+        SELECT 'ok' AS resultado, {", ".join("r." + columna for columna in _COLUMNAS_RESERVA)},
+               b.numero AS numero_bahia, b.estado_bahia_id, u.nombre AS usuario_nombre, u.email AS usuario_email
+        FROM reservas r
+        LEFT JOIN bahias b ON r.bahia_id = b.id
+        LEFT JOIN usuarios u ON r.usuario_id = u.id
+        WHERE r.id = ?
+    """, (reserva_id,))
+    return [(cursor.description, [_convert_row(row) for row in cursor.fetchall()])], None
+
+def _transicion(raw, query, params):
+    """Lote de app.core.bay_state.transition: UPDATE con OUTPUT del estado anterior"""
+    destino, bahia_id, *origenes = params
+    _begin(raw)
+    condicion = f"id = ? AND activo = 1 AND estado_bahia_id IN ({', '.join('?' * len(origenes))})"
+    fila = _one(raw, f"SELECT numero, estado_bahia_id FROM bahias WHERE {condicion}", (bahia_id, *origenes))
+    filas = []
+    if fila is not None:
+        raw.execute(
+            f"UPDATE bahias SET estado_bahia_id = ?, fecha_ultima_modificacion = datetime('now', 'localtime') WHERE {condicion}",
+            (destino, bahia_id, *origenes)
+        )
+        filas.append((fila[0], fila[1], destino))
+    return [(_description(("numero", "estado_anterior_id", "estado_nuevo_id")), filas)], len(filas)
+
+def _cambios(raw, query, params):
+    """Lote de app.core.sync.fetch_changes: el watermark sale del contador de _rowversion"""
+    desde = int(params[0])
+    # Lo confirmado nunca supera el contador visible: no hay transacciones
+    # abiertas con versiones menores que otras ya confirmadas
+    watermark = _one(raw, "SELECT valor FROM _rowversion")[0]
+    if not query.startswith(LIMITES_SQL):
+        raise sqlite3.NotSupportedError("Lote de cambios sin la cabecera app.core.sync.LIMITES_SQL")
+    resto = query[len(LIMITES_SQL):]
+    resto = resto.replace("@desde", str(desde)).replace("@hasta", str(watermark + 1))
+    resultados, rowcount = _run(raw, resto, params[1:])
+    return [(_description(("watermark",)), [(watermark,)])] + resultados, rowcount
+
+# Lotes con variables o control de flujo, reconocidos por un fragmento de su SQL
+_BATCHES = (
+    ("DECLARE @resultado", _crear_reserva),
+    ("DECLARE @cambio TABLE", _transicion),
+    (LIMITES_SQL, _cambios),
+    ("EXEC sp_registrar_uso_diario", _exec_uso_diario),
+)
+
+@lru_cache(maxsize=1024)
+def _batch_for(query):
+    for fragment, handler in _BATCHES:
+        if fragment in query:
+            return handler
+    return _run
+
+class SQLiteCursor:
+    """Cursor con la API de pymssql que usan los routers"""
+
+    def __init__(self, conn, as_dict=False):
+        self.conn = conn
+        self.as_dict = as_dict
+        self.description = None
+        self.rowcount = -1
+        self._resultados = []
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self.conn.backend.delay()
+        if params is None:
+            params = ()
+        elif not isinstance(params, (tuple, list)):
+            params = (params,)
+        self._resultados, rowcount = _batch_for(query)(self.conn.raw, query, tuple(params))
+        self._load()
+        if rowcount is not None:
+            self.rowcount = rowcount
+        elif self.description is not None:
+            self.rowcount = len(self._rows)
+        else:
+            self.rowcount = -1
+
+    def _load(self):
+        if not self._resultados:
+            self.description, self._rows = None, []
+            return
+        self.description, rows = self._resultados.pop(0)
+        if self.as_dict:
+            columns = [column[0] for column in self.description]
+            rows = [dict(zip(columns, row)) for row in rows]
+        self._rows = rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def nextset(self):
+        if not self._resultados:
+            return None
+        self._load()
+        return True
+
+    def close(self):
+        self._resultados, self._rows = [], []
+
+class SQLiteConnection:
+    def __init__(self, backend, raw):
+        self.backend = backend
+        self.raw = raw
+
+    def cursor(self, as_dict=False):
+        return SQLiteCursor(self, as_dict=as_dict)
+
+    def commit(self):
+        self.backend.delay()
+        self.raw.commit()
+
+    def rollback(self):
+        self.backend.delay()
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+
+    def __init__(self, path=None, latency=0.0, jitter=0.0, seed=42, bahias=50,
+                 admin_email="admin@example.com", admin_password=None):
+        self.path = path
+        self.admin_email = admin_email
+        self.admin_password = admin_password
+        self._temporary = False
+        self.latency = latency
+        self.jitter = jitter
+        self.bahias = bahias
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def delay(self):
+        """Latencia inyectada de un viaje de ida y vuelta"""
+        if self.jitter > 0:
+            with self._random_lock:
+                extra = self._random.uniform(0, self.jitter)
+        else:
+            extra = 0.0
+        if self.latency + extra > 0:
+            time.sleep(self.latency + extra)
+
+    def _ensure_schema(self):
+        with self._init_lock:
+            if self._ready:
+                return
+            if self.path is None:
+                fd, self.path = tempfile.mkstemp(prefix="bahias-", suffix=".sqlite3")
+                os.close(fd)
+                self._temporary = True
+            raw = sqlite3.connect(self.path, timeout=30)
+            try:
+                raw.execute("PRAGMA journal_mode = WAL")
+                raw.executescript(SCHEMA)
+                raw.execute("BEGIN IMMEDIATE")
+                if _one(raw, "SELECT COUNT(*) FROM estados_bahia")[0] == 0:
+                    password = self.admin_password
+                    if not password:
+                        password = secrets.token_urlsafe(12)
+                        print(f"🔑 Contraseña generada para {self.admin_email}: {password}")
+                    _seed(raw, self.bahias, self.admin_email, password)
+                    print(f"✅ Base de datos sqlite sembrada en {self.path}: {self.bahias} bahías")
+                raw.commit()
+            finally:
+                raw.close()
+            self._ready = True
+
+    def connect(self):
+        self._ensure_schema()
+        raw = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        raw.execute("PRAGMA synchronous = NORMAL")
+        return SQLiteConnection(self, raw)
+
+    def close(self):
+        """Borra el fichero temporal (y los de WAL) si lo creó este backend"""
+        with self._init_lock:
+            if not self._temporary:
+                return
+            for path in (self.path, self.path + "-wal", self.path + "-shm"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"⚠️ No se pudo borrar {path}: {e}")
+            self._temporary = False
+            self._ready = False
+            self.path = None
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "fichero": self.path,
+            "latencia_ms": self.latency * 1000,
+            "jitter_ms": self.jitter * 1000,
+        }
@@ -0,0 +1,100 @@
+"""
+Sincronización incremental por marca de agua (watermark).
+
+bahias y reservas tienen una columna ROWVERSION `version` que SQL Server
+incrementa en cada INSERT/UPDATE, y los DELETE quedan en
+registros_eliminados por trigger. El cliente guarda el watermark de la
+última respuesta y en la siguiente pide solo lo que cambió después, así
+que el tráfico depende de cuántas filas cambian y no del tamaño de la tabla.
+
+El watermark nunca supera MIN_ACTIVE_ROWVERSION() - 1: una transacción que
+todavía no ha hecho commit puede tener una versión menor que otra ya
+confirmada, y sin ese tope el cliente se la saltaría para siempre.
+"""
+from fastapi import HTTPException
+from app.core.rows import row_mapper
+
+# Cabecera de cada lote de cambios: fija @desde/@hasta y devuelve el watermark.
+# Pública para que el backend sqlite separe el resto del lote sin analizar el SQL
+LIMITES_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @desde BINARY(8) = CAST(CAST(%s AS BIGINT) AS BINARY(8));
+    DECLARE @hasta BINARY(8) = MIN_ACTIVE_ROWVERSION();
+    SELECT CAST(@hasta AS BIGINT) - 1 AS watermark;
+"""
+
+def _with_version(query, version_expr):
+    """Añade la versión de la fila como primera columna del SELECT"""
+    head, sep, rest = query.partition("SELECT")
+    if not sep or head.strip():
+        raise ValueError("La consulta de cambios debe empezar por SELECT")
+    return f"{head}SELECT CAST({version_expr} AS BIGINT) AS version,{rest}"
+
+async def _rows(cursor):
+    columns = [col[0] for col in cursor.description]
+    rows = await cursor.fetchall()
+    return [row if isinstance(row, dict) else dict(zip(columns, row)) for row in rows]
+
+async def fetch_changes(cursor, query, params, version_expr, tabla, desde, limit, model,
+                        tombstone=None, eliminado_por_id=None):
+    """
+    Filas de `query` cambiadas después de `desde` más las bajas de `tabla`.
+
+    query termina en su WHERE (como en Keyset.paginate); se le añaden la
+    versión, el rango y el orden. Todo va en un único lote con tres
+    resultados. tombstone(fila) indica si una fila que sigue existiendo
+    cuenta como baja (p. ej. bahías con activo = 0). eliminado_por_id
+    restringe las bajas registradas a las de ese usuario.
+
+    Devuelve {"watermark", "hay_mas", "cambios", "eliminados"} con los
+    cambios ya mapeados a `model` (app.core.rows); con hay_mas
+    el cliente debe repetir la llamada con el nuevo watermark.
+    """
+    if desde < 0:
+        raise HTTPException(status_code=400, detail="Watermark inválido")
+
+    batch = LIMITES_SQL + _with_version(query, version_expr) + f"""
+        AND {version_expr} > @desde AND {version_expr} < @hasta
+        ORDER BY {version_expr}
+        OFFSET 0 ROWS FETCH NEXT %s ROWS ONLY;
+
+        SELECT TOP (%s) CAST(version AS BIGINT) AS version, registro_id
+        FROM registros_eliminados
+        WHERE tabla = %s AND version > @desde AND version < @hasta
+    """
+    batch_params = [desde, *params, limit + 1, limit + 1, tabla]
+    if eliminado_por_id is not None:
+        batch += " AND usuario_id = %s"
+        batch_params.append(eliminado_por_id)
+    batch += " ORDER BY version;"
+
+    await cursor.execute(batch, tuple(batch_params), name=f"cambios:{tabla}")
+    watermark = (await _rows(cursor))[0]["watermark"]
+    await cursor.nextset()
+    mapper = row_mapper(cursor, model)
+    filas = await _rows(cursor)
+    await cursor.nextset()
+    bajas = await _rows(cursor)
+
+    # Mezclar cambios y bajas por versión y cortar en `limit`
+    eventos = [(fila["version"], fila, None) for fila in filas]
+    eventos += [(baja["version"], None, baja["registro_id"]) for baja in bajas]
+    eventos.sort(key=lambda evento: evento[0])
+    hay_mas = len(eventos) > limit
+    if hay_mas:
+        eventos = eventos[:limit]
+        watermark = eventos[-1][0]
+    elif desde > watermark:
+        # El cliente ya iba por delante (p. ej. otra réplica); no retroceder
+        watermark = desde
+
+    cambios, eliminados = [], []
+    for _, fila, registro_id in eventos:
+        if fila is None:
+            eliminados.append(registro_id)
+        elif tombstone is not None and tombstone(fila):
+            eliminados.append(fila["id"])
+        else:
+            cambios.append(mapper.one(fila))
+
+    return {"watermark": watermark, "hay_mas": hay_mas, "cambios": cambios, "eliminados": eliminados}
@@ -0,0 +1,120 @@
+"""
+Desglose de tiempos por petición en la cabecera Server-Timing.
+
+Solo se activa si la petición trae la cabecera X-Server-Timing con el valor
+de SERVER_TIMING_TOKEN (o cualquier valor con DEBUG=true y sin token). Sin
+ella, cada punto de medición se queda en leer una ContextVar vacía.
+
+Fases medidas:
+- auth:      decodificación del JWT (verify_token)
+- db-espera: espera por una conexión del pool (get_db)
+- db:        cada cursor.execute, con el nombre lógico de la consulta
+- mapeo:     filas -> dicts del modelo (app.core.rows) y modelos pydantic
+- render:    serialización JSON de la respuesta
+- total:     hasta que sale el inicio de la respuesta
+
+Con "X-Server-Timing: <token>;detalle" se añade además la cabecera
+Server-Timing-Detalle con la lista de eventos en JSON (cada consulta por
+separado), para verla en las herramientas de desarrollo del navegador.
+"""
+import contextlib
+import contextvars
+import json
+import time
+from app.core.config import settings
+
+REQUEST_HEADER = b"x-server-timing"
+
+_current = contextvars.ContextVar("server_timing", default=None)
+
+class RequestTiming:
+    """Eventos (fase, duración en s, detalle) medidos durante una petición"""
+
+    __slots__ = ("events", "start")
+
+    def __init__(self):
+        self.events = []
+        self.start = time.perf_counter()
+
+    def header(self, total):
+        por_fase = {}
+        for fase, duracion, _ in self.events:
+            acumulado = por_fase.setdefault(fase, [0.0, 0])
+            acumulado[0] += duracion
+            acumulado[1] += 1
+        partes = []
+        for fase, (duracion, veces) in por_fase.items():
+            desc = f';desc="{veces} llamadas"' if veces > 1 else ""
+            partes.append(f"{fase};dur={duracion * 1000:.2f}{desc}")
+        partes.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(partes)
+
+    def detail(self):
+        return json.dumps(
+            [{"fase": fase, "ms": round(duracion * 1000, 3), "detalle": detalle}
+             for fase, duracion, detalle in self.events],
+            separators=(",", ":")
+        )
+
+def record(fase, duracion, detalle=None):
+    """Añade un evento a la petición en curso (no hace nada si no se pidió el desglose)"""
+    timing = _current.get()
+    if timing is not None:
+        timing.events.append((fase, duracion, detalle))
+
+@contextlib.contextmanager
+def timed(fase, detalle=None):
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.events.append((fase, time.perf_counter() - start, detalle))
+
+def _requested(headers):
+    """None si no se pidió; si no, si se pidió también el detalle"""
+    for name, value in headers:
+        if name == REQUEST_HEADER:
+            token, _, opciones = value.decode("latin-1").partition(";")
+            token = token.strip()
+            if settings.SERVER_TIMING_TOKEN:
+                if token != settings.SERVER_TIMING_TOKEN:
+                    return None
+            elif not settings.DEBUG:
+                return None
+            return opciones.strip() == "detalle"
+    return None
+
+class ServerTimingMiddleware:
+    """Middleware ASGI: activa la medición y añade las cabeceras a la respuesta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        detalle = _requested(scope["headers"])
+        if detalle is None:
+            return await self.app(scope, receive, send)
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - timing.start
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.header(total).encode("latin-1")))
+                if detalle:
+                    headers.append((b"server-timing-detalle", timing.detail().encode("utf-8")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
@@ -1,27 +1,367 @@
-import pymssql
+import asyncio
+import contextlib
+import functools
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
 from app.core.config import settings
+from app.core.backends import create_backend
+from app.core.metrics import (
+    DB_CONNECT, DB_CONNECT_ERRORS, DB_POOL_ACQUIRE, DB_POOL_CONNECTIONS,
+    DB_POOL_TIMEOUTS, DB_QUERY_DURATION, DB_QUERY_ERRORS, derive_query_name, registry
+)
+from app.core import roundtrips, timing
+from app.core.slow_queries import slow_query_log
+
+class PoolTimeoutError(Exception):
+    """No hubo conexión libre en el pool dentro del tiempo de espera"""
+    pass
+
+class ConnectionPool:
+    """
+    Pool de conexiones acotado y thread-safe.
+
+    Mantiene entre min_size y max_size conexiones abiertas, valida cada
+    conexión al prestarla (pre-ping), hace rollback al devolverla y cierra
+    las que llevan más de max_idle segundos sin usarse. La fábrica es
+    cualquier callable sin argumentos que devuelva una conexión DB-API,
+    lo que permite probar el pool con conexiones falsas.
+    """
+
+    def __init__(self, factory, min_size=1, max_size=10, timeout=30.0,
+                 max_idle=300.0, pre_ping=True, ping_query="SELECT 1"):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamaños de pool inválidos")
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.pre_ping = pre_ping
+        self.ping_query = ping_query
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (conexion, instante de devolución)
+        self._in_use = set()
+        self._size = 0
+        self._closed = False
+
+        # Estadísticas
+        self._created = 0
+        self._destroyed = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._ping_failures = 0
+
+    # -------------------------- CICLO DE VIDA --------------------------
+
+    def warmup(self):
+        """Abre conexiones hasta llegar a min_size"""
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._create()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+
+    def close(self):
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse"""
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn in idle:
+            self._destroy(conn)
+
+    # -------------------------- PRÉSTAMO --------------------------
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            conn = None
+            create = False
+            with self._lock:
+                if self._closed:
+                    raise PoolTimeoutError("El pool de conexiones está cerrado")
+                expired = self._collect_expired()
+                if self._idle:
+                    conn, _ = self._idle.pop()  # LIFO: la más reciente sigue caliente
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Tiempo de espera agotado ({timeout}s) esperando una conexión del pool"
+                        )
+                    if not waited:
+                        waited = True
+                        self._waits += 1
+                    self._lock.wait(remaining)
+                    continue
+
+            for old in expired:
+                self._destroy(old)
+
+            if create:
+                try:
+                    conn = self._create()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif self.pre_ping and not self._ping(conn):
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                self._in_use.add(id(conn))
+                self._checkouts += 1
+                wait = time.monotonic() - start
+                self._wait_time_total += wait
+                self._wait_time_max = max(self._wait_time_max, wait)
+            return conn
+
+    def release(self, conn, discard=False):
+        """Devuelve una conexión al pool, deshaciendo cualquier transacción abierta"""
+        with self._lock:
+            if id(conn) not in self._in_use:
+                return
+            self._in_use.discard(id(conn))
+
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._lock:
+            if not discard and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+                return
+            self._size -= 1
+            self._lock.notify()
+        self._destroy(conn)
+
+    # -------------------------- ESTADÍSTICAS --------------------------
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self._size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self._created,
+                "destroyed": self._destroyed,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "ping_failures": self._ping_failures,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 3),
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+                "wait_time_avg_ms": round(
+                    self._wait_time_total * 1000 / self._checkouts, 3
+                ) if self._checkouts else 0.0,
+            }
+
+    # -------------------------- AUXILIARES --------------------------
+
+    def _create(self):
+        start = time.perf_counter()
+        try:
+            conn = self.factory()
+        except Exception:
+            DB_CONNECT_ERRORS.inc()
+            raise
+        DB_CONNECT.observe((), time.perf_counter() - start)
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def _destroy(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._destroyed += 1
+
+    def _discard(self, conn):
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+        self._destroy(conn)
+
+    def _ping(self, conn):
+        try:
+            cursor = conn.cursor()
+            timed_execute(cursor, self.ping_query, name="pool_ping")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            with self._lock:
+                self._ping_failures += 1
+            return False
+
+    def _collect_expired(self):
+        """Saca del pool las conexiones ociosas vencidas (llamar con el lock tomado)"""
+        if self.max_idle is None or not self._idle:
+            return []
+        limit = time.monotonic() - self.max_idle
+        expired = []
+        # Las más antiguas están al principio de la cola
+        while self._idle and self._size > self.min_size and self._idle[0][1] < limit:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            expired.append(conn)
+        return expired
+
+# -------------------------- EJECUTOR ASÍNCRONO --------------------------
+
+# Ejecutor dedicado para las llamadas bloqueantes del driver, separado del
+# threadpool por defecto de anyio para que las consultas lentas no compitan
+# con el resto de tareas sync de FastAPI
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_EXECUTOR_WORKERS,
+    thread_name_prefix="db-executor"
+)
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """Ejecuta una llamada bloqueante del driver en el ejecutor de base de datos"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
+
+def timed_execute(cursor, query, params=None, name=None, route=None):
+    """
+    cursor.execute() midiendo su duración en db_query_duration_seconds y
+    dejando en slow_query_log las que pasan del umbral. name es el nombre
+    lógico de la consulta (si falta se deriva del SQL); route, la ruta que
+    la lanza, que hay que pasar porque aquí ya se está en db_executor.
+    """
+    labels = (name or derive_query_name(query),)
+    start = time.perf_counter()
+    try:
+        if params is None:
+            return cursor.execute(query)
+        return cursor.execute(query, params)
+    except Exception:
+        DB_QUERY_ERRORS.inc(labels)
+        raise
+    finally:
+        duracion = time.perf_counter() - start
+        DB_QUERY_DURATION.observe(labels, duracion)
+        if slow_query_log.is_slow(duracion):
+            slow_query_log.record(query, params, duracion, getattr(cursor, "rowcount", None), labels[0], route)
+
+class AsyncCursor:
+    """Cursor con API awaitable; cada llamada al driver corre en db_executor"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    async def execute(self, query, params=None, name=None):
+        name = name or derive_query_name(query)
+        roundtrips.check_budget()
+        start = time.perf_counter()
+        try:
+            return await run_in_db_executor(
+                timed_execute, self._cursor, query, params, name, roundtrips.current_route()
+            )
+        finally:
+            duracion = time.perf_counter() - start
+            timing.record("db", duracion, name)
+            roundtrips.record(name, duracion)
+
+    async def fetchone(self):
+        return await run_in_db_executor(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await run_in_db_executor(self._cursor.fetchall)
+
+    async def fetchmany(self, size):
+        return await run_in_db_executor(self._cursor.fetchmany, size)
+
+    async def nextset(self):
+        return await run_in_db_executor(self._cursor.nextset)
+
+    def close(self):
+        self._cursor.close()
+
+class AsyncConnection:
+    """Envoltorio awaitable sobre una conexión prestada por el pool"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self, as_dict=False):
+        if as_dict:
+            return AsyncCursor(self.raw.cursor(as_dict=True))
+        return AsyncCursor(self.raw.cursor())
+
+    async def commit(self):
+        await self._end("commit")
+
+    async def rollback(self):
+        await self._end("rollback")
+
+    async def _end(self, accion):
+        start = time.perf_counter()
+        try:
+            await run_in_db_executor(getattr(self.raw, accion))
+        finally:
+            roundtrips.record(accion, time.perf_counter() - start)
 
 class Database:
-    def __init__(self):
-        self.server = settings.DB_SERVER
-        self.user = settings.DB_USER
-        self.password = settings.DB_PASSWORD
-        self.database = settings.DB_NAME
-        self.port = settings.DB_PORT
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+        self.pool = ConnectionPool(
+            self.get_connection,
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            timeout=settings.DB_POOL_TIMEOUT,
+            max_idle=settings.DB_POOL_MAX_IDLE,
+            pre_ping=settings.DB_POOL_PRE_PING
+        )
 
     def get_connection(self):
         try:
-            conn = pymssql.connect(
-                server=self.server,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                port=self.port,
-                login_timeout=10,
-                charset='UTF-8'
-            )
-            return conn
+            return self.backend.connect()
         except Exception as e:
             print(f"❌ Error conectando a la base de datos: {e}")
             raise HTTPException(
@@ -32,46 +372,104 @@ class Database:
     def get_cursor(self, conn):
         return conn.cursor(as_dict=True)
 
-def ensure_dict(data):
-    """Conversión robusta a diccionario"""
-    if data is None:
-        return {}
-    
-    # Si ya es dict
-    if isinstance(data, dict):
-        return data
-    
-    # Si es tupla - CONVERSIÓN MANUAL
-    if isinstance(data, tuple):
-        print(f"🔄 Convirtiendo tupla: {data}")
-        fields = ['id', 'email', 'nombre', 'hash_contrasena', 'tipo_usuario',
-                 'activo', 'fecha_registro', 'fecha_ultima_modificacion']
-        return {fields[i]: data[i] for i in range(len(data)) if i < len(fields)}
-    
-    # Si es objeto pymssql
-    try:
-        return dict(data)
-    except:
-        return {}
+    async def checkout(self):
+        """
+        Presta una conexión del pool sin bloquear el event loop.
+
+        La espera por un hueco libre se hace con un semáforo asíncrono de
+        tamaño max_size; así ningún hilo de db_executor queda dormido
+        esperando al pool mientras otras peticiones necesitan ese hilo para
+        terminar sus consultas.
+        """
+        slots = self._checkout_slots()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.pool.timeout)
+        except asyncio.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise PoolTimeoutError(
+                f"Tiempo de espera agotado ({self.pool.timeout}s) esperando una conexión del pool"
+            )
+        try:
+            conn = await run_in_db_executor(self.pool.acquire)
+        except BaseException:
+            slots.release()
+            raise
+        DB_POOL_ACQUIRE.observe((), time.perf_counter() - start)
+        return conn
 
-# Función para obtener datos ya convertidos
-def fetchone_dict(cursor):
-    """Obtener un resultado ya convertido a diccionario"""
-    data = cursor.fetchone()
-    return ensure_dict(data)
+    async def checkin(self, conn):
+        try:
+            await run_in_db_executor(self.pool.release, conn)
+        finally:
+            self._checkout_slots().release()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """Conexión cruda del pool para tareas internas (arranque, refrescos en segundo plano)"""
+        conn = await self.checkout()
+        try:
+            yield conn
+        finally:
+            await self.checkin(conn)
 
-def fetchall_dict(cursor):
-    """Obtener todos los resultados convertidos a diccionario"""
-    data = cursor.fetchall()
-    return [ensure_dict(row) for row in data] if data else []
+    def _checkout_slots(self):
+        # Un semáforo por event loop (uvicorn usa uno; los scripts de prueba pueden crear varios)
+        loop = asyncio.get_running_loop()
+        slots = _checkout_slots.get(loop)
+        if slots is None:
+            slots = _checkout_slots[loop] = asyncio.Semaphore(self.pool.max_size)
+        return slots
+
+_checkout_slots = weakref.WeakKeyDictionary()
 
 # Instancia global de la base de datos
 db = Database()
 
+def _collect_pool_metrics():
+    stats = db.pool.stats()
+    DB_POOL_CONNECTIONS.set(("in_use",), stats["in_use"])
+    DB_POOL_CONNECTIONS.set(("idle",), stats["idle"])
+
+registry.add_collector(_collect_pool_metrics)
+
+def _fetch_all(conn, query, params, as_dict, route=None):
+    cursor = conn.cursor(as_dict=as_dict)
+    try:
+        timed_execute(cursor, query, params, route=route)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+async def scatter_gather(*queries, as_dict=True):
+    """
+    Ejecuta consultas de lectura independientes a la vez, cada una en su
+    propia conexión del pool, y devuelve sus filas en el mismo orden.
+
+    queries son tuplas (sql, params). La latencia total es la de la consulta
+    más lenta en lugar de la suma. No usar desde un endpoint que ya tenga una
+    conexión de get_db: pediría varias más al pool mientras retiene la suya.
+    """
+    route = roundtrips.current_route()
+
+    async def run(query, params):
+        async with db.connection() as conn:
+            start = time.perf_counter()
+            try:
+                return await run_in_db_executor(_fetch_all, conn, query, params, as_dict, route)
+            finally:
+                roundtrips.record(derive_query_name(query), time.perf_counter() - start)
+
+    return await asyncio.gather(*(run(query, params) for query, params in queries))
+
 # Dependency para inyectar en los endpoints
-def get_db():
-    conn = db.get_connection()
+async def get_db():
+    try:
+        with timing.timed("db-espera"):
+            conn = await db.checkout()
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"Base de datos saturada: {str(e)}")
     try:
-        yield conn
+        yield AsyncConnection(conn)
     finally:
-        conn.close()
\ No newline at end of file
+        await db.checkin(conn)
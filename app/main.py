@@ -1,16 +1,34 @@
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import auth, usuarios, bahias, reservas, mantenimientos, incidencias, reportes
 from app.core.config import settings
+from app.database import db, run_in_db_executor
+from app.core.availability import availability_index
+from app.core.export import export_slots
+from app.core.security import password_hasher
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.catalogs import catalog_cache
+from app.core.report_cache import report_cache
+from app.core.responses import FastJSONResponse, list_cache
+from app.core.bay_events import bay_feed
+from app.core import metrics, roundtrips
+from app.core.slow_queries import slow_query_log
+from app.core.timing import ServerTimingMiddleware
 
 app = FastAPI(
     title=settings.APP_NAME,
     description="API para el sistema de gestión de bahías de carga",
     version=settings.APP_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
+# Tareas en segundo plano iniciadas en el arranque
+tareas_fondo = []
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -18,8 +36,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "X-Data-Age", "Server-Timing", "Server-Timing-Detalle",
+                    "X-DB-Round-Trips", "X-DB-Time"],
 )
 
+# Desglose de tiempos por petición, solo si se pide con la cabecera X-Server-Timing
+app.add_middleware(ServerTimingMiddleware)
+
 # Incluir rutas
 app.include_router(auth.router)
 app.include_router(usuarios.router, prefix="/api")
@@ -29,6 +52,36 @@ app.include_router(mantenimientos.router, prefix="/api")
 app.include_router(incidencias.router, prefix="/api")
 app.include_router(reportes.router, prefix="/api")
 
+@app.on_event("startup")
+async def iniciar_servicios():
+    try:
+        await run_in_db_executor(db.pool.warmup)
+        async with db.connection() as conn:
+            total = await run_in_db_executor(catalog_cache.load_all, conn)
+        print(f"✅ Catálogos cargados: {total}")
+        total = await bay_feed.reconcile()
+        print(f"✅ Estado de bahías para el stream cargado: {total} bahías")
+    except Exception as e:
+        # La API arranca igual; el pool abrirá conexiones bajo demanda y el
+        # índice se cargará en el siguiente refresco
+        print(f"⚠️ No se pudo inicializar la base de datos: {e}")
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, password_hasher.warmup)
+    except Exception as e:
+        print(f"⚠️ No se pudo precalentar el pool de hash de contraseñas: {e}")
+    if settings.DASHBOARD_REFRESH_INTERVAL > 0:
+        tareas_fondo.append(asyncio.create_task(reportes.dashboard_snapshot.run()))
+    if settings.BAY_STREAM_RECONCILE_INTERVAL > 0:
+        tareas_fondo.append(asyncio.create_task(bay_feed.run(settings.BAY_STREAM_RECONCILE_INTERVAL)))
+
+@app.on_event("shutdown")
+def detener_servicios():
+    for tarea in tareas_fondo:
+        tarea.cancel()
+    db.pool.close()
+    db.backend.close()
+    password_hasher.shutdown()
+
 @app.get("/")
 async def root():
     return {
@@ -39,7 +92,21 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "API funcionando correctamente"}
+    return {
+        "status": "healthy",
+        "message": "API funcionando correctamente",
+        "base_datos": db.backend.stats(),
+        "pool": db.pool.stats(),
+        "password_hasher": password_hasher.stats(),
+        "indice_disponibilidad": availability_index.stats(),
+        "exportaciones": export_slots.stats(),
+        "catalogos": catalog_cache.stats(),
+        "cache_reportes": report_cache.stats(),
+        "cache_listados": list_cache.stats(),
+        "tablero": reportes.dashboard_snapshot.stats(),
+        "stream_bahias": bay_feed.stats(),
+        "consultas_lentas": slow_query_log.stats()
+    }
 
 @app.get("/config")
 async def get_config():
@@ -54,6 +121,18 @@ async def get_config():
     else:
         return {"message": "Configuración no disponible en producción"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def obtener_metricas():
+        """Métricas en formato de exposición de Prometheus"""
+        return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+    # Después de registrar todas las rutas
+    metrics.instrument_routes(app)
+
+# Viajes a la base de datos por petición (también después de registrar las rutas)
+roundtrips.track_routes(app)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -68,6 +68,10 @@ class UsuarioResponse(UsuarioBase):
     class Config:
         from_attributes = True
 
+class UsuarioCredenciales(UsuarioResponse):
+    """Fila de usuario para el login; el hash nunca sale en una respuesta"""
+    hash_contrasena: str
+
 # Modelos de Bahía
 class BahiaBase(BaseModel):
     numero: int
@@ -118,6 +122,19 @@ class ReservaResponse(ReservaBase):
     class Config:
         from_attributes = True
 
+# Sincronización incremental (cambios desde un watermark)
+class CambiosBahiasResponse(BaseModel):
+    watermark: int
+    hay_mas: bool
+    cambios: List[BahiaResponse]
+    eliminados: List[str]
+
+class CambiosReservasResponse(BaseModel):
+    watermark: int
+    hay_mas: bool
+    cambios: List[ReservaResponse]
+    eliminados: List[str]
+
 # Modelos de Mantenimiento
 class MantenimientoBase(BaseModel):
     bahia_id: str
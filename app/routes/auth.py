@@ -1,11 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
-from app.database import get_db, ensure_dict, fetchone_dict
-from app.database import get_db, ensure_dict
+from app.database import get_db
 from app.models.pydantic_models import (
-    UsuarioCreate, UsuarioLogin, UsuarioResponse, LoginResponse
+    UsuarioCreate, UsuarioLogin, UsuarioResponse, UsuarioCredenciales, LoginResponse
 )
+from app.core.rows import fetch_one
 from app.core.security import (
-    get_password_hash, verify_password, create_access_token, verify_token
+    get_password_hash_async, verify_password_async, create_access_token, verify_token
 )
 import pymssql
 from datetime import timedelta
@@ -19,11 +19,11 @@ async def registrar_usuario(usuario: UsuarioCreate, conn = Depends(get_db)):
         cursor = conn.cursor(as_dict=True)
         
         # Verificar si el usuario ya existe
-        cursor.execute(
+        await cursor.execute(
             "SELECT id FROM usuarios WHERE email = %s", 
             (usuario.email,)
         )
-        if cursor.fetchone():
+        if await cursor.fetchone():
             raise HTTPException(
                 status_code=400, 
                 detail="El email ya está registrado"
@@ -31,37 +31,33 @@ async def registrar_usuario(usuario: UsuarioCreate, conn = Depends(get_db)):
         
         # Crear usuario
         user_id = str(uuid.uuid4())
-        hashed_password = get_password_hash(usuario.password)
+        hashed_password = await get_password_hash_async(usuario.password)
         
-        cursor.execute("""
+        await cursor.execute("""
             INSERT INTO usuarios (
                 id, email, nombre, hash_contrasena, tipo_usuario, 
                 activo, fecha_registro, fecha_ultima_modificacion
             ) VALUES (%s, %s, %s, %s, %s, 1, GETDATE(), GETDATE())
         """, (user_id, usuario.email, usuario.nombre, hashed_password, usuario.tipo_usuario))
         
-        conn.commit()
+        await conn.commit()
         
         # Obtener usuario creado
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, email, nombre, tipo_usuario, activo, 
                    fecha_registro, fecha_ultima_modificacion
             FROM usuarios WHERE id = %s
         """, (user_id,))
         
-        user_data = cursor.fetchone()
+        user_dict = await fetch_one(cursor, UsuarioResponse)
         cursor.close()
         
-        # CONVERTIR A DICCIONARIO
-        user_dict = ensure_dict(user_data)
-        print(f"Usuario creado correctamente: {user_dict}")
-        
         return UsuarioResponse(**user_dict)
         
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.post("/login", response_model=LoginResponse)
@@ -70,26 +66,23 @@ async def login_usuario(usuario: UsuarioLogin, conn = Depends(get_db)):
         cursor = conn.cursor()
         
         # Buscar usuario
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, email, nombre, hash_contrasena, tipo_usuario, 
                    activo, fecha_registro, fecha_ultima_modificacion
             FROM usuarios 
             WHERE email = %s AND activo = 1
         """, (usuario.email,))
         
-        # 🔥 USAR LA NUEVA FUNCIÓN QUE SIEMPRE RETORNA DICT
-        user_dict = fetchone_dict(cursor)
+        user_dict = await fetch_one(cursor, UsuarioCredenciales)
         cursor.close()
         
-        print(f"🔍 user_dict: {user_dict}")
-        
         if not user_dict or not user_dict.get("hash_contrasena"):
             raise HTTPException(
                 status_code=401, 
                 detail="Credenciales incorrectas"
             )
         
-        if not verify_password(usuario.password, user_dict["hash_contrasena"]):
+        if not await verify_password_async(usuario.password, user_dict["hash_contrasena"]):
             raise HTTPException(
                 status_code=401, 
                 detail="Credenciales incorrectas"
@@ -118,13 +111,13 @@ async def obtener_usuario_actual(payload: dict = Depends(verify_token), conn = D
     try:
         user_id = payload.get("sub")
         cursor = conn.cursor(as_dict=True)  # 👈 esta línea cambia
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, email, nombre, tipo_usuario, activo, 
                    fecha_registro, fecha_ultima_modificacion
             FROM usuarios 
             WHERE id = %s AND activo = 1
         """, (user_id,))
-        user_dict = cursor.fetchone()
+        user_dict = await fetch_one(cursor, UsuarioResponse)
         cursor.close()
 
         if not user_dict:
@@ -1,34 +1,34 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from app.database import get_db
 from app.models.pydantic_models import (
-    BahiaResponse, BahiaCreate, TipoUsuario
+    BahiaResponse, BahiaCreate, CambiosBahiasResponse, TipoUsuario
 )
-from app.core.security import get_current_user
+from app.core.security import get_current_user, require_roles
+from app.core.pagination import Keyset
+from app.core.catalogs import catalog_cache, catalog_response, estados_bahia, tipos_bahia
+from app.core.bay_state import transition
+from app.core.bay_events import bay_feed, bay_hub, publish_transition, sse_message
+from app.core.config import settings
+from app.core.sync import fetch_changes
+from app.core.rows import fetch_all, fetch_one, trusted_response
 import pymssql
 import uuid
+from datetime import datetime, timezone
 from typing import Optional
 
 router = APIRouter(prefix="/bahias", tags=["bahías"])
 
-# -------------------------- FUNCIONES AUXILIARES --------------------------
-
-def dict_cursor(cursor):
-    """Convierte los resultados de pymssql a diccionarios con nombres de columna"""
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-def dict_row(cursor):
-    """Convierte solo una fila a diccionario"""
-    columns = [col[0] for col in cursor.description]
-    row = cursor.fetchone()
-    return dict(zip(columns, row)) if row else None
+KEYSET_BAHIAS = Keyset(("b.numero", "numero", False), ("b.id", "id", False))
 
 # -------------------------- ENDPOINTS --------------------------
 
 @router.get("/", response_model=list[BahiaResponse])
 async def obtener_bahias(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (cabecera X-Next-Cursor)"),
     activo: bool = Query(True),
     tipo_bahia_id: Optional[int] = Query(None),
     estado_bahia_id: Optional[int] = Query(None),
@@ -60,23 +60,199 @@ async def obtener_bahias(
             query += " AND b.estado_bahia_id = %s"
             params.append(estado_bahia_id)
         
-        query += " ORDER BY b.numero OFFSET %s ROWS FETCH NEXT %s ROWS ONLY"
-        params.extend([skip, limit])
+        query, params = KEYSET_BAHIAS.paginate(query, params, after, skip, limit)
+        
+        await cursor.execute(query, params)
+        bahias = KEYSET_BAHIAS.page(await fetch_all(cursor, BahiaResponse), limit, response)
+        cursor.close()
+        
+        return trusted_response(bahias, response)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/disponibles", response_model=list[BahiaResponse])
+async def obtener_bahias_disponibles(
+    inicio: datetime = Query(..., description="Inicio de la ventana"),
+    fin: datetime = Query(..., description="Fin de la ventana"),
+    tipo_bahia_id: Optional[int] = Query(None),
+    capacidad_min: Optional[float] = Query(None, ge=0),
+    conn = Depends(get_db)
+):
+    """
+    Bahías libres durante toda la ventana [inicio, fin) en una sola consulta.
+    Ordenadas por ajuste: primero la menor capacidad_maxima suficiente.
+    """
+    try:
+        # Normalizar fechas
+        if inicio.tzinfo is not None:
+            inicio = inicio.astimezone(timezone.utc).replace(tzinfo=None)
+        if fin.tzinfo is not None:
+            fin = fin.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        if fin <= inicio:
+            raise HTTPException(status_code=400, detail="La fecha de fin debe ser posterior a la de inicio")
+        
+        cursor = conn.cursor()
+        
+        query = """
+            SELECT b.id, b.numero, b.tipo_bahia_id, b.estado_bahia_id,
+                   b.capacidad_maxima, b.ubicacion, b.observaciones,
+                   b.activo, b.fecha_creacion, b.fecha_ultima_modificacion,
+                   b.creado_por,
+                   tb.nombre as tipo_bahia_nombre,
+                   eb.nombre as estado_bahia_nombre,
+                   eb.codigo as estado_bahia_codigo
+            FROM bahias b
+            LEFT JOIN tipos_bahia tb ON b.tipo_bahia_id = tb.id
+            LEFT JOIN estados_bahia eb ON b.estado_bahia_id = eb.id
+            WHERE b.activo = 1
+            AND ISNULL(eb.codigo, '') <> 'mantenimiento'
+            AND NOT EXISTS (
+                SELECT 1 FROM reservas r
+                WHERE r.bahia_id = b.id AND r.estado = 'activa'
+                AND r.fecha_hora_inicio < %s AND r.fecha_hora_fin > %s
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM mantenimientos m
+                WHERE m.bahia_id = b.id AND m.estado IN ('programado', 'en_progreso')
+                AND m.fecha_inicio < %s AND m.fecha_fin_programada > %s
+            )
+        """
+        params = [fin, inicio, fin, inicio]
+        
+        if tipo_bahia_id:
+            query += " AND b.tipo_bahia_id = %s"
+            params.append(tipo_bahia_id)
+        
+        if capacidad_min is not None:
+            query += " AND b.capacidad_maxima >= %s"
+            params.append(capacidad_min)
         
-        cursor.execute(query, tuple(params))
-        bahias = dict_cursor(cursor)
+        # Mejor ajuste: la menor capacidad suficiente primero, sin capacidad al final
+        query += """
+            ORDER BY CASE WHEN b.capacidad_maxima IS NULL THEN 1 ELSE 0 END,
+                     b.capacidad_maxima, b.numero
+        """
+        
+        await cursor.execute(query, tuple(params))
+        bahias = await fetch_all(cursor, BahiaResponse)
         cursor.close()
         
-        return [BahiaResponse(**bahia) for bahia in bahias]
+        return trusted_response(bahias)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
+@router.get("/cambios", response_model=CambiosBahiasResponse)
+async def obtener_cambios_bahias(
+    desde: int = Query(0, description="Watermark de la respuesta anterior (0 = descarga completa)"),
+    limit: int = Query(500, ge=1, le=5000),
+    conn = Depends(get_db)
+):
+    """
+    Bahías creadas o modificadas después del watermark. Las bahías
+    desactivadas o borradas llegan en `eliminados`.
+    """
+    try:
+        cursor = conn.cursor()
+        
+        query = """
+            SELECT b.id, b.numero, b.tipo_bahia_id, b.estado_bahia_id,
+                   b.capacidad_maxima, b.ubicacion, b.observaciones,
+                   b.activo, b.fecha_creacion, b.fecha_ultima_modificacion,
+                   b.creado_por,
+                   tb.nombre as tipo_bahia_nombre,
+                   eb.nombre as estado_bahia_nombre,
+                   eb.codigo as estado_bahia_codigo
+            FROM bahias b
+            LEFT JOIN tipos_bahia tb ON b.tipo_bahia_id = tb.id
+            LEFT JOIN estados_bahia eb ON b.estado_bahia_id = eb.id
+            WHERE 1=1
+        """
+        
+        resultado = await fetch_changes(
+            cursor, query, [], "b.version", "bahias", desde, limit, BahiaResponse,
+            tombstone=lambda bahia: not bahia["activo"]
+        )
+        cursor.close()
+        
+        return trusted_response(resultado)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+async def _bay_events():
+    """Snapshot inicial y después solo los cambios; comentario de keep-alive si no hay nada"""
+    # Starlette cancela el generador cuando el cliente se desconecta
+    sub = bay_hub.subscribe()
+    try:
+        yield sse_message(await bay_feed.snapshot())
+        while True:
+            try:
+                event = await sub.next(timeout=settings.BAY_STREAM_HEARTBEAT)
+            except LookupError:
+                # Cliente demasiado lento: se corta y al reconectar recibe un snapshot nuevo
+                break
+            yield sse_message(event) if event is not None else ": keep-alive\n\n"
+    finally:
+        sub.close()
+
+@router.get("/stream")
+async def stream_estado_bahias(request: Request):
+    """
+    Estado de las bahías en tiempo real (Server-Sent Events).
+
+    Envía un evento 'snapshot' con todas las bahías activas y luego un
+    evento 'cambio' cada vez que una bahía cambia de estado, en lugar de
+    tener que consultar GET /api/bahias/ periódicamente.
+    """
+    try:
+        await bay_feed.ensure_ready()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    return StreamingResponse(
+        _bay_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/stream/ws")
+async def stream_estado_bahias_ws(websocket: WebSocket):
+    """Mismos eventos que /stream, como mensajes JSON por WebSocket"""
+    await websocket.accept()
+    sub = None
+    try:
+        await bay_feed.ensure_ready()
+        sub = bay_hub.subscribe()
+        await websocket.send_json(await bay_feed.snapshot())
+        while True:
+            try:
+                event = await sub.next(timeout=settings.BAY_STREAM_HEARTBEAT)
+            except LookupError:
+                await websocket.close(code=1013)
+                break
+            await websocket.send_json(event if event is not None else {"tipo": "keep-alive"})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"❌ Error en el stream de bahías: {str(e)}")
+        await websocket.close(code=1011)
+    finally:
+        if sub is not None:
+            sub.close()
+
 @router.get("/{bahia_id}", response_model=BahiaResponse)
 async def obtener_bahia(bahia_id: str, conn = Depends(get_db)):
     try:
         cursor = conn.cursor()
-        cursor.execute("""
+        await cursor.execute("""
             SELECT b.id, b.numero, b.tipo_bahia_id, b.estado_bahia_id,
                    b.capacidad_maxima, b.ubicacion, b.observaciones,
                    b.activo, b.fecha_creacion, b.fecha_ultima_modificacion,
@@ -90,20 +266,23 @@ async def obtener_bahia(bahia_id: str, conn = Depends(get_db)):
             WHERE b.id = %s
         """, (bahia_id,))
         
-        bahia = dict_row(cursor)
+        bahia = await fetch_one(cursor, BahiaResponse)
         cursor.close()
         
         if not bahia:
             raise HTTPException(status_code=404, detail="Bahía no encontrada")
         
-        return BahiaResponse(**bahia)
+        return trusted_response(bahia)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.post("/", response_model=BahiaResponse)
+@router.post("/", response_model=BahiaResponse, dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para crear bahías"
+))])
 async def crear_bahia(
     bahia: BahiaCreate,
     current_user: str = Depends(get_current_user),
@@ -112,36 +291,22 @@ async def crear_bahia(
     try:
         cursor = conn.cursor()
 
-        # Obtener tipo de usuario
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        row = cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=401, detail="Usuario no válido")
-        
-        user_tipo = row[0] if isinstance(row, tuple) else row.get('tipo_usuario')
-
-        # Verificar permisos
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para crear bahías")
-        
         # Verificar número único
-        cursor.execute("SELECT id FROM bahias WHERE numero = %s AND activo = 1", (bahia.numero,))
-        if cursor.fetchone():
+        await cursor.execute("SELECT id FROM bahias WHERE numero = %s AND activo = 1", (bahia.numero,))
+        if await cursor.fetchone():
             raise HTTPException(status_code=400, detail="Ya existe una bahía con este número")
         
         # Verificar tipo y estado válidos
-        cursor.execute("SELECT id FROM tipos_bahia WHERE id = %s AND activo = 1", (bahia.tipo_bahia_id,))
-        if not cursor.fetchone():
+        if not await tipos_bahia.exists(bahia.tipo_bahia_id):
             raise HTTPException(status_code=400, detail="Tipo de bahía no válido")
         
-        cursor.execute("SELECT id FROM estados_bahia WHERE id = %s AND activo = 1", (bahia.estado_bahia_id,))
-        if not cursor.fetchone():
+        if not await estados_bahia.exists(bahia.estado_bahia_id):
             raise HTTPException(status_code=400, detail="Estado de bahía no válido")
         
         # Crear bahía
         bahia_id = str(uuid.uuid4())
         
-        cursor.execute("""
+        await cursor.execute("""
             INSERT INTO bahias (
                 id, numero, tipo_bahia_id, estado_bahia_id, capacidad_maxima,
                 ubicacion, observaciones, activo, fecha_creacion, 
@@ -150,10 +315,11 @@ async def crear_bahia(
         """, (bahia_id, bahia.numero, bahia.tipo_bahia_id, bahia.estado_bahia_id,
               bahia.capacidad_maxima, bahia.ubicacion, bahia.observaciones or '', current_user))
         
-        conn.commit()
+        await conn.commit()
+        await bay_feed.apply(bahia_id, bahia.numero, bahia.estado_bahia_id)
         
         # Retornar bahía creada con todos los campos necesarios
-        cursor.execute("""
+        await cursor.execute("""
             SELECT b.id, b.numero, b.tipo_bahia_id, b.estado_bahia_id,
                    b.capacidad_maxima, b.ubicacion, b.observaciones,
                    b.activo, b.fecha_creacion, b.fecha_ultima_modificacion,
@@ -167,7 +333,7 @@ async def crear_bahia(
             WHERE b.id = %s
         """, (bahia_id,))
         
-        bahia_creada = dict_row(cursor)
+        bahia_creada = await fetch_one(cursor, BahiaResponse)
         cursor.close()
         
         if not bahia_creada:
@@ -180,34 +346,40 @@ async def crear_bahia(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         print(f"❌ Error al crear bahía: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 @router.get("/tipos/")
-async def obtener_tipos_bahia(conn = Depends(get_db)):
+async def obtener_tipos_bahia(request: Request):
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, codigo, nombre, descripcion FROM tipos_bahia WHERE activo = 1")
-        tipos = dict_cursor(cursor)
-        cursor.close()
-        return tipos
+        return await catalog_response(request, "tipos_bahia")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.get("/estados/")
-async def obtener_estados_bahia(conn = Depends(get_db)):
+async def obtener_estados_bahia(request: Request):
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, codigo, nombre, descripcion, color FROM estados_bahia WHERE activo = 1")
-        estados = dict_cursor(cursor)
-        cursor.close()
-        return estados
+        return await catalog_response(request, "estados_bahia")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.post("/catalogos/recargar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para recargar catálogos"
+))])
+async def recargar_catalogos():
+    try:
+        total = await catalog_cache.reload()
+        return {"message": f"Catálogos recargados: {total}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 
 
-@router.put("/{bahia_id}/iniciar-uso")
+@router.put("/{bahia_id}/iniciar-uso", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para iniciar uso de bahías"
+))])
 async def iniciar_uso_bahia(
     bahia_id: str,
     current_user: str = Depends(get_current_user),
@@ -220,56 +392,22 @@ async def iniciar_uso_bahia(
     try:
         cursor = conn.cursor()
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        row = cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=401, detail="Usuario no válido")
-        
-        user_tipo = row[0] if isinstance(row, tuple) else row.get('tipo_usuario')
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para iniciar uso de bahías")
-        
-        # Obtener bahía actual
-        cursor.execute("""
-            SELECT b.id, b.numero, b.estado_bahia_id, eb.codigo as estado_codigo
-            FROM bahias b
-            INNER JOIN estados_bahia eb ON b.estado_bahia_id = eb.id
-            WHERE b.id = %s AND b.activo = 1
-        """, (bahia_id,))
-        
-        bahia = dict_row(cursor)
-        if not bahia:
-            raise HTTPException(status_code=404, detail="Bahía no encontrada")
-        
-        # Verificar que esté reservada
-        if bahia['estado_codigo'] != 'reservada':
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Solo se puede iniciar uso de bahías reservadas. Estado actual: {bahia['estado_codigo']}"
-            )
-        
-        # Cambiar estado a 'en_uso' (id = 3)
-        cursor.execute("""
-            UPDATE bahias 
-            SET estado_bahia_id = 3,
-                fecha_ultima_modificacion = GETDATE()
-            WHERE id = %s
-        """, (bahia_id,))
+        # reservada -> en_uso en una sola sentencia (409 si otra operación se adelantó)
+        cambio = await transition(cursor, bahia_id, "iniciar_uso")
         
-        conn.commit()
+        await conn.commit()
         cursor.close()
+        await publish_transition(bahia_id, cambio)
         
         return {
-            "message": f"Bahía {bahia['numero']} puesta en uso correctamente",
+            "message": f"Bahía {cambio['numero']} puesta en uso correctamente",
             "bahia_id": bahia_id,
-            "estado_anterior": "reservada",
-            "estado_nuevo": "en_uso"
+            "estado_anterior": cambio["estado_anterior"],
+            "estado_nuevo": cambio["estado_nuevo"]
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from app.database import get_db,db
 from app.models.pydantic_models import (
     IncidenciaResponse, IncidenciaCreate, SeveridadIncidencia, TipoUsuario
 )
-from app.core.security import get_current_user
+from app.core.security import get_current_user, get_current_user_type, require_roles
+from app.core.pagination import Keyset
+from app.core.rows import fetch_all, fetch_one, trusted_response
+from app.core.export import FormatoExport, export_response, export_slot
 import pymssql
 import uuid
 from datetime import datetime
@@ -11,65 +14,94 @@ from typing import Optional
 
 router = APIRouter(prefix="/incidencias", tags=["incidencias"])
 
+KEYSET_INCIDENCIAS = Keyset(("i.fecha_incidencia", "fecha_incidencia", True), ("i.id", "id", False))
+
+def _consulta_incidencias(current_user, user_tipo, estado=None, severidad=None, bahia_id=None):
+    """Incidencias visibles para el usuario, filtradas como en el listado"""
+    query = """
+        SELECT i.id, i.bahia_id, i.reserva_id, i.tipo_incidencia, i.descripcion,
+               i.severidad, i.estado, i.fecha_incidencia, i.fecha_resolucion,
+               i.reportado_por, i.asignado_a, i.resolucion, i.fecha_registro,
+               b.numero as numero_bahia,
+               u1.nombre as reportado_por_nombre,
+               u2.nombre as asignado_a_nombre
+        FROM incidencias i
+        LEFT JOIN bahias b ON i.bahia_id = b.id
+        INNER JOIN usuarios u1 ON i.reportado_por = u1.id
+        LEFT JOIN usuarios u2 ON i.asignado_a = u2.id
+        WHERE 1=1
+    """
+    params = []
+    
+    # Si no es admin o supervisor, solo puede ver sus propias incidencias reportadas
+    if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
+        query += " AND i.reportado_por = %s"
+        params.append(current_user)
+    
+    if estado:
+        query += " AND i.estado = %s"
+        params.append(estado)
+    
+    if severidad:
+        query += " AND i.severidad = %s"
+        params.append(severidad.value)
+    
+    if bahia_id:
+        query += " AND i.bahia_id = %s"
+        params.append(bahia_id)
+    
+    return query, params
+
 @router.get("/", response_model=list[IncidenciaResponse])
 async def obtener_incidencias(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (cabecera X-Next-Cursor)"),
     estado: Optional[str] = Query(None),
     severidad: Optional[SeveridadIncidencia] = Query(None),
     bahia_id: Optional[str] = Query(None),
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos (solo admin y supervisor pueden ver todas las incidencias)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
+        query, params = _consulta_incidencias(current_user, user_tipo, estado, severidad, bahia_id)
         
-        query = """
-            SELECT i.id, i.bahia_id, i.reserva_id, i.tipo_incidencia, i.descripcion,
-                   i.severidad, i.estado, i.fecha_incidencia, i.fecha_resolucion,
-                   i.reportado_por, i.asignado_a, i.resolucion, i.fecha_registro,
-                   b.numero as numero_bahia,
-                   u1.nombre as reportado_por_nombre,
-                   u2.nombre as asignado_a_nombre
-            FROM incidencias i
-            LEFT JOIN bahias b ON i.bahia_id = b.id
-            INNER JOIN usuarios u1 ON i.reportado_por = u1.id
-            LEFT JOIN usuarios u2 ON i.asignado_a = u2.id
-            WHERE 1=1
-        """
-        params = []
-        
-        # Si no es admin o supervisor, solo puede ver sus propias incidencias reportadas
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            query += " AND i.reportado_por = %s"
-            params.append(current_user)
-        
-        if estado:
-            query += " AND i.estado = %s"
-            params.append(estado)
+        query, params = KEYSET_INCIDENCIAS.paginate(query, params, after, skip, limit)
         
-        if severidad:
-            query += " AND i.severidad = %s"
-            params.append(severidad.value)
-        
-        if bahia_id:
-            query += " AND i.bahia_id = %s"
-            params.append(bahia_id)
+        await cursor.execute(query, params)
+
+        incidencias = KEYSET_INCIDENCIAS.page(await fetch_all(cursor, IncidenciaResponse), limit, response)
+        cursor.close()
         
-        query += " ORDER BY i.fecha_incidencia DESC OFFSET %s ROWS FETCH NEXT %s ROWS ONLY"
-        params.extend([skip, limit])
+        return trusted_response(incidencias, response)
         
-        cursor.execute(query, tuple(params))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-        incidencias = cursor.fetchall()
-        cursor.close()
+@router.get("/export", dependencies=[Depends(export_slot)])
+async def exportar_incidencias(
+    formato: FormatoExport = Query(FormatoExport.NDJSON),
+    estado: Optional[str] = Query(None),
+    severidad: Optional[SeveridadIncidencia] = Query(None),
+    bahia_id: Optional[str] = Query(None),
+    current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
+    conn = Depends(get_db)
+):
+    try:
+        query, params = _consulta_incidencias(current_user, user_tipo, estado, severidad, bahia_id)
+        query += f" ORDER BY {KEYSET_INCIDENCIAS.order_by()}"
         
-        return [IncidenciaResponse(**incidencia) for incidencia in incidencias]
+        return await export_response(conn, query, tuple(params), formato, "incidencias")
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
@@ -77,12 +109,13 @@ async def obtener_incidencias(
 async def obtener_incidencia(
     incidencia_id: str,
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
         cursor = db.get_cursor(conn)
         
-        cursor.execute("""
+        await cursor.execute("""
             SELECT i.id, i.bahia_id, i.reserva_id, i.tipo_incidencia, i.descripcion,
                    i.severidad, i.estado, i.fecha_incidencia, i.fecha_resolucion,
                    i.reportado_por, i.asignado_a, i.resolucion, i.fecha_registro,
@@ -96,22 +129,17 @@ async def obtener_incidencia(
             WHERE i.id = %s
         """, (incidencia_id,))
         
-        incidencia = cursor.fetchone()
+        incidencia = await fetch_one(cursor, IncidenciaResponse)
         cursor.close()
         
         if not incidencia:
             raise HTTPException(status_code=404, detail="Incidencia no encontrada")
         
         # Verificar permisos
-        cursor = db.get_cursor(conn)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        cursor.close()
-        
         if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI] and incidencia["reportado_por"] != current_user:
             raise HTTPException(status_code=403, detail="No tiene permisos para ver esta incidencia")
         
-        return IncidenciaResponse(**incidencia)
+        return trusted_response(incidencia)
         
     except HTTPException:
         raise
@@ -129,19 +157,19 @@ async def crear_incidencia(
         
         # Validar referencias
         if incidencia.bahia_id:
-            cursor.execute("SELECT id FROM bahias WHERE id = %s", (incidencia.bahia_id,))
-            if not cursor.fetchone():
+            await cursor.execute("SELECT id FROM bahias WHERE id = %s", (incidencia.bahia_id,))
+            if not await cursor.fetchone():
                 raise HTTPException(status_code=404, detail="Bahía no encontrada")
         
         if incidencia.reserva_id:
-            cursor.execute("SELECT id FROM reservas WHERE id = %s", (incidencia.reserva_id,))
-            if not cursor.fetchone():
+            await cursor.execute("SELECT id FROM reservas WHERE id = %s", (incidencia.reserva_id,))
+            if not await cursor.fetchone():
                 raise HTTPException(status_code=404, detail="Reserva no encontrada")
         
         # Crear incidencia
         incidencia_id = str(uuid.uuid4())
         
-        cursor.execute("""
+        await cursor.execute("""
             INSERT INTO incidencias (
                 id, bahia_id, reserva_id, tipo_incidencia, descripcion,
                 severidad, estado, fecha_incidencia, reportado_por, fecha_registro
@@ -150,10 +178,10 @@ async def crear_incidencia(
               incidencia.tipo_incidencia, incidencia.descripcion, incidencia.severidad.value,
               incidencia.estado, datetime.now(), current_user))
         
-        conn.commit()
+        await conn.commit()
         
         # Obtener incidencia creada
-        cursor.execute("""
+        await cursor.execute("""
             SELECT i.id, i.bahia_id, i.reserva_id, i.tipo_incidencia, i.descripcion,
                    i.severidad, i.estado, i.fecha_incidencia, i.fecha_resolucion,
                    i.reportado_por, i.asignado_a, i.resolucion, i.fecha_registro
@@ -161,7 +189,7 @@ async def crear_incidencia(
             WHERE i.id = %s
         """, (incidencia_id,))
         
-        incidencia_creada = cursor.fetchone()
+        incidencia_creada = await cursor.fetchone()
         cursor.close()
         
         return IncidenciaResponse(**incidencia_creada)
@@ -169,10 +197,13 @@ async def crear_incidencia(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.put("/{incidencia_id}/asignar")
+@router.put("/{incidencia_id}/asignar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para asignar incidencias"
+))])
 async def asignar_incidencia(
     incidencia_id: str,
     usuario_asignado: str = Query(..., description="ID del usuario a asignar"),
@@ -182,33 +213,26 @@ async def asignar_incidencia(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos (solo admin y supervisor pueden asignar)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para asignar incidencias")
-        
         # Verificar que la incidencia existe
-        cursor.execute("SELECT id, estado FROM incidencias WHERE id = %s", (incidencia_id,))
-        incidencia = cursor.fetchone()
+        await cursor.execute("SELECT id, estado FROM incidencias WHERE id = %s", (incidencia_id,))
+        incidencia = await cursor.fetchone()
         
         if not incidencia:
             raise HTTPException(status_code=404, detail="Incidencia no encontrada")
         
         # Verificar que el usuario asignado existe
-        cursor.execute("SELECT id FROM usuarios WHERE id = %s AND activo = 1", (usuario_asignado,))
-        if not cursor.fetchone():
+        await cursor.execute("SELECT id FROM usuarios WHERE id = %s AND activo = 1", (usuario_asignado,))
+        if not await cursor.fetchone():
             raise HTTPException(status_code=404, detail="Usuario asignado no encontrado")
         
         # Asignar incidencia
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE incidencias 
             SET asignado_a = %s, estado = 'en_proceso'
             WHERE id = %s
         """, (usuario_asignado, incidencia_id))
         
-        conn.commit()
+        await conn.commit()
         cursor.close()
         
         return {"message": "Incidencia asignada correctamente"}
@@ -216,7 +240,7 @@ async def asignar_incidencia(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.put("/{incidencia_id}/resolver")
@@ -224,26 +248,24 @@ async def resolver_incidencia(
     incidencia_id: str,
     resolucion: str = Query(..., description="Descripción de la resolución"),
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
         cursor = db.get_cursor(conn)
         
         # Obtener incidencia
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, asignado_a, estado 
             FROM incidencias 
             WHERE id = %s
         """, (incidencia_id,))
         
-        incidencia = cursor.fetchone()
+        incidencia = await cursor.fetchone()
         if not incidencia:
             raise HTTPException(status_code=404, detail="Incidencia no encontrada")
         
         # Verificar permisos (solo asignado, admin o supervisor pueden resolver)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
         puede_resolver = (
             user_tipo in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI] or
             incidencia["asignado_a"] == current_user
@@ -257,7 +279,7 @@ async def resolver_incidencia(
             raise HTTPException(status_code=400, detail="Solo se pueden resolver incidencias en proceso")
         
         # Resolver incidencia
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE incidencias 
             SET estado = 'resuelta', 
                 resolucion = %s,
@@ -265,7 +287,7 @@ async def resolver_incidencia(
             WHERE id = %s
         """, (resolucion, incidencia_id))
         
-        conn.commit()
+        await conn.commit()
         cursor.close()
         
         return {"message": "Incidencia resuelta correctamente"}
@@ -273,10 +295,13 @@ async def resolver_incidencia(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.put("/{incidencia_id}/cerrar")
+@router.put("/{incidencia_id}/cerrar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para cerrar incidencias"
+))])
 async def cerrar_incidencia(
     incidencia_id: str,
     current_user: str = Depends(get_current_user),
@@ -285,16 +310,9 @@ async def cerrar_incidencia(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos (solo admin y supervisor pueden cerrar)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para cerrar incidencias")
-        
         # Obtener incidencia
-        cursor.execute("SELECT id, estado FROM incidencias WHERE id = %s", (incidencia_id,))
-        incidencia = cursor.fetchone()
+        await cursor.execute("SELECT id, estado FROM incidencias WHERE id = %s", (incidencia_id,))
+        incidencia = await cursor.fetchone()
         
         if not incidencia:
             raise HTTPException(status_code=404, detail="Incidencia no encontrada")
@@ -304,13 +322,13 @@ async def cerrar_incidencia(
             raise HTTPException(status_code=400, detail="Solo se pueden cerrar incidencias resueltas")
         
         # Cerrar incidencia
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE incidencias 
             SET estado = 'cerrada'
             WHERE id = %s
         """, (incidencia_id,))
         
-        conn.commit()
+        await conn.commit()
         cursor.close()
         
         return {"message": "Incidencia cerrada correctamente"}
@@ -318,10 +336,13 @@ async def cerrar_incidencia(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.get("/estadisticas/resumen")
+@router.get("/estadisticas/resumen", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para ver estadísticas"
+))])
 async def obtener_estadisticas_incidencias(
     current_user: str = Depends(get_current_user),
     conn = Depends(get_db)
@@ -329,14 +350,7 @@ async def obtener_estadisticas_incidencias(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para ver estadísticas")
-        
-        cursor.execute("""
+        await cursor.execute("""
             SELECT 
                 COUNT(*) as total,
                 COUNT(CASE WHEN estado = 'abierta' THEN 1 END) as abiertas,
@@ -350,7 +364,7 @@ async def obtener_estadisticas_incidencias(
             FROM incidencias
         """)
         
-        estadisticas = cursor.fetchone()
+        estadisticas = await cursor.fetchone()
         cursor.close()
         
         return estadisticas
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from app.database import get_db,db
 from app.models.pydantic_models import (
     MantenimientoResponse, MantenimientoCreate, 
     TipoMantenimiento, EstadoMantenimiento, TipoUsuario
 )
-from app.core.security import get_current_user
+from app.core.security import get_current_user, require_roles
+from app.core.availability import availability_index, RESERVA, MANTENIMIENTO
+from app.core.bay_state import transition
+from app.core.bay_events import publish_transition
+from app.core.pagination import Keyset
+from app.core.rows import fetch_all, fetch_one, trusted_response
+from app.core.export import FormatoExport, export_response, export_slot
 import pymssql
 import uuid
 from datetime import datetime
@@ -12,10 +18,44 @@ from typing import Optional
 
 router = APIRouter(prefix="/mantenimientos", tags=["mantenimientos"])
 
+KEYSET_MANTENIMIENTOS = Keyset(("m.fecha_inicio", "fecha_inicio", True), ("m.id", "id", False))
+
+def _consulta_mantenimientos(estado=None, tipo_mantenimiento=None, bahia_id=None):
+    """SELECT de mantenimientos con los filtros del listado; el orden lo pone quien la usa"""
+    query = """
+        SELECT m.id, m.bahia_id, m.tipo_mantenimiento, m.descripcion,
+               m.fecha_inicio, m.fecha_fin_programada, m.fecha_fin_real,
+               m.estado, m.tecnico_responsable, m.costo, m.observaciones,
+               m.usuario_registro, m.fecha_registro,
+               b.numero as numero_bahia,
+               u.nombre as usuario_nombre
+        FROM mantenimientos m
+        INNER JOIN bahias b ON m.bahia_id = b.id
+        INNER JOIN usuarios u ON m.usuario_registro = u.id
+        WHERE 1=1
+    """
+    params = []
+    
+    if estado:
+        query += " AND m.estado = %s"
+        params.append(estado.value)
+    
+    if tipo_mantenimiento:
+        query += " AND m.tipo_mantenimiento = %s"
+        params.append(tipo_mantenimiento.value)
+    
+    if bahia_id:
+        query += " AND m.bahia_id = %s"
+        params.append(bahia_id)
+    
+    return query, params
+
 @router.get("/", response_model=list[MantenimientoResponse])
 async def obtener_mantenimientos(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (cabecera X-Next-Cursor)"),
     estado: Optional[EstadoMantenimiento] = Query(None),
     tipo_mantenimiento: Optional[TipoMantenimiento] = Query(None),
     bahia_id: Optional[str] = Query(None),
@@ -25,42 +65,39 @@ async def obtener_mantenimientos(
     try:
         cursor = db.get_cursor(conn)
         
-        query = """
-            SELECT m.id, m.bahia_id, m.tipo_mantenimiento, m.descripcion,
-                   m.fecha_inicio, m.fecha_fin_programada, m.fecha_fin_real,
-                   m.estado, m.tecnico_responsable, m.costo, m.observaciones,
-                   m.usuario_registro, m.fecha_registro,
-                   b.numero as numero_bahia,
-                   u.nombre as usuario_nombre
-            FROM mantenimientos m
-            INNER JOIN bahias b ON m.bahia_id = b.id
-            INNER JOIN usuarios u ON m.usuario_registro = u.id
-            WHERE 1=1
-        """
-        params = []
-        
-        if estado:
-            query += " AND m.estado = %s"
-            params.append(estado.value)
+        query, params = _consulta_mantenimientos(estado, tipo_mantenimiento, bahia_id)
         
-        if tipo_mantenimiento:
-            query += " AND m.tipo_mantenimiento = %s"
-            params.append(tipo_mantenimiento.value)
+        query, params = KEYSET_MANTENIMIENTOS.paginate(query, params, after, skip, limit)
         
-        if bahia_id:
-            query += " AND m.bahia_id = %s"
-            params.append(bahia_id)
+        await cursor.execute(query, params)
+
+        mantenimientos = KEYSET_MANTENIMIENTOS.page(await fetch_all(cursor, MantenimientoResponse), limit, response)
+        cursor.close()
         
-        query += " ORDER BY m.fecha_inicio DESC OFFSET %s ROWS FETCH NEXT %s ROWS ONLY"
-        params.extend([skip, limit])
+        return trusted_response(mantenimientos, response)
         
-        cursor.execute(query, tuple(params))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-        mantenimientos = cursor.fetchall()
-        cursor.close()
+@router.get("/export", dependencies=[Depends(export_slot)])
+async def exportar_mantenimientos(
+    formato: FormatoExport = Query(FormatoExport.NDJSON),
+    estado: Optional[EstadoMantenimiento] = Query(None),
+    tipo_mantenimiento: Optional[TipoMantenimiento] = Query(None),
+    bahia_id: Optional[str] = Query(None),
+    current_user: str = Depends(get_current_user),
+    conn = Depends(get_db)
+):
+    try:
+        query, params = _consulta_mantenimientos(estado, tipo_mantenimiento, bahia_id)
+        query += f" ORDER BY {KEYSET_MANTENIMIENTOS.order_by()}"
         
-        return [MantenimientoResponse(**mantenimiento) for mantenimiento in mantenimientos]
+        return await export_response(conn, query, tuple(params), formato, "mantenimientos")
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
@@ -72,7 +109,7 @@ async def obtener_mantenimiento(
     try:
         cursor = db.get_cursor(conn)
         
-        cursor.execute("""
+        await cursor.execute("""
             SELECT m.id, m.bahia_id, m.tipo_mantenimiento, m.descripcion,
                    m.fecha_inicio, m.fecha_fin_programada, m.fecha_fin_real,
                    m.estado, m.tecnico_responsable, m.costo, m.observaciones,
@@ -85,20 +122,23 @@ async def obtener_mantenimiento(
             WHERE m.id = %s
         """, (mantenimiento_id,))
         
-        mantenimiento = cursor.fetchone()
+        mantenimiento = await fetch_one(cursor, MantenimientoResponse)
         cursor.close()
         
         if not mantenimiento:
             raise HTTPException(status_code=404, detail="Mantenimiento no encontrado")
         
-        return MantenimientoResponse(**mantenimiento)
+        return trusted_response(mantenimiento)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.post("/", response_model=MantenimientoResponse)
+@router.post("/", response_model=MantenimientoResponse, dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para crear mantenimientos"
+))])
 async def crear_mantenimiento(
     mantenimiento: MantenimientoCreate,
     current_user: str = Depends(get_current_user),
@@ -107,69 +147,60 @@ async def crear_mantenimiento(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos (solo admin, operador y supervisor)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para crear mantenimientos")
-        
-        # Verificar que la bahía existe
-        cursor.execute("SELECT id FROM bahias WHERE id = %s AND activo = 1", (mantenimiento.bahia_id,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Bahía no encontrada o inactiva")
-        
         # Verificar fechas
         if mantenimiento.fecha_fin_programada <= mantenimiento.fecha_inicio:
             raise HTTPException(status_code=400, detail="La fecha de fin programada debe ser posterior a la de inicio")
         
-        # Verificar que no haya conflictos con reservas activas
-        cursor.execute("""
-            SELECT id 
-            FROM reservas 
-            WHERE bahia_id = %s 
-            AND estado = 'activa'
-            AND (
-                (fecha_hora_inicio <= %s AND fecha_hora_fin > %s) OR
-                (fecha_hora_inicio < %s AND fecha_hora_fin >= %s) OR
-                (fecha_hora_inicio >= %s AND fecha_hora_fin <= %s)
-            )
-        """, (mantenimiento.bahia_id, mantenimiento.fecha_fin_programada, mantenimiento.fecha_inicio,
-              mantenimiento.fecha_fin_programada, mantenimiento.fecha_inicio,
-              mantenimiento.fecha_inicio, mantenimiento.fecha_fin_programada))
-        
-        if cursor.fetchone():
+        # Reserva reciente de este worker en el período: se rechaza sin ir a la base de datos
+        if availability_index.conflicts(
+            mantenimiento.bahia_id, mantenimiento.fecha_inicio,
+            mantenimiento.fecha_fin_programada, tipos=(RESERVA,)
+        ):
             raise HTTPException(
                 status_code=400, 
                 detail="Existen reservas activas en el período del mantenimiento"
             )
         
-        # Crear mantenimiento
+        # Pasar la bahía a "mantenimiento" (404 si no existe, 409 si está en uso)
+        cambio = await transition(cursor, mantenimiento.bahia_id, "iniciar_mantenimiento")
+        
+        # Crear mantenimiento; el NOT EXISTS es la guarda definitiva dentro de la transacción
         mantenimiento_id = str(uuid.uuid4())
         
-        cursor.execute("""
+        await cursor.execute("""
             INSERT INTO mantenimientos (
                 id, bahia_id, tipo_mantenimiento, descripcion, fecha_inicio,
                 fecha_fin_programada, estado, tecnico_responsable, costo,
                 observaciones, usuario_registro, fecha_registro
-            ) VALUES (%s, %s, %s, %s, %s, %s, 'programado', %s, %s, %s, %s, GETDATE())
+            )
+            SELECT %s, %s, %s, %s, %s, %s, 'programado', %s, %s, %s, %s, GETDATE()
+            WHERE NOT EXISTS (
+                SELECT 1 FROM reservas WITH (UPDLOCK, HOLDLOCK)
+                WHERE bahia_id = %s AND estado = 'activa'
+                AND fecha_hora_inicio < %s AND fecha_hora_fin > %s
+            )
         """, (mantenimiento_id, mantenimiento.bahia_id, mantenimiento.tipo_mantenimiento.value,
               mantenimiento.descripcion, mantenimiento.fecha_inicio, mantenimiento.fecha_fin_programada,
               mantenimiento.tecnico_responsable, mantenimiento.costo, mantenimiento.observaciones,
-              current_user))
+              current_user, mantenimiento.bahia_id, mantenimiento.fecha_fin_programada,
+              mantenimiento.fecha_inicio))
         
-        # Actualizar estado de la bahía a "mantenimiento"
-        cursor.execute("""
-            UPDATE bahias 
-            SET estado_bahia_id = (SELECT id FROM estados_bahia WHERE codigo = 'mantenimiento'),
-                fecha_ultima_modificacion = GETDATE()
-            WHERE id = %s
-        """, (mantenimiento.bahia_id,))
+        if cursor.rowcount == 0:
+            await conn.rollback()
+            raise HTTPException(
+                status_code=400, 
+                detail="Existen reservas activas en el período del mantenimiento"
+            )
         
-        conn.commit()
+        await conn.commit()
+        availability_index.add(
+            mantenimiento.bahia_id, mantenimiento_id, mantenimiento.fecha_inicio,
+            mantenimiento.fecha_fin_programada, MANTENIMIENTO
+        )
+        await publish_transition(mantenimiento.bahia_id, cambio)
         
         # Obtener mantenimiento creado
-        cursor.execute("""
+        await cursor.execute("""
             SELECT m.id, m.bahia_id, m.tipo_mantenimiento, m.descripcion,
                    m.fecha_inicio, m.fecha_fin_programada, m.fecha_fin_real,
                    m.estado, m.tecnico_responsable, m.costo, m.observaciones,
@@ -178,7 +209,7 @@ async def crear_mantenimiento(
             WHERE m.id = %s
         """, (mantenimiento_id,))
         
-        mantenimiento_creado = cursor.fetchone()
+        mantenimiento_creado = await cursor.fetchone()
         cursor.close()
         
         return MantenimientoResponse(**mantenimiento_creado)
@@ -186,10 +217,13 @@ async def crear_mantenimiento(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.put("/{mantenimiento_id}/iniciar")
+@router.put("/{mantenimiento_id}/iniciar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para iniciar mantenimientos"
+))])
 async def iniciar_mantenimiento(
     mantenimiento_id: str,
     current_user: str = Depends(get_current_user),
@@ -198,21 +232,14 @@ async def iniciar_mantenimiento(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para iniciar mantenimientos")
-        
         # Obtener mantenimiento
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, bahia_id, estado, fecha_inicio
             FROM mantenimientos 
             WHERE id = %s
         """, (mantenimiento_id,))
         
-        mantenimiento = cursor.fetchone()
+        mantenimiento = await cursor.fetchone()
         if not mantenimiento:
             raise HTTPException(status_code=404, detail="Mantenimiento no encontrado")
         
@@ -221,13 +248,13 @@ async def iniciar_mantenimiento(
             raise HTTPException(status_code=400, detail="Solo se pueden iniciar mantenimientos programados")
         
         # Iniciar mantenimiento
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE mantenimientos 
             SET estado = 'en_progreso'
             WHERE id = %s
         """, (mantenimiento_id,))
         
-        conn.commit()
+        await conn.commit()
         cursor.close()
         
         return {"message": "Mantenimiento iniciado correctamente"}
@@ -235,10 +262,13 @@ async def iniciar_mantenimiento(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.put("/{mantenimiento_id}/completar")
+@router.put("/{mantenimiento_id}/completar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para completar mantenimientos"
+))])
 async def completar_mantenimiento(
     mantenimiento_id: str,
     observaciones: str = Query(None),
@@ -248,21 +278,14 @@ async def completar_mantenimiento(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.OPERADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para completar mantenimientos")
-        
         # Obtener mantenimiento
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, bahia_id, estado
             FROM mantenimientos 
             WHERE id = %s
         """, (mantenimiento_id,))
         
-        mantenimiento = cursor.fetchone()
+        mantenimiento = await cursor.fetchone()
         if not mantenimiento:
             raise HTTPException(status_code=404, detail="Mantenimiento no encontrado")
         
@@ -282,27 +305,27 @@ async def completar_mantenimiento(
             params.insert(0, observaciones)
         
         update_query += " WHERE id = %s"
-        cursor.execute(update_query, tuple(params))       
+        await cursor.execute(update_query, tuple(params))       
         # Liberar bahía
-        cursor.execute("""
-            UPDATE bahias 
-            SET estado_bahia_id = (SELECT id FROM estados_bahia WHERE codigo = 'libre'),
-                fecha_ultima_modificacion = GETDATE()
-            WHERE id = %s
-        """, (mantenimiento["bahia_id"],))
+        cambio = await transition(cursor, mantenimiento["bahia_id"], "finalizar_mantenimiento", estricta=False)
         
-        conn.commit()
+        await conn.commit()
+        availability_index.remove(mantenimiento_id)
         cursor.close()
+        await publish_transition(mantenimiento["bahia_id"], cambio)
         
         return {"message": "Mantenimiento completado correctamente"}
         
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.put("/{mantenimiento_id}/cancelar")
+@router.put("/{mantenimiento_id}/cancelar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para cancelar mantenimientos"
+))])
 async def cancelar_mantenimiento(
     mantenimiento_id: str,
     motivo: str = Query(..., description="Motivo de la cancelación"),
@@ -312,21 +335,14 @@ async def cancelar_mantenimiento(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para cancelar mantenimientos")
-        
         # Obtener mantenimiento
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, bahia_id, estado
             FROM mantenimientos 
             WHERE id = %s
         """, (mantenimiento_id,))
         
-        mantenimiento = cursor.fetchone()
+        mantenimiento = await cursor.fetchone()
         if not mantenimiento:
             raise HTTPException(status_code=404, detail="Mantenimiento no encontrado")
         
@@ -335,7 +351,7 @@ async def cancelar_mantenimiento(
             raise HTTPException(status_code=400, detail="No se puede cancelar un mantenimiento completado")
         
         # Cancelar mantenimiento
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE mantenimientos 
             SET estado = 'cancelado', 
                 observaciones = CONCAT(ISNULL(observaciones, ''), ' - Cancelado: ', %s)
@@ -343,7 +359,7 @@ async def cancelar_mantenimiento(
         """, (motivo, mantenimiento_id))
         
         # Liberar bahía si no hay otros mantenimientos activos
-        cursor.execute("""
+        await cursor.execute("""
             SELECT COUNT(*) as mantenimientos_activos
             FROM mantenimientos 
             WHERE bahia_id = %s 
@@ -351,25 +367,23 @@ async def cancelar_mantenimiento(
             AND id != %s
         """, (mantenimiento["bahia_id"], mantenimiento_id))
         
-        otros_mantenimientos = cursor.fetchone()["mantenimientos_activos"]
+        otros_mantenimientos = (await cursor.fetchone())["mantenimientos_activos"]
         
+        cambio = None
         if otros_mantenimientos == 0:
-            cursor.execute("""
-                UPDATE bahias 
-                SET estado_bahia_id = (SELECT id FROM estados_bahia WHERE codigo = 'libre'),
-                    fecha_ultima_modificacion = GETDATE()
-                WHERE id = %s
-            """, (mantenimiento["bahia_id"],))
-        
-        conn.commit()
+            cambio = await transition(cursor, mantenimiento["bahia_id"], "finalizar_mantenimiento", estricta=False)
+        
+        await conn.commit()
+        availability_index.remove(mantenimiento_id)
         cursor.close()
+        await publish_transition(mantenimiento["bahia_id"], cambio)
         
         return {"message": "Mantenimiento cancelado correctamente"}
         
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.get("/bahia/{bahia_id}")
@@ -382,7 +396,7 @@ async def obtener_mantenimientos_bahia(
     try:
         cursor = db.get_cursor(conn)
         
-        cursor.execute("""
+        await cursor.execute("""
             SELECT m.id, m.tipo_mantenimiento, m.descripcion, m.fecha_inicio,
                    m.fecha_fin_programada, m.fecha_fin_real, m.estado,
                    m.tecnico_responsable, m.costo, m.observaciones, m.fecha_registro
@@ -392,7 +406,7 @@ async def obtener_mantenimientos_bahia(
             OFFSET %s ROWS FETCH NEXT %s ROWS ONLY
         """, (bahia_id, skip, limit))
         
-        mantenimientos = cursor.fetchall()
+        mantenimientos = await cursor.fetchall()
         cursor.close()
         
         return mantenimientos
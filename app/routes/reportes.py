@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from app.database import get_db,db
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from app.database import AsyncConnection, get_db, db, scatter_gather
 from app.models.pydantic_models import (
     ReporteUsoRequest, EstadisticasBahias, TipoUsuario
 )
-from app.core.security import get_current_user
+from app.core.security import get_current_user, require_roles
+from app.core.report_cache import report_cache
+from app.core.catalogs import tipos_bahia
+from app.core.config import settings
+from app.core.snapshot import Snapshot
+from app.core.responses import RESERVAS_ACTIVAS, encoded_response, list_cache
+from app.core.slow_queries import slow_query_log
 import pymssql
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Any
@@ -15,7 +21,7 @@ async def obtener_estadisticas_bahias(conn = Depends(get_db)):
     try:
         cursor = db.get_cursor(conn)
         
-        cursor.execute("""
+        await cursor.execute("""
             SELECT 
                 COUNT(*) as total_bahias,
                 COUNT(CASE WHEN eb.codigo = 'libre' THEN 1 END) as bahias_libres,
@@ -27,7 +33,7 @@ async def obtener_estadisticas_bahias(conn = Depends(get_db)):
             WHERE b.activo = 1
         """)
         
-        stats = cursor.fetchone()
+        stats = await cursor.fetchone()
         
         # Calcular porcentaje de ocupación
         total = stats["total_bahias"]
@@ -48,7 +54,10 @@ async def obtener_estadisticas_bahias(conn = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.get("/uso/diario")
+@router.get("/uso/diario", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.PLANIFICADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para ver reportes"
+))])
 async def obtener_reporte_uso_diario(
     fecha: date = Query(..., description="Fecha para el reporte (YYYY-MM-DD)"),
     current_user: str = Depends(get_current_user),
@@ -57,36 +66,31 @@ async def obtener_reporte_uso_diario(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
+        # Uso del día desde la caché de parciales; de la base de datos solo
+        # hacen falta las bahías activas y su estado actual
+        partial = (await report_cache.get_days(cursor, fecha, fecha))[fecha]
         
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.PLANIFICADOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para ver reportes")
-        
-        fecha_inicio = datetime.combine(fecha, datetime.min.time())
-        fecha_fin = datetime.combine(fecha, datetime.max.time())
-        
-        cursor.execute("""
+        await cursor.execute("""
             SELECT 
+                b.id,
                 b.numero as bahia_numero,
                 tb.nombre as tipo_bahia,
-                eb.nombre as estado_actual,
-                COUNT(r.id) as total_reservas,
-                SUM(CASE WHEN r.estado = 'completada' THEN 1 ELSE 0 END) as reservas_completadas,
-                AVG(DATEDIFF(MINUTE, r.fecha_hora_inicio, r.fecha_hora_fin)) as duracion_promedio_minutos
+                eb.nombre as estado_actual
             FROM bahias b
             LEFT JOIN tipos_bahia tb ON b.tipo_bahia_id = tb.id
             LEFT JOIN estados_bahia eb ON b.estado_bahia_id = eb.id
-            LEFT JOIN reservas r ON b.id = r.bahia_id 
-                AND r.fecha_hora_inicio >= %s 
-                AND r.fecha_hora_fin <= %s
             WHERE b.activo = 1
-            GROUP BY b.numero, tb.nombre, eb.nombre
             ORDER BY b.numero
-        """, (fecha_inicio, fecha_fin))
+        """)
         
-        reporte = cursor.fetchall()
+        reporte = []
+        for bahia in await cursor.fetchall():
+            uso = partial.rows.get(bahia.pop("id"))
+            total = uso["total_reservas"] if uso else 0
+            bahia["total_reservas"] = total
+            bahia["reservas_completadas"] = uso["reservas_completadas"] if uso else 0
+            bahia["duracion_promedio_minutos"] = uso["minutos_totales"] // total if total else None
+            reporte.append(bahia)
         cursor.close()
         
         return {
@@ -98,71 +102,66 @@ async def obtener_reporte_uso_diario(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.post("/uso/rango")
+@router.post("/uso/rango", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.PLANIFICADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para ver reportes"
+))])
 async def obtener_reporte_uso_rango(
     reporte_request: ReporteUsoRequest,
     current_user: str = Depends(get_current_user),
     conn = Depends(get_db)
 ):
     try:
-        cursor = db.get_cursor(conn)
+        # Cada día del rango es un parcial en la caché: se acota el tamaño
+        dias_rango = (reporte_request.fecha_fin - reporte_request.fecha_inicio).days + 1
+        if dias_rango > settings.REPORT_MAX_RANGE_DAYS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"El rango no puede superar {settings.REPORT_MAX_RANGE_DAYS} días"
+            )
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.PLANIFICADOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para ver reportes")
-        
-        fecha_inicio = datetime.combine(reporte_request.fecha_inicio, datetime.min.time())
-        fecha_fin = datetime.combine(reporte_request.fecha_fin, datetime.max.time())
-        
-        # Estadísticas generales
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_reservas,
-                COUNT(CASE WHEN estado = 'completada' THEN 1 END) as reservas_completadas,
-                COUNT(CASE WHEN estado = 'cancelada' THEN 1 END) as reservas_canceladas,
-                AVG(DATEDIFF(MINUTE, fecha_hora_inicio, fecha_hora_fin)) as duracion_promedio_minutos,
-                SUM(DATEDIFF(MINUTE, fecha_hora_inicio, fecha_hora_fin)) as tiempo_total_minutos
-            FROM reservas
-            WHERE fecha_hora_inicio >= %s AND fecha_hora_fin <= %s
-        """, (fecha_inicio, fecha_fin))
-        
-        estadisticas = cursor.fetchone()
-        
-        # Uso por tipo de bahía
-        cursor.execute("""
-            SELECT 
-                tb.nombre as tipo_bahia,
-                COUNT(r.id) as total_reservas,
-                COUNT(CASE WHEN r.estado = 'completada' THEN 1 END) as reservas_completadas,
-                AVG(DATEDIFF(MINUTE, r.fecha_hora_inicio, r.fecha_hora_fin)) as duracion_promedio
-            FROM reservas r
-            INNER JOIN bahias b ON r.bahia_id = b.id
-            INNER JOIN tipos_bahia tb ON b.tipo_bahia_id = tb.id
-            WHERE r.fecha_hora_inicio >= %s AND r.fecha_hora_fin <= %s
-            GROUP BY tb.nombre
-            ORDER BY total_reservas DESC
-        """, (fecha_inicio, fecha_fin))
-        
-        uso_por_tipo = cursor.fetchall()
+        cursor = db.get_cursor(conn)
         
-        # Tendencia diaria
-        cursor.execute("""
-            SELECT 
-                CAST(fecha_hora_inicio AS DATE) as fecha,
-                COUNT(*) as reservas,
-                COUNT(CASE WHEN estado = 'completada' THEN 1 END) as completadas
-            FROM reservas
-            WHERE fecha_hora_inicio >= %s AND fecha_hora_fin <= %s
-            GROUP BY CAST(fecha_hora_inicio AS DATE)
-            ORDER BY fecha
-        """, (fecha_inicio, fecha_fin))
+        # Parciales diarios cacheados; solo se consultan los días que faltan
+        dias = await report_cache.get_days(cursor, reporte_request.fecha_inicio, reporte_request.fecha_fin)
+        cursor.close()
         
-        tendencia = cursor.fetchall()
+        total = completadas = canceladas = minutos = 0
+        por_tipo = {}
+        tendencia = []
+        for fecha in sorted(dias):
+            reservas_dia = completadas_dia = 0
+            for uso in dias[fecha].rows.values():
+                reservas_dia += uso["total_reservas"]
+                completadas_dia += uso["reservas_completadas"]
+                canceladas += uso["reservas_canceladas"]
+                minutos += uso["minutos_totales"]
+                tipo = por_tipo.setdefault(uso["tipo_bahia_id"], [0, 0, 0])
+                tipo[0] += uso["total_reservas"]
+                tipo[1] += uso["reservas_completadas"]
+                tipo[2] += uso["minutos_totales"]
+            total += reservas_dia
+            completadas += completadas_dia
+            if dias[fecha].rows:
+                tendencia.append({"fecha": fecha, "reservas": reservas_dia, "completadas": completadas_dia})
+        
+        estadisticas = {
+            "total_reservas": total,
+            "reservas_completadas": completadas,
+            "reservas_canceladas": canceladas,
+            "duracion_promedio_minutos": minutos // total if total else None,
+            "tiempo_total_minutos": minutos if tendencia else None
+        }
         
-        cursor.close()
+        uso_por_tipo = []
+        for tipo_id, (reservas, completadas_tipo, minutos_tipo) in por_tipo.items():
+            uso_por_tipo.append({
+                "tipo_bahia": await tipos_bahia.nombre(tipo_id),
+                "total_reservas": reservas,
+                "reservas_completadas": completadas_tipo,
+                "duracion_promedio": minutos_tipo // reservas if reservas else None
+            })
+        uso_por_tipo.sort(key=lambda t: t["total_reservas"], reverse=True)
         
         return {
             "periodo": {
@@ -174,54 +173,100 @@ async def obtener_reporte_uso_rango(
             "tendencia_diaria": tendencia
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
+@router.post("/cache/limpiar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para limpiar la caché de reportes"
+))])
+async def limpiar_cache_reportes():
+    """Descarta los parciales diarios cacheados (p. ej. tras reconstruir uso_diario_bahias)"""
+    report_cache.clear()
+    list_cache.clear()
+    return {"message": "Caché de reportes limpiada"}
+
+@router.get("/consultas-lentas", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para ver las consultas lentas"
+))])
+async def obtener_consultas_lentas(
+    limit: int = Query(100, ge=1, le=1000),
+    huella: str = Query(None, description="Filtra por texto contenido en la huella"),
+    agrupar: bool = Query(False, description="Agrupa por huella ordenando por tiempo total")
+):
+    """Últimas consultas que superaron SLOW_QUERY_THRESHOLD_MS (más recientes primero)"""
+    if agrupar:
+        consultas = slow_query_log.top(limit, huella)
+    else:
+        consultas = slow_query_log.entries(limit, huella)
+    return {**slow_query_log.stats(), "consultas": consultas}
+
+@router.delete("/consultas-lentas", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para limpiar las consultas lentas"
+))])
+async def limpiar_consultas_lentas():
+    slow_query_log.clear()
+    return {"message": "Registro de consultas lentas vaciado"}
+
 @router.get("/reservas/activas")
 async def obtener_reservas_activas(
-    current_user: str = Depends(get_current_user),
-    conn = Depends(get_db)
+    request: Request,
+    current_user: str = Depends(get_current_user)
 ):
     try:
-        cursor = db.get_cursor(conn)
-        
-        cursor.execute("""
-            SELECT 
-                r.id,
-                b.numero as numero_bahia,
-                tb.nombre as tipo_bahia,
-                u.nombre as usuario_nombre,
-                r.fecha_hora_inicio,
-                r.fecha_hora_fin,
-                r.vehiculo_placa,
-                r.conductor_nombre,
-                r.mercancia_tipo,
-                DATEDIFF(MINUTE, r.fecha_hora_inicio, r.fecha_hora_fin) as duracion_minutos,
-                CASE 
-                    WHEN GETDATE() < r.fecha_hora_inicio THEN 'pendiente'
-                    WHEN GETDATE() BETWEEN r.fecha_hora_inicio AND r.fecha_hora_fin THEN 'en_progreso'
-                    ELSE 'vencida'
-                END as estado_temporal
-            FROM reservas r
-            INNER JOIN bahias b ON r.bahia_id = b.id
-            INNER JOIN tipos_bahia tb ON b.tipo_bahia_id = tb.id
-            INNER JOIN usuarios u ON r.usuario_id = u.id
-            WHERE r.estado = 'activa'
-            ORDER BY r.fecha_hora_inicio
-        """)
-        
-        reservas_activas = cursor.fetchall()
-        cursor.close()
-        
-        return {
+        # Igual para todos los usuarios: se sirven los bytes ya serializados,
+        # sin tocar el pool de conexiones
+        cached = list_cache.get(RESERVAS_ACTIVAS)
+        if cached is not None:
+            return encoded_response(cached, request)
+        
+        async with db.connection() as conn:
+            cursor = db.get_cursor(AsyncConnection(conn))
+            
+            await cursor.execute("""
+                SELECT 
+                    r.id,
+                    b.numero as numero_bahia,
+                    tb.nombre as tipo_bahia,
+                    u.nombre as usuario_nombre,
+                    r.fecha_hora_inicio,
+                    r.fecha_hora_fin,
+                    r.vehiculo_placa,
+                    r.conductor_nombre,
+                    r.mercancia_tipo,
+                    DATEDIFF(MINUTE, r.fecha_hora_inicio, r.fecha_hora_fin) as duracion_minutos,
+                    CASE 
+                        WHEN GETDATE() < r.fecha_hora_inicio THEN 'pendiente'
+                        WHEN GETDATE() BETWEEN r.fecha_hora_inicio AND r.fecha_hora_fin THEN 'en_progreso'
+                        ELSE 'vencida'
+                    END as estado_temporal
+                FROM reservas r
+                INNER JOIN bahias b ON r.bahia_id = b.id
+                INNER JOIN tipos_bahia tb ON b.tipo_bahia_id = tb.id
+                INNER JOIN usuarios u ON r.usuario_id = u.id
+                WHERE r.estado = 'activa'
+                ORDER BY r.fecha_hora_inicio
+            """)
+            
+            reservas_activas = await cursor.fetchall()
+            cursor.close()
+        
+        return encoded_response(list_cache.put(RESERVAS_ACTIVAS, {
             "total": len(reservas_activas),
             "reservas": reservas_activas
-        }
+        }), request)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.get("/mantenimientos/pendientes")
+@router.get("/mantenimientos/pendientes", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.OPERADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para ver reportes de mantenimiento"
+))])
 async def obtener_mantenimientos_pendientes(
     current_user: str = Depends(get_current_user),
     conn = Depends(get_db)
@@ -229,14 +274,7 @@ async def obtener_mantenimientos_pendientes(
     try:
         cursor = db.get_cursor(conn)
         
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.OPERADOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para ver reportes de mantenimiento")
-        
-        cursor.execute("""
+        await cursor.execute("""
             SELECT 
                 m.id,
                 b.numero as bahia_numero,
@@ -253,7 +291,7 @@ async def obtener_mantenimientos_pendientes(
             ORDER BY m.fecha_inicio
         """)
         
-        mantenimientos = cursor.fetchall()
+        mantenimientos = await cursor.fetchall()
         cursor.close()
         
         return {
@@ -264,60 +302,65 @@ async def obtener_mantenimientos_pendientes(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.get("/dashboard/indicadores")
-async def obtener_indicadores_dashboard(conn = Depends(get_db)):
-    try:
-        cursor = db.get_cursor(conn)
-        
+async def calcular_indicadores_dashboard():
+    """Indicadores del tablero; los calcula dashboard_snapshot en segundo plano"""
+    hoy = date.today()
+    inicio_semana = hoy - timedelta(days=hoy.weekday())
+    fin_semana = inicio_semana + timedelta(days=6)
+    
+    # Las cuatro consultas son independientes: se lanzan a la vez, cada una en su conexión
+    hoy_rows, semana_rows, criticas_rows, incidencias_rows = await scatter_gather(
         # Reservas hoy
-        hoy = date.today()
-        hoy_inicio = datetime.combine(hoy, datetime.min.time())
-        hoy_fin = datetime.combine(hoy, datetime.max.time())
-        
-        cursor.execute("""
+        ("""
             SELECT COUNT(*) as reservas_hoy
             FROM reservas 
             WHERE CAST(fecha_hora_inicio AS DATE) = CAST(GETDATE() AS DATE)
-        """)
-        reservas_hoy = cursor.fetchone()["reservas_hoy"]
-        
+        """, None),
         # Reservas esta semana
-        inicio_semana = hoy - timedelta(days=hoy.weekday())
-        fin_semana = inicio_semana + timedelta(days=6)
-        
-        cursor.execute("""
+        ("""
             SELECT COUNT(*) as reservas_semana
             FROM reservas 
             WHERE fecha_hora_inicio >= %s AND fecha_hora_fin <= %s
-        """, (inicio_semana, fin_semana))
-        reservas_semana = cursor.fetchone()["reservas_semana"]
-        
+        """, (inicio_semana, fin_semana)),
         # Bahías en uso crítico (más de 90% de tiempo usado)
-        cursor.execute("""
+        ("""
             SELECT COUNT(*) as bahias_criticas
             FROM vista_estadisticas_bahias
             WHERE estado_actual = 'En uso' 
             AND duracion_promedio_minutos > 120  -- Más de 2 horas
-        """)
-        bahias_criticas = cursor.fetchone()["bahias_criticas"]
-        
+        """, None),
         # Incidencias abiertas
-        cursor.execute("""
+        ("""
             SELECT COUNT(*) as incidencias_abiertas
             FROM incidencias 
             WHERE estado IN ('abierta', 'en_proceso')
-        """)
-        incidencias_abiertas = cursor.fetchone()["incidencias_abiertas"]
-        
-        cursor.close()
+        """, None)
+    )
+    reservas_hoy = hoy_rows[0]["reservas_hoy"]
+    reservas_semana = semana_rows[0]["reservas_semana"]
+    bahias_criticas = criticas_rows[0]["bahias_criticas"]
+    incidencias_abiertas = incidencias_rows[0]["incidencias_abiertas"]
+    
+    return {
+        "reservas_hoy": reservas_hoy,
+        "reservas_semana": reservas_semana,
+        "bahias_criticas": bahias_criticas,
+        "incidencias_abiertas": incidencias_abiertas
+    }
+
+dashboard_snapshot = Snapshot(
+    "indicadores del tablero", calcular_indicadores_dashboard,
+    interval=settings.DASHBOARD_REFRESH_INTERVAL
+)
+
+@router.get("/dashboard/indicadores")
+async def obtener_indicadores_dashboard(response: Response):
+    try:
+        # Servido desde memoria: la carga en la base de datos no depende de cuántas pantallas consulten
+        indicadores, edad = await dashboard_snapshot.get()
+        response.headers["X-Data-Age"] = f"{edad:.1f}"
         
-        return {
-            "reservas_hoy": reservas_hoy,
-            "reservas_semana": reservas_semana,
-            "bahias_criticas": bahias_criticas,
-            "incidencias_abiertas": incidencias_abiertas,
-            "fecha_actual": datetime.now()
-        }
+        return {**indicadores, "fecha_actual": datetime.now()}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
\ No newline at end of file
@@ -1,10 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from app.database import get_db
 from app.database import db, get_db
 from app.models.pydantic_models import (
-    ReservaResponse, ReservaCreate, EstadoReserva, TipoUsuario
+    ReservaResponse, ReservaCreate, CambiosReservasResponse, EstadoReserva, TipoUsuario
 )
-from app.core.security import get_current_user
+from app.core.security import get_current_user, get_current_user_type
+from app.core.availability import availability_index, RESERVA, MANTENIMIENTO
+from app.core.catalogs import estados_bahia
+from app.core.bay_state import TRANSICIONES, transition, transition_ids
+from app.core.bay_events import bay_feed, publish_transition
+from app.core.rollup import registrar_uso_diario, CANCELADA, COMPLETADA
+from app.core.pagination import Keyset
+from app.core.export import FormatoExport, export_response, export_slot
+from app.core.sync import fetch_changes
+from app.core.rows import fetch_all, fetch_one, trusted_response
+from app.core.responses import RESERVAS_ACTIVAS, list_cache
+from app.core.timing import timed
 import pymssql
 import uuid
 from datetime import datetime, timedelta
@@ -14,79 +25,254 @@ from datetime import timezone
 
 router = APIRouter(prefix="/reservas", tags=["reservas"])
 
+KEYSET_RESERVAS = Keyset(("r.fecha_hora_inicio", "fecha_hora_inicio", True), ("r.id", "id", False))
+
+# Alta de reserva en un único lote T-SQL: valida la bahía y el solapamiento,
+# inserta, cambia el estado de la bahía, confirma y devuelve la fila con sus
+# joins. El lote hace COMMIT TRAN + BEGIN TRAN igual que pymssql, de modo que
+# la conexión queda con la transacción implícita que el driver espera.
+CREAR_RESERVA_SQL = f"""
+    SET NOCOUNT ON;
+    DECLARE @id VARCHAR(36) = %s;
+    DECLARE @bahia_id VARCHAR(36) = %s;
+    DECLARE @usuario_id VARCHAR(36) = %s;
+    DECLARE @inicio DATETIME2 = %s;
+    DECLARE @fin DATETIME2 = %s;
+    DECLARE @estado_mantenimiento INT = %s;
+    DECLARE @estado_reservada INT = %s;
+    DECLARE @origenes_reservar TABLE (id INT);
+    INSERT INTO @origenes_reservar VALUES {", ".join(["(%s)"] * len(TRANSICIONES["reservar"][0]))};
+    DECLARE @resultado VARCHAR(30) = 'ok';
+    DECLARE @estado INT;
+    DECLARE @transaccion_externa BIT = CASE WHEN @@TRANCOUNT > 0 THEN 1 ELSE 0 END;
+    DECLARE @nueva TABLE (
+        id VARCHAR(36), bahia_id VARCHAR(36), usuario_id VARCHAR(36),
+        fecha_hora_inicio DATETIME2, fecha_hora_fin DATETIME2, estado VARCHAR(20),
+        vehiculo_placa VARCHAR(20), conductor_nombre VARCHAR(255),
+        conductor_telefono VARCHAR(20), conductor_documento VARCHAR(50),
+        mercancia_tipo VARCHAR(255), mercancia_peso DECIMAL(10,2),
+        mercancia_descripcion VARCHAR(MAX), observaciones VARCHAR(MAX),
+        fecha_creacion DATETIME2, fecha_cancelacion DATETIME2,
+        fecha_completacion DATETIME2, cancelado_por VARCHAR(36),
+        motivo_cancelacion VARCHAR(MAX)
+    );
+
+    IF @transaccion_externa = 0 BEGIN TRAN;
+    BEGIN TRY
+        SELECT @estado = estado_bahia_id
+        FROM bahias WITH (UPDLOCK, HOLDLOCK)
+        WHERE id = @bahia_id AND activo = 1;
+
+        IF @estado IS NULL
+            SET @resultado = 'no_encontrada';
+        ELSE IF @estado = @estado_mantenimiento
+            SET @resultado = 'mantenimiento';
+        ELSE IF EXISTS (
+            SELECT 1 FROM reservas WITH (UPDLOCK, HOLDLOCK)
+            WHERE bahia_id = @bahia_id AND estado = 'activa'
+            AND fecha_hora_inicio < @fin AND fecha_hora_fin > @inicio
+        )
+            SET @resultado = 'conflicto';
+        ELSE IF EXISTS (
+            SELECT 1 FROM mantenimientos WITH (UPDLOCK, HOLDLOCK)
+            WHERE bahia_id = @bahia_id AND estado IN ('programado', 'en_progreso')
+            AND fecha_inicio < @fin AND fecha_fin_programada > @inicio
+        )
+            SET @resultado = 'conflicto_mantenimiento';
+
+        IF @resultado = 'ok'
+        BEGIN
+            INSERT INTO reservas (
+                id, bahia_id, usuario_id, fecha_hora_inicio, fecha_hora_fin,
+                estado, vehiculo_placa, conductor_nombre, conductor_telefono,
+                conductor_documento, mercancia_tipo, mercancia_peso,
+                mercancia_descripcion, observaciones, fecha_creacion
+            )
+            OUTPUT inserted.id, inserted.bahia_id, inserted.usuario_id,
+                   inserted.fecha_hora_inicio, inserted.fecha_hora_fin, inserted.estado,
+                   inserted.vehiculo_placa, inserted.conductor_nombre,
+                   inserted.conductor_telefono, inserted.conductor_documento,
+                   inserted.mercancia_tipo, inserted.mercancia_peso,
+                   inserted.mercancia_descripcion, inserted.observaciones,
+                   inserted.fecha_creacion, inserted.fecha_cancelacion,
+                   inserted.fecha_completacion, inserted.cancelado_por,
+                   inserted.motivo_cancelacion
+            INTO @nueva
+            VALUES (@id, @bahia_id, @usuario_id, @inicio, @fin, 'activa',
+                    %s, %s, %s, %s, %s, %s, %s, %s, GETDATE());
+
+            -- Transición "reservar" de app.core.bay_state; una bahía en uso sigue en uso
+            UPDATE bahias
+            SET estado_bahia_id = @estado_reservada,
+                fecha_ultima_modificacion = GETDATE()
+            WHERE id = @bahia_id
+            AND estado_bahia_id IN (SELECT id FROM @origenes_reservar);
+
+            EXEC sp_registrar_uso_diario @id, 'creada';
+        END
+
+        COMMIT TRAN;
+        IF @transaccion_externa = 1 BEGIN TRAN;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0 ROLLBACK TRAN;
+        IF @transaccion_externa = 1 BEGIN TRAN;
+        THROW;
+    END CATCH
+
+    SELECT @resultado AS resultado,
+           n.*,
+           b.numero as numero_bahia,
+           b.estado_bahia_id,
+           u.nombre as usuario_nombre,
+           u.email as usuario_email
+    FROM (SELECT 1 AS uno) x
+    LEFT JOIN @nueva n ON 1 = 1
+    LEFT JOIN bahias b ON n.bahia_id = b.id
+    LEFT JOIN usuarios u ON n.usuario_id = u.id;
+"""
+
+# resultado del lote -> (status_code, detail)
+ERRORES_CREAR_RESERVA = {
+    "no_encontrada": (404, "Bahía no encontrada o inactiva"),
+    "mantenimiento": (400, "No se puede reservar una bahía en mantenimiento"),
+    "conflicto": (400, "Ya existen reservas en ese horario"),
+    "conflicto_mantenimiento": (400, "La bahía tiene un mantenimiento programado en ese horario"),
+}
+
+def _consulta_reservas(current_user, user_tipo, estado=None, bahia_id=None, usuario_id=None, fecha_inicio=None, fecha_fin=None):
+    """Consulta de reservas visibles para el usuario con los filtros del listado (sin ORDER BY)"""
+    query = """
+        SELECT r.id, r.bahia_id, r.usuario_id, r.fecha_hora_inicio, 
+               r.fecha_hora_fin, r.estado, r.vehiculo_placa, 
+               r.conductor_nombre, r.conductor_telefono, r.conductor_documento,
+               r.mercancia_tipo, r.mercancia_peso, r.mercancia_descripcion,
+               r.observaciones, r.fecha_creacion, r.fecha_cancelacion,
+               r.fecha_completacion, r.cancelado_por, r.motivo_cancelacion,
+               b.numero as numero_bahia,
+               u.nombre as usuario_nombre,
+               u.email as usuario_email
+        FROM reservas r
+        INNER JOIN bahias b ON r.bahia_id = b.id
+        INNER JOIN usuarios u ON r.usuario_id = u.id
+        WHERE 1=1
+    """
+    params = []
+    
+    # Si no es admin, solo puede ver sus propias reservas
+    if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
+        query += " AND r.usuario_id = %s"
+        params.append(current_user)
+    
+    if estado:
+        query += " AND r.estado = %s"
+        params.append(estado.value)
+    
+    if bahia_id:
+        query += " AND r.bahia_id = %s"
+        params.append(bahia_id)
+    
+    if usuario_id:
+        # Solo admin puede filtrar por otros usuarios
+        if user_tipo in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
+            query += " AND r.usuario_id = %s"
+            params.append(usuario_id)
+    
+    if fecha_inicio:
+        query += " AND r.fecha_hora_inicio >= %s"
+        params.append(fecha_inicio)
+    
+    if fecha_fin:
+        query += " AND r.fecha_hora_fin <= %s"
+        params.append(fecha_fin)
+    
+    return query, params
+
 @router.get("/", response_model=list[ReservaResponse])
 async def obtener_reservas(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (cabecera X-Next-Cursor)"),
     estado: Optional[EstadoReserva] = Query(None),
     bahia_id: Optional[str] = Query(None),
     usuario_id: Optional[str] = Query(None),
     fecha_inicio: Optional[datetime] = Query(None),
     fecha_fin: Optional[datetime] = Query(None),
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
         cursor = db.get_cursor(conn) 
         
-        # Verificar permisos para ver todas las reservas
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
+        query, params = _consulta_reservas(current_user, user_tipo, estado, bahia_id, usuario_id, fecha_inicio, fecha_fin)
         
-        query = """
-            SELECT r.id, r.bahia_id, r.usuario_id, r.fecha_hora_inicio, 
-                   r.fecha_hora_fin, r.estado, r.vehiculo_placa, 
-                   r.conductor_nombre, r.conductor_telefono, r.conductor_documento,
-                   r.mercancia_tipo, r.mercancia_peso, r.mercancia_descripcion,
-                   r.observaciones, r.fecha_creacion, r.fecha_cancelacion,
-                   r.fecha_completacion, r.cancelado_por, r.motivo_cancelacion,
-                   b.numero as numero_bahia,
-                   u.nombre as usuario_nombre,
-                   u.email as usuario_email
-            FROM reservas r
-            INNER JOIN bahias b ON r.bahia_id = b.id
-            INNER JOIN usuarios u ON r.usuario_id = u.id
-            WHERE 1=1
-        """
-        params = []
+        query, params = KEYSET_RESERVAS.paginate(query, params, after, skip, limit)
         
-        # Si no es admin, solo puede ver sus propias reservas
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-            query += " AND r.usuario_id = %s"
-            params.append(current_user)
-        
-        if estado:
-            query += " AND r.estado = %s"
-            params.append(estado.value)
+        await cursor.execute(query, params)
+
+        reservas = KEYSET_RESERVAS.page(await fetch_all(cursor, ReservaResponse), limit, response)
+        cursor.close()
         
-        if bahia_id:
-            query += " AND r.bahia_id = %s"
-            params.append(bahia_id)
+        return trusted_response(reservas, response)
         
-        if usuario_id:
-            # Solo admin puede filtrar por otros usuarios
-            if user_tipo in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]:
-                query += " AND r.usuario_id = %s"
-                params.append(usuario_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/export", dependencies=[Depends(export_slot)])
+async def exportar_reservas(
+    formato: FormatoExport = Query(FormatoExport.NDJSON),
+    estado: Optional[EstadoReserva] = Query(None),
+    bahia_id: Optional[str] = Query(None),
+    usuario_id: Optional[str] = Query(None),
+    fecha_inicio: Optional[datetime] = Query(None),
+    fecha_fin: Optional[datetime] = Query(None),
+    current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
+    conn = Depends(get_db)
+):
+    try:
+        query, params = _consulta_reservas(current_user, user_tipo, estado, bahia_id, usuario_id, fecha_inicio, fecha_fin)
+        query += f" ORDER BY {KEYSET_RESERVAS.order_by()}"
         
-        if fecha_inicio:
-            query += " AND r.fecha_hora_inicio >= %s"
-            params.append(fecha_inicio)
+        return await export_response(conn, query, tuple(params), formato, "reservas")
         
-        if fecha_fin:
-            query += " AND r.fecha_hora_fin <= %s"
-            params.append(fecha_fin)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/cambios", response_model=CambiosReservasResponse)
+async def obtener_cambios_reservas(
+    desde: int = Query(0, description="Watermark de la respuesta anterior (0 = descarga completa)"),
+    limit: int = Query(500, ge=1, le=5000),
+    current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
+    conn = Depends(get_db)
+):
+    """
+    Reservas visibles para el usuario creadas o modificadas (canceladas,
+    completadas...) después del watermark; las borradas llegan en `eliminados`.
+    """
+    try:
+        cursor = db.get_cursor(conn)
         
-        query += " ORDER BY r.fecha_hora_inicio DESC OFFSET %s ROWS FETCH NEXT %s ROWS ONLY"
-        params.extend([skip, limit])
+        query, params = _consulta_reservas(current_user, user_tipo)
+        es_admin = user_tipo in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI]
         
-        cursor.execute(query, tuple(params))
-
-        reservas = cursor.fetchall()
+        resultado = await fetch_changes(
+            cursor, query, params, "r.version", "reservas", desde, limit, ReservaResponse,
+            eliminado_por_id=None if es_admin else current_user
+        )
         cursor.close()
         
-        return [ReservaResponse(**reserva) for reserva in reservas]
+        return trusted_response(resultado)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
@@ -94,12 +280,13 @@ async def obtener_reservas(
 async def obtener_reserva(
     reserva_id: str,
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
         cursor = db.get_cursor(conn) 
         
-        cursor.execute("""
+        await cursor.execute("""
             SELECT r.id, r.bahia_id, r.usuario_id, r.fecha_hora_inicio, 
                    r.fecha_hora_fin, r.estado, r.vehiculo_placa, 
                    r.conductor_nombre, r.conductor_telefono, r.conductor_documento,
@@ -115,22 +302,17 @@ async def obtener_reserva(
             WHERE r.id = %s
         """, (reserva_id,))
         
-        reserva = cursor.fetchone()
+        reserva = await fetch_one(cursor, ReservaResponse)
         cursor.close()
         
         if not reserva:
             raise HTTPException(status_code=404, detail="Reserva no encontrada")
         
         # Verificar permisos (solo puede ver sus propias reservas a menos que sea admin)
-        cursor = db.get_cursor(conn) 
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        cursor.close()
-        
         if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI] and reserva["usuario_id"] != current_user:
             raise HTTPException(status_code=403, detail="No tiene permisos para ver esta reserva")
         
-        return ReservaResponse(**reserva)
+        return trusted_response(reserva)
         
     except HTTPException:
         raise
@@ -146,31 +328,11 @@ async def crear_reserva(
     try:
         cursor = db.get_cursor(conn) 
         
-         # Normalizar fechas
+        # Normalizar fechas
         if reserva.fecha_hora_inicio.tzinfo is not None:
             reserva.fecha_hora_inicio = reserva.fecha_hora_inicio.astimezone(timezone.utc).replace(tzinfo=None)
         if reserva.fecha_hora_fin.tzinfo is not None:
             reserva.fecha_hora_fin = reserva.fecha_hora_fin.astimezone(timezone.utc).replace(tzinfo=None)
-
-        
-
-        # Verificar que la bahía existe y está activa
-        cursor.execute("""
-            SELECT id, estado_bahia_id, activo 
-            FROM bahias 
-            WHERE id = %s AND activo = 1
-        """, (reserva.bahia_id,))
-        
-        bahia = cursor.fetchone()
-        if not bahia:
-            raise HTTPException(status_code=404, detail="Bahía no encontrada o inactiva")
-        
-        # Verificar que la bahía no esté en mantenimiento
-        cursor.execute("SELECT codigo FROM estados_bahia WHERE id = %s", (bahia["estado_bahia_id"],))
-        estado_bahia = cursor.fetchone()["codigo"]
-        
-        if estado_bahia == "mantenimiento":
-            raise HTTPException(status_code=400, detail="No se puede reservar una bahía en mantenimiento")
         
         # Validar fechas
         if reserva.fecha_hora_fin <= reserva.fecha_hora_inicio:
@@ -179,74 +341,49 @@ async def crear_reserva(
         if reserva.fecha_hora_inicio < datetime.now():
             raise HTTPException(status_code=400, detail="No se pueden crear reservas en el pasado")
         
-        # Validar disponibilidad usando el stored procedure
-        cursor.execute("""
-            DECLARE @disponible BIT;
-            DECLARE @mensaje VARCHAR(255);
-            EXEC sp_validar_disponibilidad_bahia 
-                @bahia_id = %s, 
-                @fecha_inicio = %s, 
-                @fecha_fin = %s,
-                @disponible = @disponible OUTPUT,
-                @mensaje = @mensaje OUTPUT;
-            SELECT @disponible as disponible, @mensaje as mensaje;
-        """, (reserva.bahia_id, reserva.fecha_hora_inicio, reserva.fecha_hora_fin))
-        
-        resultado = cursor.fetchone()
-        if not resultado["disponible"]:
-            raise HTTPException(status_code=400, detail=resultado["mensaje"])
-        
-        # Crear reserva
+        # Solapamiento con una escritura reciente de este worker: se rechaza sin ir a la base de datos
+        conflictos = availability_index.conflicts(
+            reserva.bahia_id, reserva.fecha_hora_inicio, reserva.fecha_hora_fin
+        )
+        if any(c[3] == MANTENIMIENTO for c in conflictos):
+            raise HTTPException(status_code=400, detail=ERRORES_CREAR_RESERVA["conflicto_mantenimiento"][1])
+        if conflictos:
+            raise HTTPException(status_code=400, detail=ERRORES_CREAR_RESERVA["conflicto"][1])
+        
+        # Validar, insertar, marcar la bahía como reservada y devolver la fila en un solo lote
         reserva_id = str(uuid.uuid4())
         
-        cursor.execute("""
-            INSERT INTO reservas (
-                id, bahia_id, usuario_id, fecha_hora_inicio, fecha_hora_fin,
-                estado, vehiculo_placa, conductor_nombre, conductor_telefono,
-                conductor_documento, mercancia_tipo, mercancia_peso,
-                mercancia_descripcion, observaciones, fecha_creacion
-            ) VALUES (%s, %s, %s, %s, %s, 'activa', %s, %s, %s, %s, %s, %s, %s, %s, GETDATE())
-        """, (reserva_id, reserva.bahia_id, current_user, reserva.fecha_hora_inicio,
-              reserva.fecha_hora_fin, reserva.vehiculo_placa, reserva.conductor_nombre,
-              reserva.conductor_telefono, reserva.conductor_documento, reserva.mercancia_tipo,
-              reserva.mercancia_peso, reserva.mercancia_descripcion, reserva.observaciones))
-        
-        # Actualizar estado de la bahía a "reservada"
-        cursor.execute("""
-            UPDATE bahias 
-            SET estado_bahia_id = (SELECT id FROM estados_bahia WHERE codigo = 'reservada'),
-                fecha_ultima_modificacion = GETDATE()
-            WHERE id = %s
-        """, (reserva.bahia_id,))
+        origenes, reservada = await transition_ids("reservar")
+        await cursor.execute(CREAR_RESERVA_SQL, (
+            reserva_id, reserva.bahia_id, current_user, reserva.fecha_hora_inicio,
+            reserva.fecha_hora_fin, await estados_bahia.id("mantenimiento"),
+            reservada, *origenes, reserva.vehiculo_placa,
+            reserva.conductor_nombre, reserva.conductor_telefono, reserva.conductor_documento,
+            reserva.mercancia_tipo, reserva.mercancia_peso, reserva.mercancia_descripcion,
+            reserva.observaciones
+        ), name="crear_reserva")
+        
+        reserva_creada = await cursor.fetchone()
+        cursor.close()
         
-        conn.commit()
+        if reserva_creada["resultado"] != "ok":
+            status_code, detail = ERRORES_CREAR_RESERVA[reserva_creada["resultado"]]
+            raise HTTPException(status_code=status_code, detail=detail)
         
-        # Obtener reserva creada
-        cursor.execute("""
-            SELECT r.id, r.bahia_id, r.usuario_id, r.fecha_hora_inicio, 
-                   r.fecha_hora_fin, r.estado, r.vehiculo_placa, 
-                   r.conductor_nombre, r.conductor_telefono, r.conductor_documento,
-                   r.mercancia_tipo, r.mercancia_peso, r.mercancia_descripcion,
-                   r.observaciones, r.fecha_creacion, r.fecha_cancelacion,
-                   r.fecha_completacion, r.cancelado_por, r.motivo_cancelacion,
-                   b.numero as numero_bahia,
-                   u.nombre as usuario_nombre,
-                   u.email as usuario_email
-            FROM reservas r
-            INNER JOIN bahias b ON r.bahia_id = b.id
-            INNER JOIN usuarios u ON r.usuario_id = u.id
-            WHERE r.id = %s
-        """, (reserva_id,))
+        availability_index.add(
+            reserva.bahia_id, reserva_id, reserva.fecha_hora_inicio, reserva.fecha_hora_fin, RESERVA
+        )
+        list_cache.invalidate(RESERVAS_ACTIVAS)
+        # El lote ya hizo commit; solo se publica si la bahía cambió de estado
+        await bay_feed.apply(reserva.bahia_id, reserva_creada["numero_bahia"], reserva_creada["estado_bahia_id"])
         
-        reserva_creada = cursor.fetchone()
-        cursor.close()
-        
-        return ReservaResponse(**reserva_creada)
+        with timed("mapeo", "ReservaResponse"):
+            return ReservaResponse(**reserva_creada)
         
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.put("/{reserva_id}/cancelar")
@@ -254,26 +391,24 @@ async def cancelar_reserva(
     reserva_id: str,
     motivo: str = Query(..., description="Motivo de la cancelación"),
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
         cursor = db.get_cursor(conn) 
         
         # Obtener reserva
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, bahia_id, usuario_id, estado, fecha_hora_inicio
             FROM reservas 
             WHERE id = %s
         """, (reserva_id,))
         
-        reserva = cursor.fetchone()
+        reserva = await cursor.fetchone()
         if not reserva:
             raise HTTPException(status_code=404, detail="Reserva no encontrada")
         
         # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
         if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI] and reserva["usuario_id"] != current_user:
             raise HTTPException(status_code=403, detail="No tiene permisos para cancelar esta reserva")
         
@@ -286,58 +421,61 @@ async def cancelar_reserva(
             raise HTTPException(status_code=400, detail="No se puede cancelar una reserva que ya ha comenzado")
         
         # Cancelar reserva
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE reservas 
             SET estado = 'cancelada', 
                 fecha_cancelacion = GETDATE(),
                 cancelado_por = %s,
                 motivo_cancelacion = %s
-            WHERE id = %s
+            WHERE id = %s AND estado = 'activa'
         """, (current_user, motivo, reserva_id))
         
+        # Otra petición la completó o canceló entre la lectura y el UPDATE
+        if cursor.rowcount == 0:
+            await conn.rollback()
+            raise HTTPException(status_code=409, detail="La reserva ya no está activa")
+        
+        await registrar_uso_diario(cursor, reserva_id, CANCELADA)
+        
         # Liberar bahía
-        cursor.execute("""
-            UPDATE bahias 
-            SET estado_bahia_id = (SELECT id FROM estados_bahia WHERE codigo = 'libre'),
-                fecha_ultima_modificacion = GETDATE()
-            WHERE id = %s
-        """, (reserva["bahia_id"],))
+        cambio = await transition(cursor, reserva["bahia_id"], "liberar", estricta=False)
         
-        conn.commit()
+        await conn.commit()
+        availability_index.remove(reserva_id)
+        list_cache.invalidate(RESERVAS_ACTIVAS)
         cursor.close()
+        await publish_transition(reserva["bahia_id"], cambio)
         
         return {"message": "Reserva cancelada correctamente"}
         
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.put("/{reserva_id}/completar")
 async def completar_reserva(
     reserva_id: str,
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
         cursor = db.get_cursor(conn) 
         
         # Obtener reserva
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, bahia_id, usuario_id, estado
             FROM reservas 
             WHERE id = %s
         """, (reserva_id,))
         
-        reserva = cursor.fetchone()
+        reserva = await cursor.fetchone()
         if not reserva:
             raise HTTPException(status_code=404, detail="Reserva no encontrada")
         
         # Verificar permisos (solo admin, supervisor o el propio usuario)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
         if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.SUPERVISOR, TipoUsuario.ADMINISTRADOR_TI] and reserva["usuario_id"] != current_user:
             raise HTTPException(status_code=403, detail="No tiene permisos para completar esta reserva")
         
@@ -346,30 +484,34 @@ async def completar_reserva(
             raise HTTPException(status_code=400, detail="Solo se pueden completar reservas activas")
         
         # Completar reserva
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE reservas 
             SET estado = 'completada', 
                 fecha_completacion = GETDATE()
-            WHERE id = %s
+            WHERE id = %s AND estado = 'activa'
         """, (reserva_id,))
         
+        if cursor.rowcount == 0:
+            await conn.rollback()
+            raise HTTPException(status_code=409, detail="La reserva ya no está activa")
+        
+        await registrar_uso_diario(cursor, reserva_id, COMPLETADA)
+        
         # Liberar bahía
-        cursor.execute("""
-            UPDATE bahias 
-            SET estado_bahia_id = (SELECT id FROM estados_bahia WHERE codigo = 'libre'),
-                fecha_ultima_modificacion = GETDATE()
-            WHERE id = %s
-        """, (reserva["bahia_id"],))
+        cambio = await transition(cursor, reserva["bahia_id"], "liberar", estricta=False)
         
-        conn.commit()
+        await conn.commit()
+        availability_index.remove(reserva_id)
+        list_cache.invalidate(RESERVAS_ACTIVAS)
         cursor.close()
+        await publish_transition(reserva["bahia_id"], cambio)
         
         return {"message": "Reserva completada correctamente"}
         
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.get("/disponibilidad/verificar")
@@ -384,7 +526,7 @@ async def verificar_disponibilidad(
     try:
         cursor = db.get_cursor(conn)
 
-        cursor.execute("""
+        await cursor.execute("""
             SELECT 
                 b.id,
                 b.numero,
@@ -396,7 +538,7 @@ async def verificar_disponibilidad(
             WHERE b.id = %s
         """, (bahia_id,))
 
-        bahia = cursor.fetchone()
+        bahia = await cursor.fetchone()
         cursor.close()
 
         if not bahia:
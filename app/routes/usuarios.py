@@ -1,18 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from app.database import get_db
 from app.models.pydantic_models import (
     UsuarioResponse, UsuarioCreate, TipoUsuario
 )
-from app.core.security import get_current_user, get_password_hash
+from app.core.security import (
+    get_current_user, get_current_user_type, require_roles,
+    get_password_hash_async, invalidate_user_role
+)
+from app.core.pagination import Keyset
+from app.core.rows import fetch_all, fetch_one, trusted_response
 import pymssql
 import uuid
+from typing import Optional
 
 router = APIRouter(prefix="/usuarios", tags=["usuarios"])
 
-@router.get("/", response_model=list[UsuarioResponse])
+KEYSET_USUARIOS = Keyset(("fecha_registro", "fecha_registro", True), ("id", "id", False))
+
+@router.get("/", response_model=list[UsuarioResponse], dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para ver usuarios"
+))])
 async def obtener_usuarios(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None, description="Cursor de la página anterior (cabecera X-Next-Cursor)"),
     activo: bool = Query(None),
     tipo_usuario: TipoUsuario = Query(None),
     current_user: str = Depends(get_current_user),
@@ -20,14 +33,6 @@ async def obtener_usuarios(
 ):
     try:
         cursor = conn.cursor(as_dict=True)
-
-        
-        # Verificar permisos (solo admin y admin_ti pueden ver todos los usuarios)
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para ver usuarios")
         
         # Construir query base
         query = """
@@ -46,14 +51,13 @@ async def obtener_usuarios(
             query += " AND tipo_usuario = %s"
             params.append(tipo_usuario.value)
         
-        query += " ORDER BY fecha_registro DESC OFFSET %s ROWS FETCH NEXT %s ROWS ONLY"
-        params.extend([skip, limit])
+        query, params = KEYSET_USUARIOS.paginate(query, params, after, skip, limit)
         
-        cursor.execute(query, tuple(params))
-        usuarios = cursor.fetchall()
+        await cursor.execute(query, params)
+        usuarios = KEYSET_USUARIOS.page(await fetch_all(cursor, UsuarioResponse), limit, response)
         cursor.close()
         
-        return [UsuarioResponse(**usuario) for usuario in usuarios]
+        return trusted_response(usuarios, response)
         
     except HTTPException:
         raise
@@ -64,6 +68,7 @@ async def obtener_usuarios(
 async def obtener_usuario(
     usuario_id: str,
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
@@ -71,26 +76,23 @@ async def obtener_usuario(
 
         
         # Verificar permisos o si es el propio usuario
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
         if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI] and current_user != usuario_id:
             raise HTTPException(status_code=403, detail="No tiene permisos para ver este usuario")
         
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, email, nombre, tipo_usuario, activo, 
                    fecha_registro, fecha_ultima_modificacion
             FROM usuarios 
             WHERE id = %s
         """, (usuario_id,))
         
-        usuario = cursor.fetchone()
+        usuario = await fetch_one(cursor, UsuarioResponse)
         cursor.close()
         
         if not usuario:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
-        return UsuarioResponse(**usuario)
+        return trusted_response(usuario)
         
     except HTTPException:
         raise
@@ -102,6 +104,7 @@ async def actualizar_usuario(
     usuario_id: str,
     usuario_update: UsuarioCreate,
     current_user: str = Depends(get_current_user),
+    user_tipo: str = Depends(get_current_user_type),
     conn = Depends(get_db)
 ):
     try:
@@ -109,26 +112,23 @@ async def actualizar_usuario(
 
         
         # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
         if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI] and current_user != usuario_id:
             raise HTTPException(status_code=403, detail="No tiene permisos para actualizar este usuario")
         
         # Verificar que el usuario existe
-        cursor.execute("SELECT id FROM usuarios WHERE id = %s", (usuario_id,))
-        if not cursor.fetchone():
+        await cursor.execute("SELECT id FROM usuarios WHERE id = %s", (usuario_id,))
+        if not await cursor.fetchone():
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         # Verificar email único
-        cursor.execute("SELECT id FROM usuarios WHERE email = %s AND id != %s", (usuario_update.email, usuario_id))
-        if cursor.fetchone():
+        await cursor.execute("SELECT id FROM usuarios WHERE email = %s AND id != %s", (usuario_update.email, usuario_id))
+        if await cursor.fetchone():
             raise HTTPException(status_code=400, detail="El email ya está en uso")
         
         # Actualizar usuario
-        hashed_password = get_password_hash(usuario_update.password)
+        hashed_password = await get_password_hash_async(usuario_update.password)
         
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE usuarios 
             SET email = %s, nombre = %s, hash_contrasena = %s, 
                 tipo_usuario = %s, fecha_ultima_modificacion = GETDATE()
@@ -136,17 +136,18 @@ async def actualizar_usuario(
         """, (usuario_update.email, usuario_update.nombre, hashed_password, 
               usuario_update.tipo_usuario, usuario_id))
         
-        conn.commit()
+        await conn.commit()
+        invalidate_user_role(usuario_id)
         
         # Obtener usuario actualizado
-        cursor.execute("""
+        await cursor.execute("""
             SELECT id, email, nombre, tipo_usuario, activo, 
                    fecha_registro, fecha_ultima_modificacion
             FROM usuarios 
             WHERE id = %s
         """, (usuario_id,))
         
-        usuario = cursor.fetchone()
+        usuario = await cursor.fetchone()
         cursor.close()
         
         return UsuarioResponse(**usuario)
@@ -154,10 +155,13 @@ async def actualizar_usuario(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.delete("/{usuario_id}")
+@router.delete("/{usuario_id}", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para desactivar usuarios"
+))])
 async def desactivar_usuario(
     usuario_id: str,
     current_user: str = Depends(get_current_user),
@@ -165,32 +169,25 @@ async def desactivar_usuario(
 ):
     try:
         cursor = conn.cursor(as_dict=True)
-
-        
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para desactivar usuarios")
         
         # No permitir desactivarse a sí mismo
         if current_user == usuario_id:
             raise HTTPException(status_code=400, detail="No puede desactivar su propio usuario")
         
         # Verificar que el usuario existe
-        cursor.execute("SELECT id FROM usuarios WHERE id = %s", (usuario_id,))
-        if not cursor.fetchone():
+        await cursor.execute("SELECT id FROM usuarios WHERE id = %s", (usuario_id,))
+        if not await cursor.fetchone():
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         # Desactivar usuario
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE usuarios 
             SET activo = 0, fecha_ultima_modificacion = GETDATE()
             WHERE id = %s
         """, (usuario_id,))
         
-        conn.commit()
+        await conn.commit()
+        invalidate_user_role(usuario_id)
         cursor.close()
         
         return {"message": "Usuario desactivado correctamente"}
@@ -198,10 +195,13 @@ async def desactivar_usuario(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
-@router.post("/{usuario_id}/activar")
+@router.post("/{usuario_id}/activar", dependencies=[Depends(require_roles(
+    TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI,
+    detail="No tiene permisos para activar usuarios"
+))])
 async def activar_usuario(
     usuario_id: str,
     current_user: str = Depends(get_current_user),
@@ -209,28 +209,21 @@ async def activar_usuario(
 ):
     try:
         cursor = conn.cursor(as_dict=True)
-
-        
-        # Verificar permisos
-        cursor.execute("SELECT tipo_usuario FROM usuarios WHERE id = %s", (current_user,))
-        user_tipo = cursor.fetchone()["tipo_usuario"]
-        
-        if user_tipo not in [TipoUsuario.ADMINISTRADOR, TipoUsuario.ADMINISTRADOR_TI]:
-            raise HTTPException(status_code=403, detail="No tiene permisos para activar usuarios")
         
         # Verificar que el usuario existe
-        cursor.execute("SELECT id FROM usuarios WHERE id = %s", (usuario_id,))
-        if not cursor.fetchone():
+        await cursor.execute("SELECT id FROM usuarios WHERE id = %s", (usuario_id,))
+        if not await cursor.fetchone():
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         # Activar usuario
-        cursor.execute("""
+        await cursor.execute("""
             UPDATE usuarios 
             SET activo = 1, fecha_ultima_modificacion = GETDATE()
             WHERE id = %s
         """, (usuario_id,))
         
-        conn.commit()
+        await conn.commit()
+        invalidate_user_role(usuario_id)
         cursor.close()
         
         return {"message": "Usuario activado correctamente"}
@@ -238,5 +231,5 @@ async def activar_usuario(
     except HTTPException:
         raise
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Carga sobre la API completa con el backend sqlite, sin SQL Server.
+
+Arranca la aplicación en este proceso con DB_BACKEND=sqlite y la latencia
+inyectada por viaje a la base de datos, inicia sesión con el administrador
+sembrado y lanza N clientes concurrentes durante D segundos con una mezcla
+fija de operaciones (semilla fija por cliente). Imprime throughput y
+p50/p95/p99 por operación y los viajes a la base de datos por petición
+(cabecera X-DB-Round-Trips), para comparar cambios con números
+reproducibles en un portátil.
+
+    python -m benchmarks.bench_api_sqlite [clientes] [segundos] [latencia_ms]
+"""
+import asyncio
+import os
+import random
+import secrets
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+# operación -> peso en la mezcla
+MEZCLA = {
+    "listar_bahias": 35,
+    "detalle_bahia": 15,
+    "listar_reservas": 20,
+    "crear_reserva": 15,
+    "reservas_activas": 15,
+}
+
+INICIO = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+async def _cliente(client, numero, bahias, hasta, resultados):
+    rng = random.Random(1000 + numero)
+    operaciones, pesos = list(MEZCLA), list(MEZCLA.values())
+    creadas = 0
+    while time.perf_counter() < hasta:
+        operacion = rng.choices(operaciones, pesos)[0]
+        if operacion == "listar_bahias":
+            peticion = client.get("/api/bahias/", params={"limit": 50})
+        elif operacion == "detalle_bahia":
+            peticion = client.get(f"/api/bahias/{rng.choice(bahias)}")
+        elif operacion == "listar_reservas":
+            peticion = client.get("/api/reservas/", params={"limit": 50})
+        elif operacion == "crear_reserva":
+            # Hueco propio de cada cliente para que no choquen entre sí
+            inicio = INICIO + timedelta(hours=3 * (numero * 100_000 + creadas))
+            creadas += 1
+            peticion = client.post("/api/reservas/", json={
+                "bahia_id": rng.choice(bahias),
+                "fecha_hora_inicio": inicio.isoformat(),
+                "fecha_hora_fin": (inicio + timedelta(hours=2)).isoformat(),
+                "vehiculo_placa": f"BEN{numero:03d}",
+            })
+        else:
+            peticion = client.get("/api/reportes/reservas/activas")
+        start = time.perf_counter()
+        r = await peticion
+        duracion = time.perf_counter() - start
+        viajes = int(r.headers.get("x-db-round-trips", 0))
+        resultados.setdefault(operacion, []).append((duracion, r.status_code, viajes))
+
+async def _carga(clientes, segundos):
+    from app.main import app
+
+    for handler in app.router.on_startup:
+        await handler()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            from app.core.config import settings
+            r = await client.post("/api/auth/login", json={
+                "email": settings.SQLITE_ADMIN_EMAIL, "password": settings.SQLITE_ADMIN_PASSWORD
+            })
+            assert r.status_code == 200, r.text
+            client.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+            r = await client.get("/api/bahias/", params={"limit": 1000})
+            bahias = [bahia["id"] for bahia in r.json()]
+
+            resultados = {}
+            start = time.perf_counter()
+            hasta = start + segundos
+            await asyncio.gather(*(
+                _cliente(client, numero, bahias, hasta, resultados) for numero in range(clientes)
+            ))
+            return resultados, time.perf_counter() - start
+    finally:
+        for handler in app.router.on_shutdown:
+            resultado = handler()
+            if asyncio.iscoroutine(resultado):
+                await resultado
+
+def main():
+    clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    segundos = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    latencia_ms = sys.argv[3] if len(sys.argv) > 3 else "2"
+
+    # Antes de importar la aplicación: la configuración se lee al importar
+    os.environ.setdefault("DB_BACKEND", "sqlite")
+    os.environ.setdefault("DB_FAKE_LATENCY_MS", latencia_ms)
+    os.environ.setdefault("SQLITE_ADMIN_PASSWORD", secrets.token_urlsafe(12))
+    os.environ.setdefault("DASHBOARD_REFRESH_INTERVAL", "0")
+    os.environ.setdefault("BAY_STREAM_RECONCILE_INTERVAL", "0")
+
+    resultados, total = asyncio.run(_carga(clientes, segundos))
+
+    peticiones = sum(len(medidas) for medidas in resultados.values())
+    print(f"{clientes} clientes, {total:.1f} s, {os.environ['DB_FAKE_LATENCY_MS']} ms por viaje: "
+          f"{peticiones} peticiones ({peticiones / total:.0f}/s)")
+    for operacion in MEZCLA:
+        medidas = resultados.get(operacion, [])
+        if not medidas:
+            continue
+        latencias = [duracion for duracion, _, _ in medidas]
+        errores = sum(1 for _, status, _ in medidas if status >= 400)
+        viajes = sum(viajes for _, _, viajes in medidas) / len(medidas)
+        print(f"  {operacion:<17} n={len(medidas):6d}  errores={errores:4d}  viajes={viajes:4.1f}  "
+              f"p50={_percentil(latencias, 50) * 1000:7.1f} ms  "
+              f"p95={_percentil(latencias, 95) * 1000:7.1f} ms  "
+              f"p99={_percentil(latencias, 99) * 1000:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Viajes a la base de datos y latencia de POST /api/reservas/.
+
+Crea N reservas secuenciales contra un driver falso que tarda LATENCY
+segundos por sentencia y cuenta las sentencias enviadas por reserva. Para
+comparar, reproduce sobre el mismo driver la secuencia anterior (SELECT de la
+bahía, SELECT del estado, INSERT, UPDATE, COMMIT y SELECT de la fila creada).
+En ambos casos se cuenta también el rollback que hace el pool al devolver la
+conexión.
+
+Además comprueba la cabecera X-DB-Round-Trips de cada respuesta contra
+PRESUPUESTO_VIAJES, para que una regresión haga fallar el benchmark en CI.
+
+    python -m benchmarks.bench_crear_reserva [reservas] [latencia_s]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from app.core.availability import availability_index
+from app.core.catalogs import catalog_cache
+from app.core.security import get_current_user
+from app.database import ConnectionPool, db
+from app.main import app
+from benchmarks.fakes import ESTADOS_BAHIA, TIPOS_BAHIA, SlowConnection
+
+RESERVA_COLUMNS = [
+    "resultado", "id", "bahia_id", "usuario_id", "fecha_hora_inicio",
+    "fecha_hora_fin", "estado", "vehiculo_placa", "conductor_nombre",
+    "conductor_telefono", "conductor_documento", "mercancia_tipo",
+    "mercancia_peso", "mercancia_descripcion", "observaciones",
+    "fecha_creacion", "fecha_cancelacion", "fecha_completacion",
+    "cancelado_por", "motivo_cancelacion", "numero_bahia", "estado_bahia_id",
+    "usuario_nombre", "usuario_email",
+]
+
+INICIO = datetime.now().replace(microsecond=0) + timedelta(days=1)
+FIN = INICIO + timedelta(hours=2)
+
+RESERVA_ROW = (
+    "ok", "r-00001", "b-00001", "u-bench", INICIO, FIN, "activa", "ABC123",
+    None, None, None, None, None, None, None, INICIO, None, None, None, None,
+    1, 2, "Bench", "bench@example.com",
+)
+
+# Secuencia de crear_reserva antes del lote único
+SECUENCIA_ANTERIOR = [
+    "SELECT id, estado_bahia_id, activo FROM bahias WHERE id = %s AND activo = 1",
+    "SELECT codigo FROM estados_bahia WHERE id = %s",
+    "INSERT INTO reservas (...) SELECT ... WHERE NOT EXISTS (...)",
+    "UPDATE bahias SET estado_bahia_id = (...) WHERE id = %s",
+    "COMMIT",
+    "SELECT r.* ... FROM reservas r INNER JOIN bahias b ... WHERE r.id = %s",
+    "ROLLBACK",  # al devolver la conexión al pool
+]
+
+# Viajes que puede hacer POST /api/reservas/ según X-DB-Round-Trips (sin el rollback del pool)
+PRESUPUESTO_VIAJES = 1
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+def _resumen(nombre, latencias, viajes):
+    print(f"  {nombre:<9} viajes/reserva={viajes:4.1f}  "
+          f"p50={_percentil(latencias, 50) * 1000:7.1f} ms  "
+          f"p99={_percentil(latencias, 99) * 1000:7.1f} ms")
+
+def _anterior(reservas, latency):
+    conn = SlowConnection(latency)
+    latencias = []
+    for _ in range(reservas):
+        start = time.perf_counter()
+        cursor = conn.cursor(as_dict=True)
+        for sentencia in SECUENCIA_ANTERIOR:
+            if sentencia == "COMMIT":
+                conn.commit()
+            elif sentencia == "ROLLBACK":
+                conn.rollback()
+            else:
+                cursor.execute(sentencia)
+        latencias.append(time.perf_counter() - start)
+    return latencias, conn.statements / reservas
+
+async def _actual(reservas):
+    transport = httpx.ASGITransport(app=app)
+    latencias = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(reservas):
+            # Cada reserva en un hueco distinto para que el índice no la rechace
+            inicio = INICIO + timedelta(hours=3 * i)
+            payload = {
+                "bahia_id": "b-00001",
+                "fecha_hora_inicio": inicio.isoformat(),
+                "fecha_hora_fin": (inicio + timedelta(hours=2)).isoformat(),
+                "vehiculo_placa": "ABC123",
+            }
+            start = time.perf_counter()
+            r = await client.post("/api/reservas/", json=payload)
+            latencias.append(time.perf_counter() - start)
+            assert r.status_code == 200, r.text
+            viajes = int(r.headers["x-db-round-trips"])
+            assert viajes <= PRESUPUESTO_VIAJES, f"{viajes} viajes (presupuesto {PRESUPUESTO_VIAJES})"
+    return latencias
+
+def main():
+    reservas = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+
+    conn = SlowConnection(latency, {
+        "DECLARE @resultado": (RESERVA_COLUMNS, [RESERVA_ROW]),
+        "FROM estados_bahia": ESTADOS_BAHIA,
+        "FROM tipos_bahia": TIPOS_BAHIA,
+    })
+    # Una sola conexión: se devuelve siempre la misma para contar sus sentencias
+    db.pool = ConnectionPool(lambda: conn, min_size=0, max_size=1, pre_ping=False)
+    app.dependency_overrides[get_current_user] = lambda: "u-bench"
+    availability_index.clear()
+    # Catálogos cargados como en el arranque; no cuentan en las reservas
+    catalog_cache.load_all(conn)
+    conn.statements = 0
+
+    print(f"{reservas} reservas secuenciales, {latency * 1000:.0f} ms por sentencia")
+    latencias, viajes = _anterior(reservas, latency)
+    _resumen("anterior", latencias, viajes)
+
+    latencias = asyncio.run(_actual(reservas))
+    _resumen("lote", latencias, conn.statements / reservas)
+    app.dependency_overrides.clear()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Throughput de peticiones concurrentes antes/después del ejecutor de base de datos.
+
+Lanza N peticiones simultáneas a GET /api/bahias/ contra un driver falso que
+tarda LATENCY segundos por sentencia. En modo "inline" las llamadas al driver
+se ejecutan dentro del event loop (comportamiento anterior); en modo
+"executor" pasan por db_executor.
+
+    python -m benchmarks.bench_db_executor [peticiones] [latencia_s]
+
+Los benchmarks y las pruebas usan httpx y pytest, que no van en
+requirements.txt: pip install -r requirements-dev.txt
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+
+import app.database as database
+from app.database import ConnectionPool, db
+from app.main import app
+from benchmarks.fakes import BAHIA_COLUMNS, SlowConnection, bahia_rows
+
+async def _inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+async def _run(requests, latency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.get("/api/bahias/", params={"limit": 50}) for _ in range(requests)
+        ])
+        elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses), responses[0].text
+    return elapsed
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    rows = bahia_rows(50)
+    db.pool = ConnectionPool(
+        lambda: SlowConnection(latency, {"FROM bahias b": (BAHIA_COLUMNS, rows)}),
+        min_size=0,
+        max_size=database.settings.DB_POOL_MAX_SIZE,
+        pre_ping=False
+    )
+
+    original = database.run_in_db_executor
+    print(f"{requests} peticiones concurrentes, {latency * 1000:.0f} ms por sentencia, "
+          f"pool={db.pool.max_size}, ejecutor={database.db_executor._max_workers}")
+    for mode, runner in (("inline", _inline), ("executor", original)):
+        database.run_in_db_executor = runner
+        elapsed = asyncio.run(_run(requests, latency))
+        print(f"  {mode:<9} {elapsed:7.2f} s  {requests / elapsed:8.1f} req/s")
+    database.run_in_db_executor = original
+
+if __name__ == "__main__":
+    main()
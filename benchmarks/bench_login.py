@@ -0,0 +1,82 @@
+"""
+Throughput de login con N peticiones concurrentes.
+
+Compara bcrypt ejecutado dentro del event loop (comportamiento anterior)
+contra el pool de procesos de app.core.hashing. Mientras dura la tormenta de
+logins se mide también el peor retraso del event loop, que es lo que sufren
+las demás peticiones del worker.
+
+    python -m benchmarks.bench_login [logins] [workers]
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+
+import app.core.security as security
+import app.routes.auth as auth
+from app.core.hashing import PasswordHasher, hash_password
+from app.database import ConnectionPool, db
+from app.main import app
+from benchmarks.fakes import SlowConnection
+
+PASSWORD = "Clave1234"
+USER_COLUMNS = [
+    "id", "email", "nombre", "hash_contrasena", "tipo_usuario",
+    "activo", "fecha_registro", "fecha_ultima_modificacion",
+]
+
+async def _inline_verify(plain_password, hashed_password):
+    return security.verify_password(plain_password, hashed_password)
+
+async def _run(logins):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        lag = []
+        done = asyncio.Event()
+
+        async def probe():
+            # Retraso del event loop: cuánto tarda en despertar un sleep de 10 ms
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag.append(time.perf_counter() - start - 0.01)
+
+        async def login():
+            r = await client.post("/api/auth/login", json={"email": "bench@example.com", "password": PASSWORD})
+            assert r.status_code == 200, r.text
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*[login() for _ in range(logins)])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+    return elapsed, max(lag) if lag else 0.0
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else security.settings.PASSWORD_HASH_WORKERS
+
+    from datetime import datetime
+    ahora = datetime(2024, 1, 1)
+    row = ("u-1", "bench@example.com", "Bench", hash_password(PASSWORD), "operador", True, ahora, ahora)
+    db.pool = ConnectionPool(
+        lambda: SlowConnection(0.002, {"FROM usuarios": (USER_COLUMNS, [row])}),
+        min_size=0, max_size=20, pre_ping=False
+    )
+    security.password_hasher = PasswordHasher(workers=workers)
+    security.password_hasher.warmup()
+
+    print(f"{logins} logins concurrentes, {workers} procesos bcrypt")
+    for mode in ("inline", "pool"):
+        auth.verify_password_async = _inline_verify if mode == "inline" else security.verify_password_async
+        elapsed, worst = asyncio.run(_run(logins))
+        print(f"  {mode:<7} {elapsed:7.2f} s  {logins / elapsed:7.1f} logins/s  "
+              f"peor retraso del loop {worst * 1000:7.1f} ms")
+    print(f"  métricas del pool: {security.password_hasher.stats()}")
+    security.password_hasher.shutdown()
+
+if __name__ == "__main__":
+    main()
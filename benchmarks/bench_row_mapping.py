@@ -0,0 +1,60 @@
+"""
+CPU por respuesta de un listado de bahías: camino anterior vs app.core.rows.
+
+Anterior: dict(zip(...)) por fila, BahiaResponse(**fila), y después la
+validación y serialización de FastAPI por response_model más el
+jsonable_encoder de JSONResponse. Nuevo: RowMapper (accesos por índice
+calculados una vez por forma de consulta) y FastJSONResponse.
+
+No hay red ni base de datos: solo el trabajo de Python por respuesta.
+
+    python -m benchmarks.bench_row_mapping [repeticiones]
+"""
+import asyncio
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.core.responses import FastJSONResponse
+from app.core.rows import row_mapper
+from app.models.pydantic_models import BahiaResponse
+from benchmarks.fakes import BAHIA_COLUMNS, bahia_rows
+
+class _Cursor:
+    description = [(c, None, None, None, None, None, None) for c in BAHIA_COLUMNS]
+
+FIELD = create_response_field(name="Response_bench", type_=list[BahiaResponse])
+
+async def _anterior(rows):
+    columns = [col[0] for col in _Cursor.description]
+    bahias = [BahiaResponse(**dict(zip(columns, row))) for row in rows]
+    content = await serialize_response(field=FIELD, response_content=bahias)
+    return JSONResponse(jsonable_encoder(content)).body
+
+async def _nuevo(rows):
+    bahias = row_mapper(_Cursor, BahiaResponse).all(rows)
+    return FastJSONResponse(bahias).body
+
+def _measure(func, rows, repeats):
+    asyncio.run(func(rows))  # calentamiento (y caché del mapper)
+    start = time.process_time()
+    for _ in range(repeats):
+        body = asyncio.run(func(rows))
+    return (time.process_time() - start) / repeats, body
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for n in (1_000, 10_000):
+        rows = bahia_rows(n)
+        anterior, body_anterior = _measure(_anterior, rows, repeats)
+        nuevo, body_nuevo = _measure(_nuevo, rows, repeats)
+        assert len(body_nuevo) > 0 and body_anterior.count(b'"id"') == body_nuevo.count(b'"id"') == n
+        print(f"{n:>6} filas  anterior {anterior * 1000:8.1f} ms  nuevo {nuevo * 1000:8.1f} ms  "
+              f"ahorro {(anterior - nuevo) * 1000:8.1f} ms/respuesta ({anterior / nuevo:.1f}x)")
+
+if __name__ == "__main__":
+    main()
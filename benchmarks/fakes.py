@@ -0,0 +1,99 @@
+"""
+Driver falso para los benchmarks: imita la parte de pymssql que usan los
+routers y duerme un tiempo fijo en cada execute para simular la latencia
+de red hacia SQL Server.
+"""
+import time
+from datetime import datetime
+
+BAHIA_COLUMNS = [
+    "id", "numero", "tipo_bahia_id", "estado_bahia_id", "capacidad_maxima",
+    "ubicacion", "observaciones", "activo", "fecha_creacion",
+    "fecha_ultima_modificacion", "creado_por", "tipo_bahia_nombre",
+    "estado_bahia_nombre", "estado_bahia_codigo",
+]
+
+# Catálogos tal como los siembra el script de la base de datos
+ESTADOS_BAHIA = (
+    ["id", "codigo", "nombre", "descripcion", "color"],
+    [(1, "libre", "Libre", None, "#4CAF50"), (2, "reservada", "Reservada", None, "#FF9800"),
+     (3, "en_uso", "En Uso", None, "#F44336"), (4, "mantenimiento", "Mantenimiento", None, "#2196F3")],
+)
+
+TIPOS_BAHIA = (
+    ["id", "codigo", "nombre", "descripcion"],
+    [(1, "estandar", "Estándar", None), (2, "refrigerada", "Refrigerada", None)],
+)
+
+def bahia_rows(n):
+    ahora = datetime(2024, 1, 1, 8, 0)
+    return [
+        (f"b-{i:05d}", i, 1, 1, 25.0, f"Muelle {i // 10}", "", True,
+         ahora, ahora, None, "Estándar", "Libre", "libre")
+        for i in range(1, n + 1)
+    ]
+
+class SlowCursor:
+    def __init__(self, conn, as_dict=False):
+        self.conn = conn
+        self.as_dict = as_dict
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self.conn.statements += 1
+        time.sleep(self.conn.latency)
+        columns, rows = self.conn.result_for(query)
+        self.description = [(c, None, None, None, None, None, None) for c in columns] if columns else None
+        if self.as_dict and columns:
+            rows = [dict(zip(columns, row)) for row in rows]
+        self._rows = list(rows)
+        # Sin columnas es una escritura: se da por afectada una fila
+        self.rowcount = len(self._rows) if columns else 1
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        pass
+
+class SlowConnection:
+    """Conexión falsa; result_for decide qué devuelve cada consulta"""
+
+    def __init__(self, latency=0.05, results=None):
+        self.latency = latency
+        self.results = results or {}
+        self.statements = 0
+
+    def result_for(self, query):
+        for fragment, result in self.results.items():
+            if fragment in query:
+                return result
+        return [], []
+
+    def cursor(self, as_dict=False):
+        return SlowCursor(self, as_dict=as_dict)
+
+    def commit(self):
+        # COMMIT TRAN también es un viaje de ida y vuelta al servidor
+        self.statements += 1
+        time.sleep(self.latency)
+
+    def rollback(self):
+        self.statements += 1
+        time.sleep(self.latency)
+
+    def close(self):
+        pass
@@ -0,0 +1,45 @@
+"""
+Pruebas del índice de disponibilidad en memoria.
+
+    python -m pytest -q tests
+"""
+import time
+from datetime import datetime, timedelta
+
+from app.core.availability import AvailabilityIndex, MANTENIMIENTO, RESERVA
+
+INICIO = datetime(2030, 1, 1, 8, 0)
+FIN = INICIO + timedelta(hours=2)
+
+def test_solapamientos_con_escrituras_propias():
+    index = AvailabilityIndex(ttl=60)
+    index.add("b1", "r1", INICIO, FIN, RESERVA)
+    index.add("b1", "m1", FIN + timedelta(hours=1), FIN + timedelta(hours=5), MANTENIMIENTO)
+
+    assert [c[2] for c in index.conflicts("b1", INICIO + timedelta(hours=1), FIN + timedelta(hours=2))] == ["r1", "m1"]
+    assert [c[2] for c in index.conflicts("b1", INICIO, FIN + timedelta(hours=2), tipos=(RESERVA,))] == ["r1"]
+    # Intervalos semiabiertos: empezar justo al final no se solapa
+    assert index.conflicts("b1", FIN, FIN + timedelta(hours=1)) == []
+    assert index.conflicts("b2", INICIO, FIN) == []
+
+def test_remove_libera_el_hueco():
+    index = AvailabilityIndex(ttl=60)
+    index.add("b1", "r1", INICIO, FIN, RESERVA)
+    assert index.remove("r1")
+    assert index.conflicts("b1", INICIO, FIN) == []
+    assert index.stats()["intervalos"] == 0
+
+def test_los_intervalos_caducan_tras_el_ttl():
+    index = AvailabilityIndex(ttl=0.02)
+    index.add("b1", "r1", INICIO, FIN, RESERVA)
+    assert index.conflicts("b1", INICIO, FIN)
+
+    time.sleep(0.03)
+
+    assert index.conflicts("b1", INICIO, FIN) == []
+    assert index.stats()["intervalos"] == 0
+
+def test_ttl_cero_desactiva_el_indice():
+    index = AvailabilityIndex(ttl=0)
+    index.add("b1", "r1", INICIO, FIN, RESERVA)
+    assert index.conflicts("b1", INICIO, FIN) == []
@@ -0,0 +1,28 @@
+"""
+Pruebas del cupo de exportaciones simultáneas.
+
+    python -m pytest -q tests
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.core.export import ExportSlots
+
+def test_cupo_lleno_responde_503():
+    slots = ExportSlots(limit=1)
+    slots.acquire()
+    with pytest.raises(HTTPException) as exc:
+        slots.acquire()
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"]
+    assert slots.stats() == {"en_curso": 1, "limite": 1, "rechazadas": 1}
+
+    slots.release()
+    slots.acquire()
+    assert slots.stats()["en_curso"] == 1
+
+def test_limite_cero_no_limita():
+    slots = ExportSlots(limit=0)
+    for _ in range(50):
+        slots.acquire()
+    assert slots.stats()["rechazadas"] == 0
@@ -0,0 +1,129 @@
+"""
+Pruebas de ConnectionPool contra una fábrica de conexiones falsas.
+
+    python -m pytest -q tests
+"""
+import time
+
+import pytest
+
+from app.database import ConnectionPool, PoolTimeoutError
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise RuntimeError("conexión rota")
+        self.conn.executed.append(query)
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+        self.rollbacks = 0
+        self.executed = []
+
+    def cursor(self, as_dict=False):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise RuntimeError("conexión rota")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+class FakeFactory:
+    """Devuelve conexiones falsas; las primeras `failures` llamadas fallan"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.connections = []
+
+    def __call__(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("servidor no disponible")
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+def test_warmup_fallido_devuelve_el_hueco():
+    factory = FakeFactory(failures=1)
+    pool = ConnectionPool(factory, min_size=1, max_size=1, timeout=0.1)
+
+    with pytest.raises(ConnectionError):
+        pool.warmup()
+    assert pool.stats()["size"] == 0
+
+    conn = pool.acquire()
+    assert conn is factory.connections[0]
+    pool.release(conn)
+
+def test_timeout_con_el_pool_agotado():
+    pool = ConnectionPool(FakeFactory(), min_size=0, max_size=1, timeout=0.05)
+    conn = pool.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert time.monotonic() - start >= 0.05
+    assert pool.stats()["timeouts"] == 1
+
+    pool.release(conn)
+    assert pool.acquire(timeout=0.05) is conn
+
+def test_desalojo_de_conexiones_ociosas():
+    factory = FakeFactory()
+    pool = ConnectionPool(factory, min_size=1, max_size=2, max_idle=0.01, pre_ping=False)
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert pool.stats()["idle"] == 2
+
+    time.sleep(0.02)
+    conn = pool.acquire()
+
+    # Se cierra la más antigua y se respeta min_size
+    assert first.closed
+    assert conn is second
+    assert pool.stats()["size"] == 1
+
+def test_pre_ping_descarta_conexiones_rotas():
+    factory = FakeFactory()
+    pool = ConnectionPool(factory, min_size=0, max_size=1)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.broken = True
+
+    nueva = pool.acquire()
+
+    assert nueva is not conn
+    assert conn.closed
+    stats = pool.stats()
+    assert stats["ping_failures"] == 1
+    assert stats["size"] == 1
+
+def test_rollback_al_devolver():
+    pool = ConnectionPool(FakeFactory(), min_size=0, max_size=1, pre_ping=False)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert conn.rollbacks == 1
+    assert pool.stats()["idle"] == 1
+
+    # Si el rollback falla la conexión no vuelve al pool
+    conn = pool.acquire()
+    conn.broken = True
+    pool.release(conn)
+    assert conn.closed
+    assert pool.stats()["size"] == 0